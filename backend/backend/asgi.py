@@ -2,6 +2,9 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+In production it is served by gunicorn with uvicorn workers (see
+gunicorn.conf.py), so the async API views can keep many extractions in
+flight per worker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
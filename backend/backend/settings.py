@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -61,6 +62,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add whitenoise for static files
+    'downloader.compression.JSONGZipMiddleware',  # Gzip JSON API responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Add this line
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +72,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'downloader.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# JSON responses at least this large are gzipped when the client accepts it.
+# Smaller bodies gain too little to be worth the CPU.
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '512'))
+
 CORS_ALLOW_ALL_ORIGINS = True  # Allow requests from frontend
 CORS_ALLOW_CREDENTIALS = True
 
@@ -98,6 +111,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+ASGI_APPLICATION = "backend.asgi.application"
 
 
 # Database
@@ -107,6 +121,11 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Seconds to wait on a locked database (SQLite busy timeout).
+            # WAL mode is switched on per connection in downloader/apps.py.
+            "timeout": 20,
+        },
     }
 }
 
@@ -142,6 +161,181 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Extraction cache
+# In-process cache of yt-dlp info dicts shared by the extract-info and download views
+
+EXTRACTION_CACHE_TTL = int(os.environ.get('EXTRACTION_CACHE_TTL', '1800'))  # seconds, 0 disables
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', '256'))
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+# Extraction executor
+# Bounded thread pool that runs yt-dlp for the async API views. Requests beyond
+# workers + queue are rejected with 503 and a Retry-After header.
+
+EXTRACTION_MAX_WORKERS = int(os.environ.get('EXTRACTION_MAX_WORKERS', '8'))
+EXTRACTION_MAX_QUEUE = int(os.environ.get('EXTRACTION_MAX_QUEUE', '16'))
+EXTRACTION_RETRY_AFTER = int(os.environ.get('EXTRACTION_RETRY_AFTER', '5'))  # seconds
+
+# Longest Cache-Control max-age of GET extract-info responses, shortened to the
+# expiry of the signed URLs they contain
+EXTRACT_INFO_MAX_AGE = int(os.environ.get('EXTRACT_INFO_MAX_AGE', '3600'))  # seconds
+
+# Batch extract-info: URLs per request and how many of them resolve at once
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', '50'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+
+# Playlist expansion: entries listed per playlist and how many may be resolved inline
+PLAYLIST_MAX_ENTRIES = int(os.environ.get('PLAYLIST_MAX_ENTRIES', '1000'))
+PLAYLIST_MAX_RESOLVE = int(os.environ.get('PLAYLIST_MAX_RESOLVE', '50'))
+
+# Idle YoutubeDL instances kept per option profile and cookie set
+YDL_POOL_MAX_IDLE = int(os.environ.get('YDL_POOL_MAX_IDLE', str(EXTRACTION_MAX_WORKERS)))
+
+
+# Download proxy
+# Upstream media is streamed in PROXY_CHUNK_SIZE pieces over a pooled keep-alive session
+
+PROXY_CHUNK_SIZE = int(os.environ.get('PROXY_CHUNK_SIZE', str(256 * 1024)))
+PROXY_POOL_SIZE = int(os.environ.get('PROXY_POOL_SIZE', '16'))
+PROXY_TIMEOUT = int(os.environ.get('PROXY_TIMEOUT', '30'))  # seconds
+
+
+# Merge jobs
+# Processes that download DASH video + audio and mux them with ffmpeg (stream copy)
+
+MERGE_MAX_WORKERS = int(os.environ.get('MERGE_MAX_WORKERS', '2'))
+MERGE_JOB_TIMEOUT = int(os.environ.get('MERGE_JOB_TIMEOUT', '3600'))  # seconds before an unfinished job counts as lost
+
+# Server-side downloads fetch SEGMENTED_CONNECTIONS byte ranges of
+# SEGMENTED_SEGMENT_SIZE at a time; a failed range is retried on its own
+SEGMENTED_CONNECTIONS = int(os.environ.get('SEGMENTED_CONNECTIONS', '4'))
+SEGMENTED_SEGMENT_SIZE = int(os.environ.get('SEGMENTED_SEGMENT_SIZE', str(8 * 1024 ** 2)))
+SEGMENTED_RETRIES = int(os.environ.get('SEGMENTED_RETRIES', '3'))
+
+
+# Audio downloads
+# Audio not available in the requested container is converted by ffmpeg,
+# streamed from its stdout; at most AUDIO_MAX_TRANSCODES processes per worker
+
+AUDIO_MAX_TRANSCODES = int(os.environ.get('AUDIO_MAX_TRANSCODES', '4'))
+AUDIO_TRANSCODE_BITRATE = os.environ.get('AUDIO_TRANSCODE_BITRATE', '160k')
+
+
+# Media cache
+# Files fetched through the proxy or produced by merge jobs, stored under
+# MEDIA_ROOT/downloads by content hash and evicted least recently used first
+
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+MEDIA_CACHE_MAX_FILE_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_FILE_BYTES', str(512 * 1024 ** 2)))
+# When set (e.g. '/protected-media/'), cached files are sent by nginx via X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+
+
+# Thumbnails
+# Served from MEDIA_ROOT/thumbnails and revalidated upstream (conditional GET)
+# once they are older than THUMBNAIL_REVALIDATE_AFTER
+
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', str(256 * 1024 ** 2)))
+THUMBNAIL_MAX_FILE_BYTES = int(os.environ.get('THUMBNAIL_MAX_FILE_BYTES', str(2 * 1024 ** 2)))
+THUMBNAIL_REVALIDATE_AFTER = int(os.environ.get('THUMBNAIL_REVALIDATE_AFTER', '86400'))  # seconds
+THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', '86400'))  # Cache-Control for clients
+
+
+# Metadata store
+# Trimmed info dicts persisted in the database, read when the in-process cache misses
+
+METADATA_STORE_ENABLED = os.environ.get('METADATA_STORE_ENABLED', 'True').lower() == 'true'
+METADATA_TTL = int(os.environ.get('METADATA_TTL', str(6 * 3600)))  # seconds, capped by URL expiry
+METADATA_STORE_BATCH_SIZE = int(os.environ.get('METADATA_STORE_BATCH_SIZE', '50'))
+METADATA_STORE_FLUSH_INTERVAL = float(os.environ.get('METADATA_STORE_FLUSH_INTERVAL', '0.5'))  # seconds
+METADATA_STORE_PURGE_EVERY = int(os.environ.get('METADATA_STORE_PURGE_EVERY', '1000'))  # written rows between purges of expired ones
+
+
+# Refresh scheduler
+# Re-resolves the most requested videos shortly before their cached info or
+# signed URLs expire, so their downloads never wait for an extraction
+
+REFRESH_ENABLED = os.environ.get('REFRESH_ENABLED', 'True').lower() == 'true'
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', '30'))  # seconds between cycles
+REFRESH_LEAD = int(os.environ.get('REFRESH_LEAD', '900'))  # refresh this many seconds before expiry
+REFRESH_HOT_SIZE = int(os.environ.get('REFRESH_HOT_SIZE', '50'))  # videos kept fresh per worker
+REFRESH_MIN_HITS = float(os.environ.get('REFRESH_MIN_HITS', '3'))
+REFRESH_HALF_LIFE = int(os.environ.get('REFRESH_HALF_LIFE', '1800'))  # seconds for popularity to halve
+REFRESH_MAX_PER_CYCLE = int(os.environ.get('REFRESH_MAX_PER_CYCLE', '5'))  # extractions per cycle
+REFRESH_MAX_BACKOFF = int(os.environ.get('REFRESH_MAX_BACKOFF', '64'))  # cycles to skip a video whose refreshes keep failing
+
+
+# Upstream rate limits
+# Token buckets for the extractions sent to each platform ('N/s', 'N/m' or 'N/h'),
+# shared by all workers through the RATE_LIMIT_CACHE cache. Throttling errors
+# pause a bucket for RATE_LIMIT_BACKOFF seconds, doubling up to RATE_LIMIT_MAX_BACKOFF.
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMITS = {
+    'youtube': os.environ.get('RATE_LIMIT_YOUTUBE', '5/s'),
+    'instagram': os.environ.get('RATE_LIMIT_INSTAGRAM', '1/s'),
+}
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '2'))  # seconds of traffic a full bucket holds
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '1'))  # longer waits are rejected with 429
+RATE_LIMIT_BACKOFF = int(os.environ.get('RATE_LIMIT_BACKOFF', '30'))  # seconds
+RATE_LIMIT_MAX_BACKOFF = int(os.environ.get('RATE_LIMIT_MAX_BACKOFF', '600'))  # seconds
+# One bucket per YouTube cookie set instead of one per platform
+RATE_LIMIT_PER_IDENTITY = os.environ.get('RATE_LIMIT_PER_IDENTITY', 'False').lower() == 'true'
+RATE_LIMIT_CACHE = 'ratelimit'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by the gunicorn workers on this host, or by every host through Redis
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('RATE_LIMIT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'vieurl-ratelimit')),
+    },
+}
+
+
+# Extraction strategies
+# YouTube extractions use the healthiest of these (see downloader/strategies.py
+# for the available names), falling back to the next on failure. A strategy
+# that keeps failing is tripped open for STRATEGY_OPEN_SECONDS, doubling up to
+# STRATEGY_MAX_OPEN_SECONDS, and then probed with one request.
+
+EXTRACTION_STRATEGIES_ENABLED = os.environ.get('EXTRACTION_STRATEGIES_ENABLED', 'True').lower() == 'true'
+EXTRACTION_STRATEGIES = [
+    name.strip() for name in os.environ.get('EXTRACTION_STRATEGIES', 'default,tv,no_cookies').split(',') if name.strip()
+]
+STRATEGY_MAX_ATTEMPTS = int(os.environ.get('STRATEGY_MAX_ATTEMPTS', '2'))  # strategies tried per request
+STRATEGY_WINDOW = int(os.environ.get('STRATEGY_WINDOW', '20'))  # recent extractions kept per strategy
+STRATEGY_FAILURE_THRESHOLD = int(os.environ.get('STRATEGY_FAILURE_THRESHOLD', '3'))  # failures in a row
+STRATEGY_FAILURE_RATE = float(os.environ.get('STRATEGY_FAILURE_RATE', '0.5'))  # over a full window
+STRATEGY_OPEN_SECONDS = int(os.environ.get('STRATEGY_OPEN_SECONDS', '60'))
+STRATEGY_MAX_OPEN_SECONDS = int(os.environ.get('STRATEGY_MAX_OPEN_SECONDS', '900'))
+
+
+# Profiling
+# Requests with an X-Profile header (matching PROFILING_TOKEN, if set) are sampled
+# and their folded stacks written to PROFILING_DIR. Off unless PROFILING_ENABLED.
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_INTERVAL = float(os.environ.get('PROFILING_INTERVAL', '0.005'))  # seconds between samples
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+
+# YouTube cookies
+# Cookie sets come from YOUTUBE_COOKIES_B64, YOUTUBE_COOKIES_B64_1..N and *.txt files
+# in YOUTUBE_COOKIES_DIR. They are decoded once per worker and rotated per request.
+
+YOUTUBE_COOKIES_DIR = os.environ.get('YOUTUBE_COOKIES_DIR')
+YOUTUBE_COOKIE_STRATEGY = os.environ.get('YOUTUBE_COOKIE_STRATEGY', 'round_robin')  # or 'lru'
+YOUTUBE_COOKIE_COOLDOWN = int(os.environ.get('YOUTUBE_COOKIE_COOLDOWN', '300'))  # seconds
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
@@ -2,7 +2,20 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from downloader.cache import extraction_cache
+from downloader.cookies import get_cookie_pool
+from downloader.executor import extraction_executor
+from downloader.metrics import render_metrics
+from downloader.singleflight import extraction_flights
+from downloader.proxy import transfer_stats
+from downloader.ratelimit import upstream_limiter
+from downloader.refresh import refresh_scheduler
+from downloader.store import metadata_store
+from downloader.strategies import youtube_strategies
+from downloader.thumbnails import thumbnail_cache
+from downloader.transcode import transcode_slots
+from downloader.ydl_pool import ydl_pool
 
 def health_check(request):
     """Simple health check endpoint"""
@@ -11,12 +24,51 @@ def health_check(request):
         'message': 'VieUrl Backend API is running!',
         'endpoints': {
             'extract_info': '/api/extract-info/',
+            'extract_info_batch': '/api/extract-info/batch/',
             'download': '/api/download/',
-        }
+            'playlist': '/api/playlist/',
+            'proxy': '/api/proxy/',
+            'audio': '/api/audio/',
+            'thumbnail': '/api/thumbnail/',
+            'merge_jobs': '/api/jobs/',
+            'metrics': '/metrics',
+        },
+        'extraction_cache': extraction_cache.stats(),
+        # Only counts here: names and per-set health are in /metrics
+        'cookie_sets': get_cookie_pool().counts(),
+        'extraction_executor': extraction_executor.stats(),
+        'extraction_flights': extraction_flights.stats(),
+        'proxy_transfers': transfer_stats.stats(),
+        'metadata_store': metadata_store.stats(),
+        'ydl_pool': ydl_pool.stats(),
+        'upstream_limiter': upstream_limiter.stats(),
+        'refresh_scheduler': refresh_scheduler.stats(),
+        'thumbnail_cache': thumbnail_cache.stats(),
+        'audio_transcodes': transcode_slots.stats(),
+        'extraction_strategies': youtube_strategies.stats(),
     })
 
+def metrics(request):
+    """Prometheus metrics of the worker process that answers the scrape"""
+    body = render_metrics([
+        ('extraction_cache', extraction_cache.stats()),
+        ('extraction_executor', extraction_executor.stats()),
+        ('extraction_flights', extraction_flights.stats()),
+        ('proxy_transfers', transfer_stats.stats()),
+        ('metadata_store', metadata_store.stats()),
+        ('ydl_pool', ydl_pool.stats()),
+        ('upstream_limiter', upstream_limiter.stats()),
+        ('refresh_scheduler', refresh_scheduler.stats()),
+        ('thumbnail_cache', thumbnail_cache.stats()),
+        ('audio_transcodes', transcode_slots.stats()),
+        ('extraction_strategies', youtube_strategies.gauges()),
+        ('cookie_sets', get_cookie_pool().gauges()),
+    ])
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('', health_check, name='health_check'),  # Root URL health check
+    path('metrics', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('api/', include('downloader.urls')),
 ]
@@ -0,0 +1,109 @@
+"""
+Benchmark: extraction goodput against a throttling upstream.
+
+    cd backend && python benchmarks/bench_ratelimit.py [--seconds 5] [--clients 16]
+
+The simulated upstream accepts --upstream-rate requests per second. Past
+that it answers 429 and keeps answering 429 for --penalty seconds after
+the last request it refused, the way YouTube does. Clients call it in a
+loop, first unlimited (every failure is retried straight away), then
+through UpstreamLimiter configured above the upstream's real rate, so
+it has to find that rate by backing off. Reports successful calls per
+second, 429s and requests the limiter shed before they went upstream.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+class ThrottlingUpstream:
+    def __init__(self, rate, penalty, latency=0.02):
+        self.rate = rate
+        self.penalty = penalty
+        self.latency = latency
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def extract(self):
+        time.sleep(self.latency)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now < self.blocked_until or self.tokens < 1:
+                self.blocked_until = now + self.penalty
+                raise Exception('HTTP Error 429: Too Many Requests')
+            self.tokens -= 1
+
+
+def run(upstream, seconds, clients, limiter=None):
+    from downloader.ratelimit import RateLimited
+
+    counts = {'ok': 0, 'throttled': 0, 'shed': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            outcome = 'ok'
+            try:
+                if limiter is not None:
+                    limiter.acquire('youtube')
+                upstream.extract()
+                if limiter is not None:
+                    limiter.report_success('youtube')
+            except RateLimited as e:
+                outcome = 'shed'
+                # A client told to come back later does so, within the run
+                time.sleep(min(e.retry_after, max(0.0, deadline - time.monotonic())))
+            except Exception as e:
+                outcome = 'throttled'
+                if limiter is not None:
+                    limiter.report_failure('youtube', e)
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--upstream-rate', type=float, default=20)
+    parser.add_argument('--penalty', type=float, default=1.0)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.core.cache import caches
+    from downloader.ratelimit import UpstreamLimiter
+
+    caches['default'].clear()
+    limiter = UpstreamLimiter(
+        {'youtube': f'{args.upstream_rate * 1.5}/s'},
+        burst=1, max_wait=0.5, backoff=args.penalty, max_backoff=args.penalty * 8, cache_alias='default',
+    )
+    for label, current in [('unlimited', None), ('rate limited', limiter)]:
+        counts = run(ThrottlingUpstream(args.upstream_rate, args.penalty), args.seconds, args.clients, current)
+        print(
+            f"{label:<14}{counts['ok'] / args.seconds:8.1f} ok/s"
+            f"{counts['throttled']:8d} x 429{counts['shed']:8d} shed"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark: cost of routing a URL compared with the work yt-dlp does
+for the same URL before it even touches the network.
+
+    cd backend && python benchmarks/bench_routing.py [--number N]
+
+Routing should come out in the low microseconds. yt-dlp's extractor
+lookup alone is orders of magnitude slower, and a real extraction adds
+hundreds of milliseconds of network round trips on top.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.routing import UnsupportedURL, route_url  # noqa: E402
+
+
+URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?si=AbCdEfGh12345678',
+    'm.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42s',
+    'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+    'https://www.youtube.com/playlist?list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf',
+    'https://www.instagram.com/reel/C1a2b3c4d5E/?igsh=MWQ1ZGUxMzBkMA==',
+    'https://example.com/not-a-video',
+    'not a url at all',
+]
+
+
+def route_all():
+    for url in URLS:
+        try:
+            route_url(url)
+        except UnsupportedURL:
+            pass
+
+
+def per_url(func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    return seconds / (number * len(URLS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='iterations over the URL set per repeat')
+    args = parser.parse_args()
+
+    routing = per_url(route_all, args.number)
+    print(f"{'route_url':<24}{routing * 1e6:10.2f} us/url")
+
+    started = time.perf_counter()
+    import yt_dlp  # noqa: E402
+    print(f"{'import yt_dlp':<24}{(time.perf_counter() - started) * 1e3:10.2f} ms (once per worker)")
+
+    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+        def match_extractors():
+            # What extract_info does first for every URL: find a suitable extractor
+            for url in URLS:
+                for ie in ydl._ies.values():
+                    if ie.suitable(url):
+                        break
+
+        ydl.get_info_extractor('Youtube')  # load the extractor list outside the timing
+        matching = per_url(match_extractors, max(1, args.number // 1000))
+    print(f"{'yt-dlp extractor match':<24}{matching * 1e6:10.2f} us/url")
+    print(f"routing is {matching / routing:,.0f}x cheaper than extractor matching alone")
+
+
+if __name__ == '__main__':
+    main()
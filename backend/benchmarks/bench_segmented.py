@@ -0,0 +1,83 @@
+"""
+Benchmark: server-side download of one file from a host that throttles
+each connection.
+
+    cd backend && python benchmarks/bench_segmented.py [--size-mb 16] [--per-connection-mbps 4]
+
+A local stand-in host serves --size-mb of data with Range support and
+sends each response at most --per-connection-mbps MB/s, like googlevideo
+does. The file is fetched as one sequential stream and then with
+SegmentedDownloader at several connection counts. Reports the time and
+throughput for each.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def make_handler(payload, bytes_per_second):
+    class ThrottledHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or end), end)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            chunk = 64 * 1024
+            for offset in range(start, end + 1, chunk):
+                self.wfile.write(payload[offset:min(offset + chunk, end + 1)])
+                time.sleep(chunk / bytes_per_second)
+
+        def log_message(self, *args):
+            pass
+
+    return ThrottledHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--per-connection-mbps', type=float, default=4)
+    parser.add_argument('--segment-mb', type=float, default=1)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from downloader.segmented import SegmentedDownloader
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(payload, args.per_connection_mbps * 1024 * 1024))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/media'
+
+    runs = [('sequential', 1, len(payload))] + [
+        (f'{n} connections', n, int(args.segment_mb * 1024 * 1024)) for n in (2, 4, 8)
+    ]
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'media')
+        for label, connections, segment_size in runs:
+            downloader = SegmentedDownloader(connections=connections, segment_size=segment_size)
+            report = downloader.download(url, path)
+            with open(path, 'rb') as f:
+                assert f.read() == payload
+            print(f"{label:<16}{report['seconds']:8.2f} s{report['speed'] / (1024 * 1024):8.1f} MB/s")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
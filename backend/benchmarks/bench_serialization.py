@@ -0,0 +1,66 @@
+"""
+Benchmark: rendering an extract-info response, and its size on the wire.
+
+    cd backend && python benchmarks/bench_serialization.py [--fixture youtube_video]
+
+Builds the extract-info body for a recorded fixture the way the view
+does, then times each available JSON renderer on it and reports the
+body size raw and gzipped (as GZipMiddleware would send it).
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixture', default='youtube_video')
+    parser.add_argument('--runs', type=int, default=2000)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from rest_framework.renderers import JSONRenderer
+    from downloader.cache import trim_info
+    from downloader.views import video_summary, youtube_quality_options
+
+    with open(os.path.join(BENCHMARKS_DIR, 'fixtures', f'{args.fixture}.json')) as f:
+        info = trim_info(json.load(f))
+    data = dict(video_summary(info), formats=youtube_quality_options(info))
+
+    renderers = {'drf JSONRenderer': JSONRenderer()}
+    try:
+        from downloader.renderers import FastJSONRenderer
+        renderers['FastJSONRenderer'] = FastJSONRenderer()
+    except ImportError:
+        pass
+
+    print(f"{len(data['formats'])} formats")
+    for name, renderer in renderers.items():
+        body = renderer.render(data)
+        seconds = measure(lambda: renderer.render(data), args.runs)
+        print(
+            f"{name:<20}{seconds * 1e6:9.1f} us{len(body):8d} B"
+            f"{len(gzip.compress(body, compresslevel=6, mtime=0)):8d} B gzip"
+        )
+
+
+if __name__ == '__main__':
+    main()
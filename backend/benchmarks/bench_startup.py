@@ -0,0 +1,83 @@
+"""
+Benchmark: worker import time and per-request yt-dlp setup cost.
+
+    cd backend && python benchmarks/bench_startup.py [--runs N]
+
+``import`` is measured in fresh interpreters: Django setup plus importing
+downloader.views. ``setup`` compares building a YoutubeDL per request,
+as the views used to, with checking one out of the pool.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+IMPORT_SNIPPET = '''
+import time
+import django
+django.setup()
+started = time.perf_counter()
+import downloader.views
+print(time.perf_counter() - started)
+'''
+
+
+def measure_import(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'import downloader.views':<28}{measure_import(args.runs) * 1e3:10.1f} ms")
+
+    import django
+    django.setup()
+    import yt_dlp
+    from downloader.views import youtube_ydl_opts
+    from downloader.ydl_pool import YoutubeDLPool
+
+    def fresh_instance():
+        with yt_dlp.YoutubeDL(youtube_ydl_opts()) as ydl:
+            ydl.get_info_extractor('Youtube')
+
+    pool = YoutubeDLPool()
+
+    def pooled_instance():
+        with pool.checkout(youtube_ydl_opts()) as ydl:
+            ydl.get_info_extractor('Youtube')
+
+    first = measure(fresh_instance, 1)
+    print(f"{'first YoutubeDL':<28}{first * 1e3:10.1f} ms (extractor imports, once per worker)")
+    runs = max(args.runs, 20)
+    print(f"{'YoutubeDL per request':<28}{measure(fresh_instance, runs) * 1e3:10.2f} ms")
+    pooled_instance()
+    print(f"{'pooled YoutubeDL':<28}{measure(pooled_instance, runs) * 1e3:10.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
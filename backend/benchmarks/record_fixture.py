@@ -0,0 +1,58 @@
+"""
+Record a yt-dlp info dict as a benchmark fixture.
+
+    cd backend && python benchmarks/record_fixture.py URL NAME [--flat]
+
+Runs a real extraction with the same options the views use (``--flat``
+for playlists, as /api/playlist/ does) and writes it, JSON-sanitized, to
+benchmarks/fixtures/NAME.json. Add the URL's route key to FIXTURE_ROUTES
+in suite.py to use it. Recorded URLs are signed for the recording
+machine's IP and expire within hours; the suite only ever reads them.
+"""
+import argparse
+import json
+import os
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('name')
+    parser.add_argument('--flat', action='store_true', help='record a flat playlist expansion')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    import yt_dlp
+    from downloader.playlists import flat_playlist_opts
+    from downloader.routing import route_url
+    from downloader.views import instagram_ydl_opts, youtube_ydl_opts
+
+    route = route_url(args.url)
+    if args.flat:
+        ydl_opts = flat_playlist_opts()
+    elif route.platform == 'instagram':
+        ydl_opts = instagram_ydl_opts()
+    else:
+        ydl_opts = youtube_ydl_opts()
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(route.url, download=False, process=not args.flat)
+        if args.flat and info.get('entries') is not None:
+            info['entries'] = list(info['entries'])
+        info = ydl.sanitize_info(info)
+
+    path = os.path.join(BENCHMARKS_DIR, 'fixtures', f'{args.name}.json')
+    with open(path, 'w') as f:
+        json.dump(info, f, indent=1)
+        f.write('\n')
+    print(f"Recorded {route.key} to {path}")
+
+
+if __name__ == '__main__':
+    main()
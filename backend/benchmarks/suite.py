@@ -0,0 +1,299 @@
+"""
+Offline benchmark suite for the extraction and format-processing pipeline.
+
+    cd backend && python benchmarks/suite.py [--output results.json]
+                                             [--baseline benchmarks/baseline.json]
+                                             [--threshold 0.25] [--only PATTERN]
+                                             [--repeat 3]
+
+yt-dlp is replaced by ReplayYoutubeDL, which answers every extraction
+from the recorded info dicts in benchmarks/fixtures/ (see
+record_fixture.py), so runs need no network and are repeatable. The
+requests go through the Django test client and the real URL routing,
+caches, executor and views.
+
+Each benchmark reports median and p95 latency, throughput and the peak
+memory allocated per call (tracemalloc); the timings are taken from the
+fastest of --repeat passes, which filters out passes slowed down by other
+load on the machine. Results are written as JSON. With --baseline, they
+are compared with a stored run and the exit status is 1 if any time or
+allocation metric regressed by more than --threshold (and by more than
+MIN_DELTA). Database access goes to a temporary test database.
+"""
+import argparse
+import asyncio
+import contextlib
+import fnmatch
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+import django
+import yt_dlp
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, 'fixtures')
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Replayed extractions never reach an upstream, and would soon run out of tokens.
+os.environ['RATE_LIMIT_ENABLED'] = 'False'
+# No background refreshes competing with the measured requests
+os.environ['REFRESH_ENABLED'] = 'False'
+
+EXPIRE_RE = re.compile(r'(expire[=/])\d{10}')
+OE_RE = re.compile(r'([?&]oe=)[0-9A-Fa-f]{8}')
+
+# Route key of each URL the benchmarks request -> recorded fixture
+FIXTURE_ROUTES = {
+    ('youtube', 'dQw4w9WgXcQ'): 'youtube_video',
+    ('youtube', 'PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'): 'youtube_playlist',
+    ('instagram', 'C1a2b3c4d5E'): 'instagram_post',
+    ('instagram', 'C9z8y7x6w5V'): 'instagram_carousel',
+}
+
+# Metrics that count as regressions when they grow. p95 is reported but
+# too noisy on shared CI machines to fail a build on.
+COMPARED_METRICS = ('median_ms', 'alloc_peak_kib')
+# Differences below this are run-to-run noise, whatever the relative change
+MIN_DELTA = {'median_ms': 1.0, 'alloc_peak_kib': 16}
+
+
+def load_fixture_text(name):
+    with open(os.path.join(FIXTURES_DIR, f'{name}.json')) as f:
+        return f.read()
+
+
+def refresh_expiry(text, ttl=6 * 3600):
+    """
+    Move the expiry of the recorded signed URLs into the future. Otherwise
+    every fixture looks expired and nothing would ever be cached.
+    """
+    expires_at = int(time.time()) + ttl
+    text = EXPIRE_RE.sub(lambda m: f'{m.group(1)}{expires_at}', text)
+    return OE_RE.sub(lambda m: f'{m.group(1)}{expires_at:X}', text)
+
+
+class ReplayYoutubeDL:
+    """
+    Stands in for yt_dlp.YoutubeDL. extract_info parses a fresh copy of
+    the fixture recorded for the URL, so callers can mutate the result
+    like a real extraction.
+    """
+
+    fixtures = {}
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    @classmethod
+    def load(cls):
+        cls.fixtures = {name: refresh_expiry(load_fixture_text(name)) for name in set(FIXTURE_ROUTES.values())}
+
+    def extract_info(self, url, download=False, process=True, **kwargs):
+        from downloader.routing import route_url
+        name = FIXTURE_ROUTES.get(route_url(url).key)
+        if name is None:
+            raise yt_dlp.utils.DownloadError(f'No fixture recorded for {url}')
+        return json.loads(self.fixtures[name])
+
+    def get_info_extractor(self, ie_key):
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def time_pass(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings
+
+
+def measure(func, iterations, warmup=2, repeat=3):
+    for _ in range(warmup):
+        func()
+    timings = min((time_pass(func, iterations) for _ in range(repeat)), key=statistics.median)
+
+    # Allocations are traced in a separate pass, tracemalloc slows calls down
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, 5)):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'iterations': iterations,
+        'median_ms': round(median * 1e3, 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e3, 4),
+        'ops_per_sec': round(1 / median, 1) if median else None,
+        'alloc_peak_kib': round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def build_benchmarks():
+    """Return ``{name: (func, default_iterations)}``"""
+    from django.test import AsyncClient, Client
+
+    from downloader.cache import extraction_cache, trim_info
+    from downloader.formats import FormatIndex, select_format
+    from downloader.views import youtube_quality_options
+
+    client = Client()
+    async_client = AsyncClient()
+    youtube = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    instagram = 'https://www.instagram.com/p/C1a2b3c4d5E/'
+    carousel = 'https://www.instagram.com/p/C9z8y7x6w5V/'
+    playlist = 'https://www.youtube.com/playlist?list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+
+    def post(path, data, cold):
+        def call():
+            if cold:
+                extraction_cache.invalidate()
+            response = client.post(path, data, content_type='application/json')
+            assert response.status_code == 200, (path, data, response.status_code, response.content[:200])
+        return call
+
+    def expand_playlist():
+        async def call():
+            response = await async_client.post('/api/playlist/', {'url': playlist}, content_type='application/json')
+            assert response.status_code == 200
+            lines = [chunk async for chunk in response.streaming_content]
+            assert b'"end"' in lines[-1], lines[-1]
+        asyncio.run(call())
+
+    info = trim_info(json.loads(load_fixture_text('youtube_video')))
+    formats = info['formats']
+    qualities = ['2160p', '1080p', '720p', '480p', '360p', 'best']
+
+    return {
+        'extract_info.youtube.cold': (post('/api/extract-info/', {'url': youtube}, cold=True), 50),
+        'extract_info.youtube.warm': (post('/api/extract-info/', {'url': youtube}, cold=False), 200),
+        'extract_info.youtube.lite': (post('/api/extract-info/', {'url': youtube, 'mode': 'lite'}, cold=True), 50),
+        'extract_info.instagram.cold': (post('/api/extract-info/', {'url': instagram}, cold=True), 100),
+        'extract_info.instagram_carousel.cold': (post('/api/extract-info/', {'url': carousel}, cold=True), 100),
+        'download.youtube.cold': (post('/api/download/', {'url': youtube, 'quality': '720p'}, cold=True), 50),
+        'download.youtube.warm': (post('/api/download/', {'url': youtube, 'quality': '720p'}, cold=False), 200),
+        'download.instagram.cold': (post('/api/download/', {'url': instagram}, cold=True), 100),
+        'download.instagram_carousel.cold': (post('/api/download/', {'url': carousel, 'item': 9}, cold=True), 100),
+        'playlist.youtube': (expand_playlist, 20),
+        'formats.quality_options': (lambda: youtube_quality_options(info), 2000),
+        'formats.select_format': (lambda: [select_format(formats, q) for q in qualities], 500),
+        'formats.index_build': (lambda: FormatIndex(formats), 2000),
+        'pipeline.trim_info': (lambda: trim_info(json.loads(ReplayYoutubeDL.fixtures['youtube_video'])), 100),
+        # What the stub itself costs per extraction, included in the *.cold numbers
+        'stub.fixture_load': (lambda: json.loads(ReplayYoutubeDL.fixtures['youtube_video']), 100),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return ``(name, metric, old, new)`` for every metric that regressed"""
+    regressions = []
+    for name, result in results.items():
+        old_result = baseline.get(name)
+        if not old_result:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = old_result.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + threshold) and new - old >= MIN_DELTA[metric]:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def run(args):
+    from django.test.utils import (
+        override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+    )
+
+    django.setup()
+    setup_test_environment()
+    # Like the test runner: never the configured database (SQLite's is in memory)
+    old_config = setup_databases(verbosity=0, interactive=False)
+    ReplayYoutubeDL.load()
+    yt_dlp.YoutubeDL = ReplayYoutubeDL
+
+    try:
+        # The metadata store would otherwise answer cold requests
+        with override_settings(METADATA_STORE_ENABLED=False, DEBUG=False):
+            results = {}
+            for name, (func, iterations) in build_benchmarks().items():
+                if args.only and not fnmatch.fnmatch(name, args.only):
+                    continue
+                iterations = max(1, int(iterations * args.scale))
+                results[name] = measure(func, iterations, repeat=args.repeat)
+                print(f"{name:<40}{results[name]['median_ms']:>10.3f} ms  {results[name]['alloc_peak_kib']:>9.1f} KiB", file=sys.stderr)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write results JSON here instead of stdout')
+    parser.add_argument('--baseline', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression (default 0.25)')
+    parser.add_argument('--only', help='glob of benchmark names to run, e.g. "formats.*"')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every iteration count')
+    parser.add_argument('--repeat', type=int, default=3, help='timing passes per benchmark, the fastest is kept (default 3)')
+    args = parser.parse_args()
+
+    # Keep stdout for the JSON: the app logs with print
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'yt_dlp': yt_dlp.version.__version__,
+            'machine': platform.machine(),
+            'timestamp': int(time.time()),
+        },
+        'results': results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        report['regressions'] = [
+            {'benchmark': name, 'metric': metric, 'baseline': old, 'current': new}
+            for name, metric, old, new in regressions
+        ]
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old} -> {new}", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
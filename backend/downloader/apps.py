@@ -1,6 +1,22 @@
 from django.apps import AppConfig
 
 
+def configure_sqlite(sender, connection, **kwargs):
+    """Let readers run alongside the metadata writer and merge job processes"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL;')
+            cursor.execute('PRAGMA synchronous=NORMAL;')
+
+
 class DownloaderConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "downloader"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        connection_created.connect(configure_sqlite)
+
+        # Decode the YouTube cookie sets once at worker start, not per request
+        from .cookies import get_cookie_pool
+        get_cookie_pool()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .routing import UnsupportedURL, route_url
+
+
+def canonical_video_id(platform, url):
+    """
+    Return a stable ID for the video behind a URL, so that different
+    links to the same video share one cache entry. Falls back to the
+    stripped URL when the router cannot place it.
+    """
+    try:
+        return route_url(url).video_id
+    except UnsupportedURL:
+        return url.strip()
+
+
+# Fields the views read from an info dict and from each of its formats.
+# Everything else (fragments, subtitles, chapters, ...) is dropped before caching.
+INFO_FIELDS = (
+    'id', 'title', 'fulltitle', 'thumbnail', 'duration', 'uploader', 'url', 'ext',
+    'height', 'width', 'filesize', 'filesize_approx', 'format_id', 'http_headers',
+)
+FORMAT_FIELDS = (
+    'format_id', 'format_note', 'quality', 'url', 'ext', 'protocol', 'vcodec', 'acodec',
+    'height', 'width', 'fps', 'tbr', 'abr', 'asr', 'filesize', 'filesize_approx', 'http_headers',
+)
+
+
+def trim_info(info):
+    """Reduce a yt-dlp info dict to the fields this app uses"""
+    trimmed = {key: info[key] for key in INFO_FIELDS if info.get(key) is not None}
+    if info.get('formats'):
+        trimmed['formats'] = [
+            {key: fmt[key] for key in FORMAT_FIELDS if fmt.get(key) is not None}
+            for fmt in info['formats']
+        ]
+    if info.get('entries'):
+        trimmed['entries'] = [trim_info(entry) for entry in info['entries'] if entry]
+    return trimmed
+
+
+def info_fingerprint(info):
+    """Hash of an (extracted, trimmed) info dict, as stored by add_fingerprint"""
+    fingerprint = info.get('_fingerprint')
+    if fingerprint is None:
+        encoded = json.dumps(info, sort_keys=True, default=str).encode()
+        fingerprint = hashlib.blake2b(encoded, digest_size=16).hexdigest()
+    return fingerprint
+
+
+def add_fingerprint(info):
+    """
+    Keep the fingerprint in ``info`` so repeat requests for a cached video
+    don't serialize it again. Only for dicts that are not shared yet: once
+    a dict is in a cache, other threads read and serialize it unlocked.
+    """
+    if info and '_fingerprint' not in info:
+        info['_fingerprint'] = info_fingerprint(info)
+    return info
+
+
+def estimate_size(info):
+    """Rough size of an info dict in bytes, based on its JSON encoding"""
+    try:
+        return len(json.dumps(info, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ExtractionCache:
+    """
+    Thread-safe TTL + LRU cache for yt-dlp info dicts.
+
+    Entries are keyed by (platform, video_id) and expire after ``ttl``
+    seconds. The least recently used entries are evicted once either
+    ``max_entries`` or ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=1800):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, platform, url):
+        return (platform, canonical_video_id(platform, url))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, info = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return info
+
+    def peek(self, key):
+        """
+        Return ``(info, seconds_left)`` for a live entry, or ``(None, 0)``,
+        without counting a hit or miss or changing its LRU position
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, 0
+        expires_at, _, info = entry
+        seconds_left = expires_at - time.monotonic()
+        return (info, seconds_left) if seconds_left > 0 else (None, 0)
+
+    def set(self, key, info, ttl=None):
+        size = estimate_size(info)
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, info)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop one entry, or the whole cache when no key is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+extraction_cache = ExtractionCache(
+    max_entries=getattr(settings, 'EXTRACTION_CACHE_MAX_ENTRIES', 256),
+    max_bytes=getattr(settings, 'EXTRACTION_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+    ttl=getattr(settings, 'EXTRACTION_CACHE_TTL', 1800),
+)
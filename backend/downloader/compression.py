@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+GZIP_ETAG_SUFFIX = '-gz'
+
+
+def gzip_etag(etag):
+    """Strong ETag of the gzipped representation of a strong ETag"""
+    return etag[:-1] + GZIP_ETAG_SUFFIX + '"'
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """
+    Gzip JSON API responses of at least GZIP_MIN_BYTES. Media, files and
+    streamed responses (proxy downloads, NDJSON streams) are left alone:
+    media doesn't compress and gzip would hold back the streamed lines.
+
+    Django's GZipMiddleware weakens ETags to ``W/"..."``. A gzipped response
+    gets a strong ETag of its own instead (``"<etag>-gz"``), and the suffix
+    is taken off ``If-None-Match`` before the view compares it, so
+    revalidating the gzipped copy still answers 304.
+    """
+
+    def process_request(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and GZIP_ETAG_SUFFIX + '"' in if_none_match:
+            request.META['HTTP_IF_NONE_MATCH'] = if_none_match.replace(GZIP_ETAG_SUFFIX + '"', '"')
+            request.gzip_etag = True
+
+    def process_response(self, request, response):
+        etag = response.get('ETag', '')
+        if response.status_code == 304:
+            if getattr(request, 'gzip_etag', False) and etag.startswith('"'):
+                response['ETag'] = gzip_etag(etag)
+            return response
+        if response.streaming or not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        if len(response.content) < getattr(settings, 'GZIP_MIN_BYTES', 1024):
+            return response
+        response = super().process_response(request, response)
+        if etag.startswith('"') and response.get('Content-Encoding') == 'gzip':
+            response['ETag'] = gzip_etag(etag)
+        return response
@@ -0,0 +1,204 @@
+import base64
+import io
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .strategies import is_content_error
+
+
+COOKIE_ENV_VAR = 'YOUTUBE_COOKIES_B64'
+
+# Error messages that point at the identity being flagged or its cookies
+# being rejected. Broader wording ("sign in to confirm", "cookies") also
+# shows up in errors about the video: age gates, and private or
+# members-only videos, for which yt-dlp suggests passing --cookies.
+IDENTITY_ERROR_MARKERS = (
+    'not a bot',
+    'cookies are no longer valid',
+    'cookies have expired',
+    'cookies are invalid',
+)
+
+
+def is_identity_error(error):
+    if is_content_error(error):
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in IDENTITY_ERROR_MARKERS)
+
+
+def load_cookie_sets():
+    """
+    Collect Netscape cookie files as (name, text) pairs from:
+
+    - YOUTUBE_COOKIES_B64
+    - YOUTUBE_COOKIES_B64_1, YOUTUBE_COOKIES_B64_2, ... (until the first gap)
+    - every *.txt file in YOUTUBE_COOKIES_DIR
+    """
+    encoded = []
+    if os.environ.get(COOKIE_ENV_VAR):
+        encoded.append((COOKIE_ENV_VAR, os.environ[COOKIE_ENV_VAR]))
+    index = 1
+    while os.environ.get(f'{COOKIE_ENV_VAR}_{index}'):
+        name = f'{COOKIE_ENV_VAR}_{index}'
+        encoded.append((name, os.environ[name]))
+        index += 1
+
+    cookie_sets = []
+    for name, value in encoded:
+        try:
+            cookie_sets.append((name, base64.b64decode(value).decode('utf-8')))
+        except Exception as e:
+            print(f"Cookie set {name} could not be decoded: {e}")
+
+    cookie_dir = getattr(settings, 'YOUTUBE_COOKIES_DIR', None)
+    if cookie_dir and os.path.isdir(cookie_dir):
+        for path in sorted(Path(cookie_dir).glob('*.txt')):
+            try:
+                cookie_sets.append((path.name, path.read_text(encoding='utf-8')))
+            except OSError as e:
+                print(f"Cookie file {path} could not be read: {e}")
+
+    return cookie_sets
+
+
+class CookieJar:
+    """One decoded cookie set plus its health and usage state"""
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.uses = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_used = 0.0
+        self.cooldown_until = 0.0
+
+    def is_healthy(self, now=None):
+        return self.cooldown_until <= (now if now is not None else time.monotonic())
+
+    def open(self):
+        """
+        Return a fresh in-memory cookie file for one YoutubeDL instance.
+        yt-dlp accepts file-like objects for ``cookiefile`` and writes
+        updated cookies back to it on close, so each instance needs its own.
+        """
+        return io.StringIO(self.text)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'healthy': self.is_healthy(),
+            'uses': self.uses,
+            'failures': self.failures,
+            'cooldown_remaining': max(0, round(self.cooldown_until - time.monotonic(), 1)),
+        }
+
+
+class CookiePool:
+    """
+    Spreads requests over several cookie jars, either round-robin or by
+    least recent use. Jars that hit identity errors are put on an
+    exponentially growing cooldown and skipped until it runs out.
+    """
+
+    def __init__(self, jars, strategy='round_robin', cooldown=300, max_cooldown=3600):
+        self.jars = list(jars)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.jars)
+
+    def acquire(self):
+        """Pick a jar for the next request, or None when the pool is empty"""
+        if not self.jars:
+            return None
+
+        with self._lock:
+            now = time.monotonic()
+            healthy = [jar for jar in self.jars if jar.is_healthy(now)]
+            if not healthy:
+                # Everything is cooling down: use the jar that recovers first
+                jar = min(self.jars, key=lambda j: j.cooldown_until)
+            elif self.strategy == 'lru':
+                jar = min(healthy, key=lambda j: j.last_used)
+            else:
+                jar = None
+                for _ in range(len(self.jars)):
+                    candidate = self.jars[self._next % len(self.jars)]
+                    self._next += 1
+                    if candidate.is_healthy(now):
+                        jar = candidate
+                        break
+
+            jar.uses += 1
+            jar.last_used = now
+            return jar
+
+    def report_success(self, jar):
+        if jar is None:
+            return
+        with self._lock:
+            jar.consecutive_failures = 0
+
+    def report_failure(self, jar, error=None):
+        """Cool a jar down when the error looks like throttling or a bot check"""
+        if jar is None or (error is not None and not is_identity_error(error)):
+            return
+        with self._lock:
+            jar.failures += 1
+            jar.consecutive_failures += 1
+            delay = min(self.cooldown * 2 ** (jar.consecutive_failures - 1), self.max_cooldown)
+            jar.cooldown_until = time.monotonic() + delay
+        print(f"Cookie set {jar.name} cooling down for {delay}s")
+
+    def stats(self):
+        with self._lock:
+            return [jar.stats() for jar in self.jars]
+
+    def counts(self):
+        """How many jars there are and how many are usable, without naming them"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = sum(jar.is_healthy(now) for jar in self.jars)
+        return {'total': len(self.jars), 'healthy': healthy, 'cooling_down': len(self.jars) - healthy}
+
+    def gauges(self):
+        """Flat numeric stats for /metrics, per jar"""
+        values = self.counts()
+        for jar in self.stats():
+            name = re.sub(r'\W', '_', jar['name'])
+            values[f'{name}_healthy'] = int(jar['healthy'])
+            values[f'{name}_uses'] = jar['uses']
+            values[f'{name}_failures'] = jar['failures']
+            values[f'{name}_cooldown_remaining'] = jar['cooldown_remaining']
+        return values
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_cookie_pool():
+    """Build the YouTube cookie pool once per process"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                jars = [CookieJar(name, text) for name, text in load_cookie_sets()]
+                _pool = CookiePool(
+                    jars,
+                    strategy=getattr(settings, 'YOUTUBE_COOKIE_STRATEGY', 'round_robin'),
+                    cooldown=getattr(settings, 'YOUTUBE_COOKIE_COOLDOWN', 300),
+                )
+                print(f"Loaded {len(jars)} YouTube cookie set(s)")
+    return _pool
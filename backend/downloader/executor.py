@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class Overloaded(Exception):
+    """Raised when the extraction executor has no free slot for a request"""
+
+    def __init__(self, retry_after):
+        super().__init__('Extraction executor is at capacity')
+        self.retry_after = retry_after
+
+
+class ExtractionExecutor:
+    """
+    Bounded thread pool for blocking yt-dlp work.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue``
+    more wait for a thread. Anything beyond that is rejected straight
+    away with ``Overloaded`` instead of queueing until it times out.
+    """
+
+    def __init__(self, max_workers=8, max_queue=16, retry_after=5):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extract')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _call(func, *args, **kwargs):
+        # Pool threads outlive requests, so Django's per-request connection
+        # cleanup never runs for them
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking call on the pool from async code. When the caller
+        is cancelled (the client went away) the call is dropped if it has
+        not started; a running one keeps its slot until its thread is done.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        """Run a blocking call on the pool from sync code, returning a Future"""
+        self._acquire()
+        try:
+            future = self._pool.submit(functools.partial(self._call, func, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # Released when the thread is done, not when a waiter gives up
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+            }
+
+
+extraction_executor = ExtractionExecutor(
+    max_workers=getattr(settings, 'EXTRACTION_MAX_WORKERS', 8),
+    max_queue=getattr(settings, 'EXTRACTION_MAX_QUEUE', 16),
+    retry_after=getattr(settings, 'EXTRACTION_RETRY_AFTER', 5),
+)
@@ -0,0 +1,52 @@
+import re
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+# googlevideo puts the expiry in the query (?expire=) or, for manifests, in the path
+PATH_EXPIRE_RE = re.compile(r'/expire/(\d+)')
+
+
+def url_expiry(url):
+    """Return the unix time a signed media URL expires at, or None"""
+    if not url:
+        return None
+    query = parse_qs(urlparse(url).query)
+    try:
+        if 'expire' in query:
+            return int(query['expire'][0])
+        if 'oe' in query:
+            # Instagram/Facebook CDN: hex timestamp
+            return int(query['oe'][0], 16)
+    except ValueError:
+        return None
+    match = PATH_EXPIRE_RE.search(url)
+    return int(match.group(1)) if match else None
+
+
+def iter_media_urls(info):
+    if info.get('url'):
+        yield info['url']
+    for fmt in info.get('formats') or []:
+        if fmt.get('url'):
+            yield fmt['url']
+    for entry in info.get('entries') or []:
+        if entry:
+            yield from iter_media_urls(entry)
+
+
+def info_expiry(info):
+    """Earliest expiry of any media URL in an info dict, or None"""
+    expiries = [e for e in (url_expiry(url) for url in iter_media_urls(info)) if e]
+    return min(expiries) if expiries else None
+
+
+def seconds_until_expiry(info, default, margin=300):
+    """
+    How long an info dict can be cached: until shortly before its first
+    signed URL expires, and never longer than ``default`` seconds.
+    """
+    expires_at = info_expiry(info)
+    if expires_at is None:
+        return default
+    return max(0, min(default, expires_at - margin - time.time()))
@@ -0,0 +1,193 @@
+"""
+Format selection for yt-dlp info dicts.
+
+Everything here is pure: it only looks at the ``formats`` list of an
+already extracted info dict, so picking a quality never needs another
+call to yt-dlp.
+"""
+
+DEFAULT_HEIGHT = 720
+
+EXTENSION_SCORES = {
+    'mp4': 10,
+    'webm': 5,
+    'mkv': 5,
+}
+
+
+def parse_quality(quality, default=DEFAULT_HEIGHT):
+    """Turn a quality label like '720p' into a target height"""
+    if isinstance(quality, int):
+        return quality
+    if isinstance(quality, str) and quality.endswith('p') and quality[:-1].isdigit():
+        return int(quality[:-1])
+    return default
+
+
+def codec_family(codec):
+    """Reduce a codec string like 'avc1.64001F' to its family ('avc1')"""
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0]
+
+
+def format_height(fmt):
+    height = fmt.get('height')
+    return height if isinstance(height, int) else 0
+
+
+def is_video(fmt):
+    # Storyboards (mhtml) are image sheets, not video
+    return fmt.get('vcodec') != 'none' and fmt.get('protocol') != 'mhtml' and bool(fmt.get('url'))
+
+
+def is_audio_only(fmt):
+    return fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none') and bool(fmt.get('url'))
+
+
+def is_direct(fmt):
+    """True when a format is a single file over HTTP, not a manifest or fragments"""
+    return fmt.get('protocol') in (None, 'http', 'https')
+
+
+def is_progressive(fmt):
+    """True when a format carries both video and audio (yt-dlp's 'best')"""
+    return is_video(fmt) and fmt.get('acodec') != 'none'
+
+
+def audio_rank(fmt):
+    return (fmt.get('abr') or fmt.get('tbr') or 0, EXTENSION_SCORES.get(fmt.get('ext'), 1))
+
+
+# Audio containers that can be stream-copied next to a video container
+COMPATIBLE_AUDIO = {
+    'mp4': ('m4a', 'mp4'),
+    'webm': ('webm',),
+}
+
+
+def merge_container(video, audio):
+    """Output container for muxing a video and an audio stream without re-encoding"""
+    if video.get('ext') == 'mp4' and audio.get('ext') in COMPATIBLE_AUDIO['mp4']:
+        return 'mp4'
+    if video.get('ext') == 'webm' and audio.get('ext') == 'webm':
+        return 'webm'
+    return 'mkv'
+
+
+def format_rank(fmt):
+    return (
+        format_height(fmt),
+        EXTENSION_SCORES.get(fmt.get('ext'), 1),
+        fmt.get('tbr') or 0,
+    )
+
+
+class FormatIndex:
+    """
+    Video formats of one info dict, pre-indexed by height, extension and
+    codec family. Every bucket is kept sorted best first.
+    """
+
+    def __init__(self, formats):
+        self.formats = sorted(
+            (f for f in formats or [] if is_video(f)),
+            key=format_rank,
+            reverse=True,
+        )
+        self.by_height = {}
+        self.by_ext = {}
+        self.by_codec = {}
+        for fmt in self.formats:
+            self.by_height.setdefault(format_height(fmt), []).append(fmt)
+            self.by_ext.setdefault(fmt.get('ext'), []).append(fmt)
+            self.by_codec.setdefault(codec_family(fmt.get('vcodec')), []).append(fmt)
+        self.heights = sorted(self.by_height, reverse=True)
+        self.audio = sorted(
+            (f for f in formats or [] if is_audio_only(f)),
+            key=audio_rank,
+            reverse=True,
+        )
+
+    def __bool__(self):
+        return bool(self.formats)
+
+    def best(self, max_height=None, ext=None, codec=None, progressive=False, direct=False):
+        """Return the best format matching all given constraints, or None"""
+        if ext is not None:
+            candidates = self.by_ext.get(ext, [])
+        elif codec is not None:
+            candidates = self.by_codec.get(codec, [])
+        else:
+            candidates = self.formats
+
+        for fmt in candidates:
+            if max_height is not None and format_height(fmt) > max_height:
+                continue
+            if codec is not None and codec_family(fmt.get('vcodec')) != codec:
+                continue
+            if progressive and not is_progressive(fmt):
+                continue
+            if direct and not is_direct(fmt):
+                continue
+            return fmt
+        return None
+
+    def best_audio(self, exts=None):
+        """Return the highest bitrate audio-only format, optionally limited to some extensions"""
+        for fmt in self.audio:
+            if is_direct(fmt) and (exts is None or fmt.get('ext') in exts):
+                return fmt
+        return None
+
+    def select_pair(self, quality):
+        """
+        Pick a (video-only, audio-only) pair for merging, like yt-dlp's
+        'bestvideo[height<=N]+bestaudio'. Audio in a container compatible
+        with the video is preferred so the merge can stay a stream copy
+        into mp4/webm. Returns None when there is nothing to merge.
+        """
+        target = parse_quality(quality)
+        video = None
+        for fmt in self.formats:
+            if fmt.get('acodec') == 'none' and is_direct(fmt) and format_height(fmt) <= target:
+                video = fmt
+                break
+        if video is None:
+            return None
+        audio = self.best_audio(COMPATIBLE_AUDIO.get(video.get('ext'))) or self.best_audio()
+        if audio is None:
+            return None
+        return video, audio
+
+    def select(self, quality, prefer_ext='mp4'):
+        """
+        Pick a format for a quality label, falling back step by step:
+
+        1. progressive format in ``prefer_ext`` up to the target height
+        2. any progressive format up to the target height
+        3. any progressive format (yt-dlp's plain 'best')
+        4. any video format up to the target height
+        5. the best video format available
+
+        The steps are first tried with single-file (direct) formats only,
+        so a download URL is never an HLS/DASH manifest when a plain file
+        exists; manifests are only returned when there is nothing else.
+        """
+        target = parse_quality(quality)
+        for direct in (True, False):
+            fmt = (
+                self.best(max_height=target, ext=prefer_ext, progressive=True, direct=direct)
+                or self.best(max_height=target, progressive=True, direct=direct)
+                or self.best(progressive=True, direct=direct)
+                or self.best(max_height=target, direct=direct)
+                or self.best(direct=direct)
+            )
+            if fmt is not None:
+                return fmt
+        return None
+
+
+def select_format(formats, quality, prefer_ext='mp4'):
+    """Shortcut for FormatIndex(formats).select(quality)"""
+    return FormatIndex(formats).select(quality, prefer_ext=prefer_ext)
@@ -0,0 +1,168 @@
+"""
+Background merge jobs.
+
+The chosen DASH video and audio streams are downloaded (in parallel byte
+ranges, see segmented.py) and muxed with ffmpeg (stream copy, no
+re-encode) in a bounded process pool, so the work neither blocks request
+workers nor competes with them for the GIL. Job state lives on the
+VideoDownload row, which child processes update.
+
+A request for a video and format pair that already has a job in flight
+gets that job back. Jobs die with their pool, so those still pending or
+running when the server starts, or older than MERGE_JOB_TIMEOUT, are
+marked failed.
+
+This module is imported by spawned pool processes before Django is set
+up, so models are only imported inside functions.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+
+def get_job_pool():
+    """Process pool for merge jobs, created on first use in each web worker"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'MERGE_MAX_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+    return _pool
+
+
+def submit_merge_job(job_pk, video, audio, container):
+    """Queue a merge job. ``video`` and ``audio`` are yt-dlp format dicts."""
+    streams = [stream_spec(video), stream_spec(audio)]
+    get_job_pool().submit(run_merge_job, job_pk, streams, container)
+
+
+def find_active_job(video_id, format_id):
+    """The pending or running job for a video and format pair, if any"""
+    from django.utils import timezone
+    from .models import VideoDownload
+    fail_stale_jobs(getattr(settings, 'MERGE_JOB_TIMEOUT', 3600))
+    return (
+        VideoDownload.objects
+        .filter(
+            video_id=video_id,
+            format_id=format_id,
+            status__in=[VideoDownload.STATUS_PENDING, VideoDownload.STATUS_RUNNING],
+            created_at__gte=timezone.now() - timedelta(seconds=getattr(settings, 'MERGE_JOB_TIMEOUT', 3600)),
+        )
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def fail_stale_jobs(older_than=None):
+    """
+    Mark unfinished jobs as failed: all of them at server start, when no
+    pool is running yet, or those created more than ``older_than`` seconds
+    ago. Returns how many there were.
+    """
+    from django.utils import timezone
+    from .models import VideoDownload
+    jobs = VideoDownload.objects.filter(status__in=[VideoDownload.STATUS_PENDING, VideoDownload.STATUS_RUNNING])
+    if older_than is not None:
+        jobs = jobs.filter(created_at__lt=timezone.now() - timedelta(seconds=older_than))
+    return jobs.update(status=VideoDownload.STATUS_FAILED, error='The job was interrupted, please start it again')
+
+
+def stream_spec(fmt):
+    """What a job process needs of a format to download it"""
+    spec = {key: fmt[key] for key in ('url', 'protocol', 'format_id', 'ext') if fmt.get(key)}
+    spec['http_headers'] = fmt.get('http_headers') or {}
+    spec['size'] = fmt.get('filesize') or fmt.get('filesize_approx')
+    return spec
+
+
+class ProgressReporter:
+    """Writes download progress to the job row, at most once per interval"""
+
+    def __init__(self, job_pk, total, interval=1.0):
+        self.job_pk = job_pk
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.last_write = 0.0
+
+    def advance(self, count):
+        self.done += count
+        now = time.monotonic()
+        if self.total and now - self.last_write >= self.interval:
+            self.last_write = now
+            # Downloading is the first 95%, muxing the rest
+            update_job(self.job_pk, progress=round(min(self.done / self.total, 1) * 95, 1))
+
+
+def update_job(job_pk, **fields):
+    from .models import VideoDownload
+    VideoDownload.objects.filter(pk=job_pk).update(**fields)
+
+
+def mux(video_path, audio_path, output_path):
+    """Combine one video and one audio stream into a new container without re-encoding"""
+    import ffmpeg
+    video = ffmpeg.input(video_path).video
+    audio = ffmpeg.input(audio_path).audio
+    try:
+        (
+            ffmpeg
+            .output(video, audio, output_path, c='copy')
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        stderr = (e.stderr or b'').decode('utf-8', errors='ignore').strip()
+        raise Exception(f"ffmpeg failed: {stderr[-500:]}")
+
+
+def run_merge_job(job_pk, streams, container):
+    """Entry point in the pool process: download both streams, mux, store the result"""
+    from .media_cache import media_cache
+    from .models import VideoDownload
+    from .segmented import fetch_format
+
+    update_job(job_pk, status=VideoDownload.STATUS_RUNNING, progress=0)
+    work_dir = tempfile.mkdtemp(prefix='merge-')
+    try:
+        total = sum(stream['size'] or 0 for stream in streams)
+        reporter = ProgressReporter(job_pk, total)
+        paths = []
+        for index, stream in enumerate(streams):
+            path = os.path.join(work_dir, f'stream{index}')
+            fetch_format(stream, path, reporter.advance)
+            paths.append(path)
+
+        update_job(job_pk, progress=95)
+        output_path = os.path.join(work_dir, f'merged.{container}')
+        mux(paths[0], paths[1], output_path)
+
+        # The merged file becomes a media cache entry for (video_id, "video+audio")
+        media_cache.adopt(VideoDownload.objects.get(pk=job_pk), output_path, container)
+    except Exception as e:
+        print(f"Merge Job Error ({job_pk}): {str(e)}")
+        update_job(job_pk, status=VideoDownload.STATUS_FAILED, error=str(e)[:1000])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,194 @@
+"""
+Content-addressed media cache under MEDIA_ROOT/downloads.
+
+Entries are VideoDownload rows keyed by (video_id, format_id). Files are
+stored as ``downloads/<sha256>.<ext>``, so identical bytes reached through
+different keys are kept once. When the files exceed MEDIA_CACHE_MAX_BYTES
+the least recently accessed rows are deleted through VideoDownload.delete,
+which removes a file once no other row points at it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def downloads_dir():
+    path = os.path.join(settings.MEDIA_ROOT, 'downloads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into inclusive (start, end).
+    Returns None when there is no usable range and raises ValueError when
+    the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+class MediaCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def entries(self):
+        from .models import VideoDownload
+        return VideoDownload.objects.filter(status=VideoDownload.STATUS_DONE).exclude(content_hash='')
+
+    def lookup(self, video_id, format_id):
+        """Return the cached row for a key, marking it as recently used"""
+        row = self.entries().filter(video_id=video_id, format_id=format_id).first()
+        if row is None:
+            return None
+        if not os.path.isfile(row.file.path):
+            row.delete()
+            return None
+        type(row).objects.filter(pk=row.pk).update(last_accessed=timezone.now())
+        return row
+
+    def store(self, path, content_hash, extension, **fields):
+        """
+        Move a finished file into the cache and create its row. ``fields``
+        are VideoDownload fields and must include video_id and format_id.
+        """
+        from .models import VideoDownload
+        # Replace any older entry for the same key first, so its file is
+        # released before the new one takes its place
+        for old in self.entries().filter(video_id=fields['video_id'], format_id=fields['format_id']):
+            old.delete()
+
+        name = self._place(path, content_hash, extension)
+        row = VideoDownload.objects.create(
+            file=name,
+            content_hash=content_hash,
+            size=os.path.getsize(os.path.join(settings.MEDIA_ROOT, name)),
+            status=VideoDownload.STATUS_DONE,
+            progress=100,
+            last_accessed=timezone.now(),
+            **fields,
+        )
+        self.enforce_budget()
+        return row
+
+    def adopt(self, row, path, extension):
+        """Turn a finished merge job's output file into a cache entry"""
+        content_hash = hash_file(path)
+        name = self._place(path, content_hash, extension)
+        type(row).objects.filter(pk=row.pk).update(
+            file=name,
+            content_hash=content_hash,
+            size=os.path.getsize(os.path.join(settings.MEDIA_ROOT, name)),
+            status=type(row).STATUS_DONE,
+            progress=100,
+            last_accessed=timezone.now(),
+        )
+        self.enforce_budget()
+
+    def _place(self, path, content_hash, extension):
+        """Move a file to its content-addressed name and return that name"""
+        name = os.path.join('downloads', f'{content_hash}.{extension}')
+        final_path = os.path.join(settings.MEDIA_ROOT, name)
+        downloads_dir()
+        if os.path.exists(final_path):
+            os.remove(path)  # Same bytes are already cached under another key
+        else:
+            os.replace(path, final_path)
+        return name
+
+    def total_bytes(self):
+        # Shared files count once
+        sizes = dict(self.entries().values_list('content_hash', 'size'))
+        return sum(sizes.values())
+
+    def enforce_budget(self):
+        """Evict least recently used rows until the cache fits its budget"""
+        with self._lock:
+            total = self.total_bytes()
+            if total <= self.max_bytes:
+                return
+            for row in self.entries().order_by('last_accessed'):
+                shared = self.entries().filter(content_hash=row.content_hash).exclude(pk=row.pk).exists()
+                print(f"Media cache: evicting {row.video_id} {row.format_id} ({row.size} bytes)")
+                row.delete()
+                if not shared:
+                    total -= row.size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        return {
+            'entries': self.entries().count(),
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+        }
+
+
+class CacheWriter:
+    """
+    Tees a proxied download into the cache. Chunks are written to a temp
+    file and hashed as they stream past; the file only becomes a cache
+    entry if the transfer completes with the expected length.
+    """
+
+    def __init__(self, expected_size, extension, **fields):
+        self.expected_size = expected_size
+        self.extension = extension
+        self.fields = fields
+        self.size = 0
+        self.digest = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(dir=downloads_dir(), suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self.file.close()
+        if self.size != self.expected_size:
+            os.remove(self.path)
+            return None
+        try:
+            return media_cache.store(self.path, self.digest.hexdigest(), self.extension, **self.fields)
+        except Exception as e:
+            print(f"Media cache store failed: {e}")
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None
+        finally:
+            # Runs on whichever thread finished the transfer, outside any request
+            connection.close()
+
+
+media_cache = MediaCache(getattr(settings, 'MEDIA_CACHE_MAX_BYTES', 5 * 1024 ** 3))
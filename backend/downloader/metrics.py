@@ -0,0 +1,215 @@
+"""
+Hot-path instrumentation: per-stage timings and Prometheus metrics.
+
+Code wraps each stage of a request in ``with stage('extract'):``. The
+duration goes into the ``vieurl_stage_duration_seconds`` histogram and,
+inside ``track_request``, into the request's Timings. Those become its
+``Server-Timing`` header. ``render_metrics`` renders every metric in the
+Prometheus text format for the /metrics endpoint.
+
+Metrics are per process. With several gunicorn workers, each scrape is
+answered by one of them, so scrape each worker or run a single one.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key, value):
+        return [f'{self.name}{format_labels(self.label_names, key)} {value}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            buckets, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self._values[key] = (buckets, total + value, count + 1)
+
+    def render_value(self, key, value):
+        buckets, total, count = value
+        names = self.label_names + ('le',)
+        lines = [
+            f'{self.name}_bucket{format_labels(names, key + (bound,))} {bucket}'
+            for bound, bucket in zip(self.buckets, buckets)
+        ]
+        labels = format_labels(self.label_names, key)
+        lines.append(f'{self.name}_bucket{format_labels(names, key + ("+Inf",))} {count}')
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'vieurl_request_duration_seconds', 'Time spent handling API requests.', labels=('view', 'platform'),
+)
+STAGE_DURATION = Histogram(
+    'vieurl_stage_duration_seconds', 'Time spent in each stage of a request.', labels=('stage',),
+)
+EXTRACTION_DURATION = Histogram(
+    'vieurl_extraction_duration_seconds', 'Time spent in yt-dlp extractions.', labels=('platform', 'mode'),
+)
+RESPONSES = Counter(
+    'vieurl_responses_total', 'API responses by status class.', labels=('view', 'platform', 'status'),
+)
+EXTRACTION_ERRORS = Counter(
+    'vieurl_extraction_errors_total', 'yt-dlp extractions that raised.', labels=('platform',),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'vieurl_requests_in_flight', 'API requests being handled right now.', labels=('view',),
+)
+METRICS = (REQUEST_DURATION, STAGE_DURATION, EXTRACTION_DURATION, RESPONSES, EXTRACTION_ERRORS, REQUESTS_IN_FLIGHT)
+
+
+class Timings:
+    """Stage durations of one request, in the order they finished"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.platform = ''
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+        parts.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_timings = contextvars.ContextVar('timings', default=None)
+
+
+def current_timings():
+    return _timings.get()
+
+
+@contextmanager
+def stage(name):
+    """Time a block as stage ``name`` of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def set_platform(platform):
+    timings = _timings.get()
+    if timings is not None:
+        timings.platform = platform
+
+
+@contextmanager
+def track_request(view):
+    """
+    Collect the stage timings of the request handled inside the block.
+    Call ``finish_request`` with the response before leaving it.
+    """
+    timings = Timings()
+    token = _timings.set(timings)
+    REQUESTS_IN_FLIGHT.inc(view=view)
+    try:
+        yield timings
+    finally:
+        REQUESTS_IN_FLIGHT.dec(view=view)
+        _timings.reset(token)
+
+
+def finish_request(view, timings, response):
+    """Record a finished request and add its Server-Timing header"""
+    REQUEST_DURATION.observe(timings.elapsed(), view=view, platform=timings.platform)
+    RESPONSES.inc(view=view, platform=timings.platform, status=f'{response.status_code // 100}xx')
+    response['Server-Timing'] = timings.header()
+    response['Timing-Allow-Origin'] = '*'
+
+
+def render_metrics(collectors=()):
+    """
+    Render all metrics in the Prometheus text format. ``collectors`` are
+    ``(prefix, stats_dict)`` pairs whose numeric values are exported as
+    gauges named ``vieurl_<prefix>_<key>``.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for prefix, stats in collectors:
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'vieurl_{prefix}_{key}'
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
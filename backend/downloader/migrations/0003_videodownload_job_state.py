@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:23
+
+import uuid
+from django.db import migrations, models
+
+
+def gen_job_ids(apps, schema_editor):
+    VideoDownload = apps.get_model("downloader", "VideoDownload")
+    for row in VideoDownload.objects.all():
+        row.job_id = uuid.uuid4()
+        row.save(update_fields=["job_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("downloader", "0002_alter_videodownload_file_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videodownload",
+            name="error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="format_id",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="job_id",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(gen_job_ids, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="videodownload",
+            name="job_id",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="progress",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                default="done",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name="videodownload",
+            name="file",
+            field=models.FileField(blank=True, upload_to="downloads/"),
+        ),
+    ]
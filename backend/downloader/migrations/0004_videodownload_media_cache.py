@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("downloader", "0003_videodownload_job_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videodownload",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="last_accessed",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="size",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="videodownload",
+            name="video_id",
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
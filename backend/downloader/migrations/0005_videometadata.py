@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("downloader", "0004_videodownload_media_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VideoMetadata",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("platform", models.CharField(max_length=20)),
+                ("video_id", models.CharField(max_length=100)),
+                ("info", models.JSONField()),
+                ("expires_at", models.DateTimeField(db_index=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("platform", "video_id"), name="unique_video_metadata"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -8,19 +8,64 @@ def get_file_path(instance, filename):
     return os.path.join('downloads', filename)
 
 class VideoDownload(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     url = models.URLField()
     title = models.CharField(max_length=255)
-    file = models.FileField(upload_to='downloads/')
+    file = models.FileField(upload_to='downloads/', blank=True)
     quality = models.CharField(max_length=20)
     platform = models.CharField(max_length=20, default='youtube')
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    # Background merge job state
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DONE)
+    progress = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    format_id = models.CharField(max_length=50, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Media cache entry: the file is stored under its content hash and may be
+    # shared by several rows with the same bytes
+    video_id = models.CharField(max_length=100, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(default=0)
+    last_accessed = models.DateTimeField(null=True, blank=True, db_index=True)
+
     def __str__(self):
         return self.title
-    
+
     def delete(self, *args, **kwargs):
-        # Delete the file when model is deleted
+        # Delete the file when model is deleted, unless another row shares it
         if self.file:
-            if os.path.isfile(self.file.path):
+            shared = VideoDownload.objects.filter(file=self.file.name).exclude(pk=self.pk).exists()
+            if not shared and os.path.isfile(self.file.path):
                 os.remove(self.file.path)
         super().delete(*args, **kwargs)
+
+
+class VideoMetadata(models.Model):
+    """Trimmed yt-dlp info dict, shared by all workers as a second-level cache"""
+
+    platform = models.CharField(max_length=20)
+    video_id = models.CharField(max_length=100)
+    info = models.JSONField()
+    expires_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['platform', 'video_id'], name='unique_video_metadata'),
+        ]
+
+    def __str__(self):
+        return f"{self.platform}:{self.video_id}"
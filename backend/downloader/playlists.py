@@ -0,0 +1,83 @@
+import itertools
+
+from .ratelimit import upstream_limiter
+from .ydl_pool import ydl_pool
+
+
+def flat_playlist_opts():
+    return {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+
+
+def entry_thumbnail(entry):
+    if entry.get('thumbnail'):
+        return entry['thumbnail']
+    thumbnails = [t for t in entry.get('thumbnails') or [] if t.get('url')]
+    if not thumbnails:
+        return None
+    # yt-dlp only sorts thumbnails when it processes a result. Flat and
+    # unprocessed results keep the extractor's order, best usually last.
+    index, best = max(enumerate(thumbnails), key=lambda item: (item[1].get('preference') or 0, item[0]))
+    return best['url']
+
+
+def entry_url(entry):
+    url = entry.get('url') or entry.get('webpage_url')
+    if url and url.startswith('http'):
+        return url
+    if entry.get('id'):
+        return f"https://www.youtube.com/watch?v={entry['id']}"
+    return None
+
+
+def lightweight_entry(entry):
+    """Only the fields a playlist listing needs, taken from a flat entry"""
+    return {
+        'id': entry.get('id'),
+        'title': entry.get('title', 'Untitled'),
+        'duration': entry.get('duration'),
+        'thumbnail': entry_thumbnail(entry),
+        'url': entry_url(entry),
+    }
+
+
+def iter_playlist(url, max_entries, cookie_pool=None):
+    """
+    Yield the playlist header followed by lightweight entries, as yt-dlp
+    pages through the playlist. Nothing is resolved per entry, so the
+    first entries are available after the first page is fetched.
+    """
+    jar = cookie_pool.acquire() if cookie_pool is not None else None
+    identity = jar.name if jar is not None else None
+    upstream_limiter.acquire('youtube', identity)
+    try:
+        with ydl_pool.checkout(flat_playlist_opts(), jar) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            # Channel URLs first resolve to one of their tabs
+            while info and info.get('_type') in ('url', 'url_transparent'):
+                info = ydl.extract_info(info['url'], download=False, process=False)
+            if not info:
+                raise Exception("Could not get playlist info")
+
+            yield {
+                'type': 'playlist',
+                'id': info.get('id'),
+                'title': info.get('title', 'Playlist'),
+                'author': info.get('uploader') or info.get('channel'),
+            }
+            entries = info.get('entries') or []
+            for index, entry in enumerate(itertools.islice(entries, max_entries)):
+                if entry:
+                    yield dict(lightweight_entry(entry), type='entry', index=index)
+    except Exception as e:
+        upstream_limiter.report_failure('youtube', e, identity)
+        if jar is not None:
+            cookie_pool.report_failure(jar, e)
+        raise
+    upstream_limiter.report_success('youtube', identity)
+    if jar is not None:
+        cookie_pool.report_success(jar)
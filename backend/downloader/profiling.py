@@ -0,0 +1,73 @@
+"""
+Opt-in sampling profiler for single requests.
+
+With PROFILING_ENABLED set, a request carrying an ``X-Profile`` header
+(equal to PROFILING_TOKEN, if one is configured) is profiled. A background
+thread samples the stack of the thread handling the request every
+PROFILING_INTERVAL seconds. The samples are written to PROFILING_DIR as
+folded stacks (``frame;frame;frame count`` per line), which flamegraph.pl
+and speedscope read. The file name comes back in the ``X-Profile``
+response header.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+
+def profiling_requested(request):
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        return False
+    value = request.headers.get('X-Profile')
+    if not value:
+        return False
+    token = getattr(settings, 'PROFILING_TOKEN', '')
+    return not token or value == token
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def save(self, label):
+        directory = getattr(settings, 'PROFILING_DIR', None) or os.path.join(settings.BASE_DIR, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}.folded"
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(self.folded())
+        return name
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+# Upstream response headers passed through to the client
+PASSTHROUGH_HEADERS = (
+    'Content-Length',
+    'Content-Range',
+    'Accept-Ranges',
+    'Content-Type',
+    'Last-Modified',
+    'ETag',
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide keep-alive HTTP session with a bounded connection pool"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, 'PROXY_POOL_SIZE', 16)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+class TransferStats:
+    """Counters for all proxied transfers in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.transfers = 0
+        self.bytes = 0
+
+    def start(self):
+        with self._lock:
+            self.active += 1
+            self.transfers += 1
+
+    def finish(self, sent):
+        with self._lock:
+            self.active -= 1
+            self.bytes += sent
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'transfers': self.transfers, 'bytes': self.bytes}
+
+
+transfer_stats = TransferStats()
+
+
+def open_upstream(media_url, headers=None, range_header=None):
+    """Start a streamed GET to the upstream media URL, forwarding Range"""
+    request_headers = dict(headers or {})
+    if range_header:
+        request_headers['Range'] = range_header
+    return get_session().get(
+        media_url,
+        headers=request_headers,
+        stream=True,
+        timeout=getattr(settings, 'PROXY_TIMEOUT', 30),
+    )
+
+
+def iter_upstream(upstream, label, chunk_size=None, sink=None):
+    """
+    Yield the upstream body in fixed-size chunks, so at most one chunk per
+    transfer is held in memory. Logs the throughput when the transfer ends.
+    Chunks are also written to ``sink`` (a media cache writer) if given.
+    """
+    chunk_size = chunk_size or getattr(settings, 'PROXY_CHUNK_SIZE', 256 * 1024)
+    sent = 0
+    started = time.monotonic()
+    transfer_stats.start()
+    try:
+        for chunk in upstream.iter_content(chunk_size=chunk_size):
+            if chunk:
+                sent += len(chunk)
+                if sink is not None:
+                    sink.write(chunk)
+                yield chunk
+    finally:
+        upstream.close()
+        if sink is not None:
+            sink.close()
+        transfer_stats.finish(sent)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"Proxy {label}: {sent} bytes in {elapsed:.2f}s ({sent / elapsed / (1024 * 1024):.2f} MB/s)")
+
+
+async def aiter_upstream(upstream, label, chunk_size=None, sink=None):
+    """Async version of iter_upstream for ASGI; each read runs on a thread"""
+    iterator = iter_upstream(upstream, label, chunk_size, sink)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        try:
+            iterator.close()
+        except ValueError:
+            # Cancelled while a read is still running on its thread
+            upstream.close()
@@ -0,0 +1,237 @@
+"""
+Rate limiting of the extractions we send to YouTube and Instagram.
+
+Each upstream platform (optionally each cookie identity on it) has a
+token bucket. Its state lives in the Django cache named by
+RATE_LIMIT_CACHE, so every gunicorn worker draws from the same bucket:
+a file-based cache on one host, or Redis when REDIS_URL is set.
+
+A request that finds the bucket empty waits for its token if that takes
+at most RATE_LIMIT_MAX_WAIT seconds, and is rejected with RateLimited
+otherwise. When an extraction fails with a throttling error (429, bot
+check), the bucket stops handing out tokens for a backoff period that
+doubles with every further throttle, and its rate is halved. Successful
+extractions raise the rate again step by step. This keeps us just under
+what the upstream accepts instead of hammering it into longer blocks.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+
+# Error messages that mean the upstream is throttling us: HTTP 429 and
+# friends, and YouTube's bot check ("Sign in to confirm you're not a bot").
+# Not just "sign in to confirm": the age gate ("Sign in to confirm your
+# age") is about one video, and must not pause the platform for everyone.
+RATE_LIMIT_ERROR_MARKERS = (
+    'http error 429',
+    'too many requests',
+    'rate-limit',
+    'rate limit',
+)
+BOT_CHECK_MARKERS = (
+    "confirm you're not a bot",
+    'not a bot',
+)
+
+# Rate recovered per successful extraction, as a fraction of the base rate
+RECOVERY_STEP = 0.05
+
+
+def is_rate_limit_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_ERROR_MARKERS)
+
+
+def is_bot_check(error):
+    message = str(error).lower()
+    return any(marker in message for marker in BOT_CHECK_MARKERS)
+
+
+def is_throttle_error(error):
+    return is_rate_limit_error(error) or is_bot_check(error)
+
+
+def parse_rate(value):
+    """Parse ``'5/s'``, ``'30/m'`` or ``'100/h'`` into requests per second"""
+    if not value:
+        return None
+    count, _, unit = str(value).partition('/')
+    seconds = {'': 1, 's': 1, 'm': 60, 'h': 3600}[unit.strip().lower()[:1]]
+    return float(count) / seconds
+
+
+class RateLimited(Exception):
+    """
+    Raised when an extraction may not go upstream now. ``backing_off`` is
+    set when the upstream throttled us, rather than our own limit being hit.
+    """
+
+    def __init__(self, platform, retry_after, backing_off=False):
+        super().__init__(f'Rate limit for {platform} reached')
+        self.platform = platform
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.backing_off = backing_off
+
+
+class UpstreamLimiter:
+    def __init__(self, rates=None, burst=2.0, max_wait=1.0, backoff=30, max_backoff=600,
+                 min_factor=0.1, per_identity=False, cache_alias=None):
+        self.rates = {platform: parse_rate(rate) for platform, rate in (rates or {}).items()}
+        self.burst = burst
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.min_factor = min_factor
+        self.per_identity = per_identity
+        self.cache_alias = cache_alias
+        # Buckets this process last saw slowed down, so successes elsewhere
+        # don't each cost a cache write
+        self._degraded = set()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    @property
+    def cache(self):
+        # Without an alias, RATE_LIMIT_CACHE is read per call, so tests can override it
+        alias = self.cache_alias or getattr(settings, 'RATE_LIMIT_CACHE', 'ratelimit')
+        try:
+            return caches[alias]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    def bucket_key(self, platform, identity=None):
+        if self.per_identity and identity:
+            return f'ratelimit:{platform}:{identity}'
+        return f'ratelimit:{platform}'
+
+    def _update(self, key, func):
+        """
+        Apply ``func(state, now)`` to a bucket's state and store it. A lock
+        entry in the cache keeps workers from overwriting each other; if it
+        can't be had quickly the update goes ahead without it, which at
+        worst lets a request or two through early.
+        """
+        cache = self.cache
+        lock_key = f'{key}:lock'
+        locked = False
+        for _ in range(25):
+            if cache.add(lock_key, 1, timeout=2):
+                locked = True
+                break
+            time.sleep(0.002)
+        try:
+            now = time.time()
+            state = cache.get(key) or {'tokens': None, 'updated': now, 'factor': 1.0, 'strikes': 0, 'paused_until': 0.0}
+            result = func(state, now)
+            cache.set(key, state, timeout=max(3600, self.max_backoff * 2))
+            return result
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _refill(self, state, now, rate):
+        capacity = max(1.0, rate * self.burst * state['factor'])
+        if state['tokens'] is None:
+            state['tokens'] = capacity
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(capacity, state['tokens'] + elapsed * rate * state['factor'])
+        state['updated'] = now
+
+    def acquire(self, platform, identity=None):
+        """
+        Take a token for one upstream extraction, sleeping for it if the
+        wait is short. Raises RateLimited otherwise.
+        """
+        rate = self.rates.get(platform)
+        if not rate:
+            return
+        key = self.bucket_key(platform, identity)
+
+        def take(state, now):
+            self._refill(state, now, rate)
+            if state['factor'] < 1 or state['strikes']:
+                self._degraded.add(key)
+            else:
+                self._degraded.discard(key)
+            if state['paused_until'] > now:
+                return 'paused', state['paused_until'] - now
+            wait = (1 - state['tokens']) / (rate * state['factor'])
+            if wait > self.max_wait:
+                return 'rejected', wait
+            # Taken even when short: later callers queue up behind this one
+            state['tokens'] -= 1
+            return 'admitted', max(0.0, wait)
+
+        outcome, wait = self._update(key, take)
+        with self._lock:
+            if outcome == 'admitted':
+                self.admitted += 1
+                if wait:
+                    self.delayed += 1
+            else:
+                self.rejected += 1
+        if outcome != 'admitted':
+            raise RateLimited(platform, wait, backing_off=outcome == 'paused')
+        if wait:
+            time.sleep(wait)
+
+    def report_success(self, platform, identity=None):
+        key = self.bucket_key(platform, identity)
+        if not self.rates.get(platform) or key not in self._degraded:
+            return
+
+        def recover(state, now):
+            state['strikes'] = 0
+            state['factor'] = min(1.0, state['factor'] + RECOVERY_STEP)
+            if state['factor'] >= 1:
+                self._degraded.discard(key)
+
+        self._update(key, recover)
+
+    def report_failure(self, platform, error, identity=None):
+        """Back off when ``error`` shows the upstream is throttling us"""
+        if not self.rates.get(platform) or not is_throttle_error(error):
+            return
+        key = self.bucket_key(platform, identity)
+
+        def back_off(state, now):
+            if state['paused_until'] > now:
+                # Extractions that were already running when we backed off
+                return state['paused_until'] - now
+            state['strikes'] += 1
+            state['factor'] = max(self.min_factor, state['factor'] / 2)
+            state['tokens'] = min(state['tokens'] or 0.0, 0.0)
+            delay = min(self.backoff * 2 ** (state['strikes'] - 1), self.max_backoff)
+            state['paused_until'] = max(state['paused_until'], now + delay)
+            return delay
+
+        delay = self._update(key, back_off)
+        self._degraded.add(key)
+        with self._lock:
+            self.throttled += 1
+        print(f"{platform} is throttling extractions, backing off for {delay:.0f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'delayed': self.delayed,
+                'rejected': self.rejected,
+                'throttled': self.throttled,
+            }
+
+
+upstream_limiter = UpstreamLimiter(
+    rates=getattr(settings, 'RATE_LIMITS', {}) if getattr(settings, 'RATE_LIMIT_ENABLED', True) else {},
+    burst=getattr(settings, 'RATE_LIMIT_BURST', 2.0),
+    max_wait=getattr(settings, 'RATE_LIMIT_MAX_WAIT', 1.0),
+    backoff=getattr(settings, 'RATE_LIMIT_BACKOFF', 30),
+    max_backoff=getattr(settings, 'RATE_LIMIT_MAX_BACKOFF', 600),
+    per_identity=getattr(settings, 'RATE_LIMIT_PER_IDENTITY', False),
+)
@@ -0,0 +1,229 @@
+"""
+Keeps the stream URLs of popular videos resolved ahead of time.
+
+Every full lookup of a video counts towards its popularity, a hit count
+that halves every REFRESH_HALF_LIFE seconds. A background thread wakes
+every REFRESH_INTERVAL seconds and looks at the hottest videos (at most
+REFRESH_HOT_SIZE, each with at least REFRESH_MIN_HITS). Any that is
+cached and expires within REFRESH_LEAD seconds is refreshed before it
+does:
+
+- if its signed URLs are still good for longer than that, the cache
+  entry is just renewed;
+- if another worker already refreshed it, its info is taken from the
+  metadata store;
+- otherwise it is extracted again. A claim in the shared rate limit
+  cache makes sure only one worker does this.
+
+At most REFRESH_MAX_PER_CYCLE videos are extracted per cycle, one at a
+time, and through the upstream rate limiter. When the limiter refuses,
+the cycle ends, so refreshes never add to throttling. A video whose
+refresh failed (private, removed, blocked) is left alone for twice as many
+cycles after each failure in a row, up to REFRESH_MAX_BACKOFF cycles.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db import close_old_connections
+
+from .cache import add_fingerprint, extraction_cache
+from .expiry import seconds_until_expiry
+from .ratelimit import RateLimited
+from .store import metadata_store
+
+
+class Popularity:
+    """A hit count that decays with a half-life"""
+
+    __slots__ = ('score', 'updated', 'url', 'failures', 'retry_at')
+
+    def __init__(self, url, now):
+        self.score = 0.0
+        self.updated = now
+        self.url = url
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def value(self, now, half_life):
+        return self.score * 0.5 ** ((now - self.updated) / half_life)
+
+    def hit(self, now, half_life):
+        self.score = self.value(now, half_life) + 1
+        self.updated = now
+
+
+class RefreshScheduler:
+    def __init__(self, hot_size=50, min_hits=3, half_life=1800, interval=30, lead=900,
+                 max_per_cycle=5, max_tracked=2000, max_backoff=64):
+        self.hot_size = hot_size
+        self.min_hits = min_hits
+        self.half_life = half_life
+        self.interval = interval
+        self.lead = lead
+        self.max_per_cycle = max_per_cycle
+        self.max_tracked = max_tracked
+        self.max_backoff = max_backoff
+        self._videos = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.cycles = 0
+        self.renewed = 0
+        self.reused = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    def touch(self, key, url):
+        """Count a lookup of the video ``key``, resolvable from ``url``"""
+        if not getattr(settings, 'REFRESH_ENABLED', True):
+            return
+        now = time.monotonic()
+        with self._lock:
+            video = self._videos.get(key)
+            if video is None:
+                video = self._videos[key] = Popularity(url, now)
+            video.hit(now, self.half_life)
+            if len(self._videos) > self.max_tracked * 1.25:
+                self._prune(now)
+        self._ensure_thread()
+
+    def _prune(self, now):
+        ranked = sorted(self._videos.items(), key=lambda item: item[1].value(now, self.half_life), reverse=True)
+        self._videos = dict(ranked[:self.max_tracked])
+
+    def hot(self, now=None):
+        """``[(key, url)]`` of the hottest videos, most popular first"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            ranked = [
+                (video.value(now, self.half_life), key, video.url)
+                for key, video in self._videos.items()
+            ]
+        ranked = [item for item in ranked if item[0] >= self.min_hits]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [(key, url) for _, key, url in ranked[:self.hot_size]]
+
+    def due(self):
+        """
+        Hot, cached videos whose info expires within ``lead`` seconds,
+        except those backing off after failed refreshes
+        """
+        now = time.monotonic()
+        due = []
+        for key, url in self.hot(now):
+            if not self._may_retry(key, now):
+                continue
+            info, seconds_left = extraction_cache.peek(key)
+            # Uncached videos are extracted by the next request for them
+            if info is not None and seconds_left <= self.lead:
+                due.append((key, url, info))
+        return due
+
+    def _may_retry(self, key, now):
+        with self._lock:
+            video = self._videos.get(key)
+            return video is None or video.retry_at <= now
+
+    def _record(self, key, ok):
+        """Reset a video's backoff, or double it after a failed refresh"""
+        with self._lock:
+            video = self._videos.get(key)
+            if video is None:
+                return
+            if ok:
+                video.failures = 0
+                video.retry_at = 0.0
+            else:
+                video.failures += 1
+                cycles = min(2 ** video.failures, self.max_backoff)
+                video.retry_at = time.monotonic() + cycles * self.interval
+
+    def run_once(self):
+        """One refresh cycle. Returns the number of videos extracted."""
+        from .views import metadata_store_enabled, refresh_video
+
+        self.cycles += 1
+        extracted = 0
+        for key, url, info in self.due():
+            # Still-valid URLs only need their cache entry renewed
+            ttl = seconds_until_expiry(info, getattr(settings, 'METADATA_TTL', 6 * 3600))
+            if ttl > self.lead:
+                extraction_cache.set(key, info, ttl=min(ttl, extraction_cache.ttl))
+                self.renewed += 1
+                continue
+
+            if metadata_store_enabled():
+                stored, ttl = metadata_store.get(*key)
+                if stored is not None and ttl > self.lead:
+                    extraction_cache.set(key, add_fingerprint(stored), ttl=min(ttl, extraction_cache.ttl))
+                    self.reused += 1
+                    continue
+
+            if extracted >= self.max_per_cycle:
+                break
+            if not self.claim(key):
+                continue
+            extracted += 1
+            try:
+                refresh_video(key, url)
+                self.refreshed += 1
+                self._record(key, ok=True)
+            except RateLimited:
+                break
+            except Exception as e:
+                self.failed += 1
+                self._record(key, ok=False)
+                print(f"Refresh of {key[0]} {key[1]} failed: {e}")
+        return extracted
+
+    def claim(self, key):
+        """Make sure only one worker re-extracts a video per refresh"""
+        try:
+            cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'ratelimit')]
+        except InvalidCacheBackendError:
+            cache = caches['default']
+        return cache.add(f'refresh:{key[0]}:{key[1]}', 1, timeout=self.interval * 4)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='refresh', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not getattr(settings, 'REFRESH_ENABLED', True):
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Refresh cycle failed: {e}")
+            finally:
+                close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._videos)
+        return {
+            'tracked': tracked,
+            'hot': len(self.hot()),
+            'cycles': self.cycles,
+            'renewed': self.renewed,
+            'reused': self.reused,
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+        }
+
+
+refresh_scheduler = RefreshScheduler(
+    hot_size=getattr(settings, 'REFRESH_HOT_SIZE', 50),
+    min_hits=getattr(settings, 'REFRESH_MIN_HITS', 3),
+    half_life=getattr(settings, 'REFRESH_HALF_LIFE', 1800),
+    interval=getattr(settings, 'REFRESH_INTERVAL', 30),
+    lead=getattr(settings, 'REFRESH_LEAD', 900),
+    max_per_cycle=getattr(settings, 'REFRESH_MAX_PER_CYCLE', 5),
+    max_backoff=getattr(settings, 'REFRESH_MAX_BACKOFF', 64),
+)
@@ -0,0 +1,37 @@
+"""
+JSON encoding for API responses, backed by orjson when it is installed.
+
+FastJSONRenderer replaces DRF's JSONRenderer (which runs the stdlib
+encoder with indentation checks and unicode escaping on every call).
+``dumps`` is the same encoder for the views that write JSON themselves,
+like the NDJSON streams. Without orjson both fall back to the stdlib.
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Encode ``data`` as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        # The DRF encoder covers what orjson doesn't (Decimal, lazy strings, ...)
+        return orjson.dumps(data, default=_fallback_encoder.default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,147 @@
+"""
+URL routing: decide which platform a URL belongs to before any extraction.
+
+``route_url`` normalizes a user-supplied URL, identifies the platform and
+the canonical video ID, and rejects anything yt-dlp would only fail on
+(other sites, profile pages, malformed links) with ``UnsupportedURL``.
+Aliases of one video (youtu.be, /shorts/, m.youtube.com, tracking params)
+all route to the same canonical URL and cache key.
+"""
+import re
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+
+MAX_URL_LENGTH = 2048
+
+YOUTUBE_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}$')
+YOUTUBE_PLAYLIST_ID_RE = re.compile(r'[A-Za-z0-9_-]+$')
+INSTAGRAM_ID_RE = re.compile(r'[A-Za-z0-9_-]+$')
+
+# First path segment of a YouTube URL that carries the video ID in the second
+YOUTUBE_ID_PATHS = frozenset(('shorts', 'embed', 'live', 'v', 'e'))
+# First path segment of a YouTube channel URL
+YOUTUBE_COLLECTION_PATHS = frozenset(('channel', 'c', 'user'))
+# Instagram path segment before a post shortcode -> canonical segment
+INSTAGRAM_POST_PATHS = {'p': 'p', 'reel': 'reel', 'reels': 'reel', 'tv': 'tv'}
+
+
+class UnsupportedURL(ValueError):
+    """Raised for URLs that no extractor in this app can handle"""
+
+
+class Route(NamedTuple):
+    platform: str  # 'youtube' or 'instagram'
+    kind: str  # 'video' or 'collection'
+    video_id: str  # canonical video ID, playlist ID or channel path
+    url: str  # canonical URL to hand to yt-dlp
+
+    @property
+    def key(self):
+        """Stable cache key for the video or collection behind the URL"""
+        return (self.platform, self.video_id)
+
+
+def normalize_host(host):
+    host = host.lower().rstrip('.')
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def route_url(url):
+    """Return the ``Route`` for a URL, or raise ``UnsupportedURL``"""
+    if not isinstance(url, str):
+        raise UnsupportedURL('URL must be a string')
+    url = url.strip()
+    if not url or len(url) > MAX_URL_LENGTH or any(c.isspace() for c in url):
+        raise UnsupportedURL('Malformed URL')
+    if '://' not in url:
+        url = 'https://' + url
+
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+    except ValueError:
+        raise UnsupportedURL('Malformed URL')
+    if parts.scheme.lower() not in ('http', 'https'):
+        raise UnsupportedURL('Only http and https URLs are supported')
+
+    router = ROUTES.get(normalize_host(host))
+    if router is None:
+        raise UnsupportedURL('Only YouTube and Instagram URLs are supported')
+    return router([s for s in parts.path.split('/') if s], parts.query)
+
+
+def route_playlist(url):
+    """
+    Route a URL for playlist expansion. A watch URL opened from inside a
+    playlist (``watch?v=...&list=...``) routes to that playlist.
+    """
+    route = route_url(url)
+    if route.kind == 'collection':
+        return route
+    if route.platform == 'youtube':
+        playlist_id = parse_qs(urlsplit(url.strip()).query).get('list', [''])[0]
+        if playlist_id:
+            return route_youtube_playlist(playlist_id)
+    raise UnsupportedURL('Not a YouTube playlist or channel URL')
+
+
+def route_youtube(segments, query):
+    query = parse_qs(query)
+    first = segments[0] if segments else ''
+    if first == 'watch':
+        video_id = query.get('v', [''])[0]
+        if video_id:
+            return route_youtube_video(video_id)
+        playlist_id = query.get('list', [''])[0]
+        if playlist_id:
+            return route_youtube_playlist(playlist_id)
+        raise UnsupportedURL('YouTube URL has no video ID')
+    if first in YOUTUBE_ID_PATHS and len(segments) > 1:
+        return route_youtube_video(segments[1])
+    if first == 'playlist':
+        return route_youtube_playlist(query.get('list', [''])[0])
+    if first.startswith('@') or (first in YOUTUBE_COLLECTION_PATHS and len(segments) > 1):
+        # Channels and handles: keep the path, tabs like /videos included
+        path = '/'.join(segments)
+        return Route('youtube', 'collection', path, f'https://www.youtube.com/{path}')
+    raise UnsupportedURL('Not a YouTube video, playlist or channel URL')
+
+
+def route_youtu_be(segments, query):
+    return route_youtube_video(segments[0] if segments else '')
+
+
+def route_youtube_video(video_id):
+    if not YOUTUBE_ID_RE.match(video_id):
+        raise UnsupportedURL('Invalid YouTube video ID')
+    return Route('youtube', 'video', video_id, f'https://www.youtube.com/watch?v={video_id}')
+
+
+def route_youtube_playlist(playlist_id):
+    if not YOUTUBE_PLAYLIST_ID_RE.match(playlist_id):
+        raise UnsupportedURL('Invalid YouTube playlist ID')
+    return Route('youtube', 'collection', playlist_id, f'https://www.youtube.com/playlist?list={playlist_id}')
+
+
+def route_instagram(segments, query):
+    # /p/<code>/ or /<username>/p/<code>/
+    for i, segment in enumerate(segments[:2]):
+        kind = INSTAGRAM_POST_PATHS.get(segment)
+        if kind and i + 1 < len(segments) and INSTAGRAM_ID_RE.match(segments[i + 1]):
+            shortcode = segments[i + 1]
+            return Route('instagram', 'video', shortcode, f'https://www.instagram.com/{kind}/{shortcode}/')
+    raise UnsupportedURL('Not an Instagram post or reel URL')
+
+
+# Host, with www. and m. stripped -> router for its paths
+ROUTES = {
+    'youtube.com': route_youtube,
+    'music.youtube.com': route_youtube,
+    'youtube-nocookie.com': route_youtube,
+    'youtu.be': route_youtu_be,
+    'instagram.com': route_instagram,
+}
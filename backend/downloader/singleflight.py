@@ -0,0 +1,77 @@
+import threading
+
+from .metrics import stage
+
+
+class Flight:
+    """One in-progress call and the requests waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse identical concurrent calls into one.
+
+    The first caller for a key runs the function; callers that arrive
+    while it is still running block until it finishes and get the same
+    result, or the same exception.
+    """
+
+    def __init__(self, name='flight'):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.flights = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self._flights[key] = flight
+                self.flights += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            with stage(f'{self.name}_wait'):
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                self.max_waiters = max(self.max_waiters, flight.waiters)
+            flight.done.set()
+            if flight.waiters:
+                print(f"{self.name} {key}: shared with {flight.waiters} waiting request(s)")
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_progress': len(self._flights),
+                'waiting': sum(flight.waiters for flight in self._flights.values()),
+                'flights': self.flights,
+                'coalesced': self.coalesced,
+                'max_waiters': self.max_waiters,
+            }
+
+
+extraction_flights = SingleFlight('extraction')
@@ -0,0 +1,130 @@
+"""
+Persistent metadata store: the second-level cache behind extraction_cache.
+
+Reads go straight to the VideoMetadata table. Writes are queued and
+flushed in batches by one background thread, so a request never waits on
+a database write after an extraction. Every ``purge_every`` written rows
+the writer also deletes expired ones, so the table does not keep growing.
+"""
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+
+class MetadataStore:
+    def __init__(self, batch_size=50, flush_interval=0.5, purge_every=1000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.purge_every = purge_every
+        self._unpurged = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.purged = 0
+
+    def get(self, platform, video_id):
+        """
+        Return ``(info, seconds_left)`` for a stored info dict that has not
+        expired yet, or ``(None, 0)``.
+        """
+        from .models import VideoMetadata
+        row = (
+            VideoMetadata.objects
+            .filter(platform=platform, video_id=video_id, expires_at__gt=timezone.now())
+            .only('info', 'expires_at')
+            .first()
+        )
+        if row is None:
+            self.misses += 1
+            return None, 0
+        self.hits += 1
+        return row.info, (row.expires_at - timezone.now()).total_seconds()
+
+    def put(self, platform, video_id, info, ttl):
+        """Queue an info dict to be stored for ``ttl`` seconds"""
+        if ttl <= 0:
+            return
+        self._ensure_writer()
+        self._queue.put((platform, video_id, info, timezone.now() + timedelta(seconds=ttl)))
+
+    def invalidate(self, platform, video_id):
+        """Delete a stored info dict, e.g. one whose URLs stopped working"""
+        from .models import VideoMetadata
+        VideoMetadata.objects.filter(platform=platform, video_id=video_id).delete()
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='metadata-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            try:
+                self.flush(batch)
+            except Exception as e:
+                print(f"Metadata store write failed: {e}")
+            finally:
+                close_old_connections()
+
+    def flush(self, batch):
+        """Upsert a batch of queued writes in one query"""
+        from .models import VideoMetadata
+        # Later writes for the same video win
+        rows = {}
+        for platform, video_id, info, expires_at in batch:
+            rows[(platform, video_id)] = VideoMetadata(
+                platform=platform,
+                video_id=video_id,
+                info=info,
+                expires_at=expires_at,
+                updated_at=timezone.now(),
+            )
+        VideoMetadata.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['platform', 'video_id'],
+            update_fields=['info', 'expires_at', 'updated_at'],
+        )
+        self.written += len(rows)
+        self._unpurged += len(rows)
+        if self.purge_every and self._unpurged >= self.purge_every:
+            self._unpurged = 0
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Delete expired rows; returns how many were deleted"""
+        from .models import VideoMetadata
+        deleted = VideoMetadata.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+        self.purged += deleted
+        return deleted
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'written': self.written,
+            'purged': self.purged,
+            'queued': self._queue.qsize(),
+        }
+
+
+metadata_store = MetadataStore(
+    batch_size=getattr(settings, 'METADATA_STORE_BATCH_SIZE', 50),
+    flush_interval=getattr(settings, 'METADATA_STORE_FLUSH_INTERVAL', 0.5),
+    purge_every=getattr(settings, 'METADATA_STORE_PURGE_EVERY', 1000),
+)
@@ -0,0 +1,295 @@
+"""
+Adaptive choice between YouTube extraction strategies.
+
+A strategy is one way of asking YouTube for a video: a set of yt-dlp
+player clients, with or without the cookie pool. EXTRACTION_STRATEGIES
+lists the ones in use, in order of preference. Each keeps the outcome
+and latency of its last STRATEGY_WINDOW extractions (per mode, since
+lite and full extractions behave differently), and requests go to the
+strategy with the lowest expected time to a successful extraction:
+mean latency divided by success rate. Strategies without samples yet
+rank by their position in the list.
+
+Every strategy has a circuit breaker. STRATEGY_FAILURE_THRESHOLD failures
+in a row, or a failure rate over STRATEGY_FAILURE_RATE in a full window,
+trip it open. An open strategy gets no traffic for STRATEGY_OPEN_SECONDS
+(doubling each time a probe fails, up to STRATEGY_MAX_OPEN_SECONDS).
+After that a single request probes it: success closes the breaker and
+failure opens it again. When a strategy fails, the request moves on to
+the next one, up to STRATEGY_MAX_ATTEMPTS in all. When every breaker is
+open, requests fail at once with StrategiesUnavailable instead of
+waiting on a path that is known to be broken.
+
+Errors about the video itself (private, removed, ...) and HTTP 429
+throttling are not held against a strategy: a different client can't
+fix them, and the rate limiter deals with throttling. The bot check is:
+it sticks to a client and identity for a while, so it trips that
+strategy's breaker at once and the request moves on to the next one.
+"""
+import copy
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .ratelimit import RateLimited, is_bot_check, is_rate_limit_error
+
+
+# Errors that mean the video can't be had, whatever the strategy
+CONTENT_ERROR_MARKERS = (
+    'video unavailable',
+    'private video',
+    'has been removed',
+    'is not available',
+    'not available in your country',
+    'members-only',
+    'confirm your age',
+    'age-restricted',
+    'premieres in',
+    'unsupported url',
+    'incomplete youtube id',
+)
+
+# name: (yt-dlp player clients or None for yt-dlp's default, uses cookies)
+STRATEGIES = {
+    'default': (None, True),
+    'no_cookies': (None, False),
+    'tv': (['tv'], True),
+    'web_safari': (['web_safari'], True),
+    'mweb': (['mweb'], True),
+    'ios': (['ios'], False),
+    'android_vr': (['android_vr'], False),
+}
+
+
+def is_content_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in CONTENT_ERROR_MARKERS)
+
+
+class StrategiesUnavailable(RateLimited):
+    """Every extraction strategy is tripped open; retry after ``retry_after`` seconds"""
+
+    def __init__(self, platform, retry_after):
+        super().__init__(platform, retry_after, backing_off=True)
+        self.args = (f'No healthy extraction strategy for {platform}',)
+
+
+class Strategy:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, player_clients=None, cookies=True, window=20, failure_threshold=3,
+                 failure_rate=0.5, open_seconds=60, max_open_seconds=900):
+        self.name = name
+        self.player_clients = player_clients
+        self.cookies = cookies
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        # mode: deque of (ok, seconds)
+        self.outcomes = {}
+        self.window = window
+        self.state = self.CLOSED
+        self.open_until = 0.0
+        self.trips = 0
+        self.consecutive_failures = 0
+        self.probing = False
+
+    def apply(self, ydl_opts):
+        """``ydl_opts`` with this strategy's player clients"""
+        if not self.player_clients:
+            return ydl_opts
+        ydl_opts = copy.deepcopy(ydl_opts)
+        youtube_args = ydl_opts.setdefault('extractor_args', {}).setdefault('youtube', {})
+        youtube_args['player_client'] = list(self.player_clients)
+        return ydl_opts
+
+    def samples(self, mode):
+        return self.outcomes.setdefault(mode, deque(maxlen=self.window))
+
+    def expected_cost(self, mode, prior_latency):
+        """Expected seconds to a successful extraction"""
+        samples = self.samples(mode)
+        successes = [seconds for ok, seconds in samples if ok]
+        # Smoothed, so one early failure doesn't rule a strategy out
+        rate = (len(successes) + 1) / (len(samples) + 2)
+        latency = sum(successes) / len(successes) if successes else prior_latency
+        return latency / rate
+
+    def update(self, now):
+        """Half-open the breaker once its open period is over"""
+        if self.state == self.OPEN and now >= self.open_until:
+            self.state = self.HALF_OPEN
+            self.probing = False
+
+    def available(self):
+        """Whether a request may use this strategy now. Claims the probe of a half-open breaker."""
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def record(self, mode, ok, seconds, now):
+        samples = self.samples(mode)
+        samples.append((ok, seconds))
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                print(f"Extraction strategy {self.name} recovered")
+            self.state = self.CLOSED
+            self.probing = False
+            self.trips = 0
+            return
+
+        self.consecutive_failures += 1
+        failures = sum(1 for ok, _ in samples if not ok)
+        if (self.state == self.HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+                or (len(samples) == self.window and failures / len(samples) > self.failure_rate)):
+            self.trip(now)
+
+    def trip(self, now):
+        delay = min(self.open_seconds * 2 ** self.trips, self.max_open_seconds)
+        self.trips += 1
+        self.state = self.OPEN
+        self.open_until = now + delay
+        self.probing = False
+        print(f"Extraction strategy {self.name} tripped open for {delay}s")
+
+    def release_probe(self):
+        """A probe ended without telling anything about the strategy"""
+        self.probing = False
+
+    def stats(self):
+        samples = [sample for window in self.outcomes.values() for sample in window]
+        successes = [seconds for ok, seconds in samples if ok]
+        return {
+            'name': self.name,
+            'state': self.state,
+            'samples': len(samples),
+            'success_rate': round(len(successes) / len(samples), 3) if samples else None,
+            'mean_latency': round(sum(successes) / len(successes), 3) if successes else None,
+            'open_remaining': max(0, round(self.open_until - time.monotonic(), 1)) if self.state == self.OPEN else 0,
+        }
+
+
+class StrategySet:
+    def __init__(self, strategies, max_attempts=2, prior_latency=5.0):
+        self.strategies = list(strategies)
+        self.max_attempts = max_attempts
+        self.prior_latency = prior_latency
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+        self.rejected = 0
+
+    def choose(self, mode, exclude=()):
+        """The best available strategy, or None"""
+        with self._lock:
+            now = time.monotonic()
+            for strategy in self.strategies:
+                strategy.update(now)
+            # Half-open strategies first, so they get probed soon
+            ranked = sorted(
+                (s for s in self.strategies if s not in exclude),
+                key=lambda s: (s.state != Strategy.HALF_OPEN, s.expected_cost(mode, self.prior_latency)),
+            )
+            for strategy in ranked:
+                if strategy.available():
+                    return strategy
+        return None
+
+    def retry_after(self):
+        with self._lock:
+            now = time.monotonic()
+            return max(1, min(s.open_until - now for s in self.strategies))
+
+    def run(self, extract, ydl_opts, cookie_pool=None, mode='full', platform='youtube'):
+        """
+        Call ``extract(ydl_opts, cookie_pool)`` with the options of the best
+        strategy, falling back to the next best ones on failure
+        """
+        if not self.strategies:
+            return extract(ydl_opts, cookie_pool)
+        tried = []
+        last_error = None
+        while len(tried) < self.max_attempts:
+            strategy = self.choose(mode, exclude=tried)
+            if strategy is None:
+                break
+            if tried:
+                self.fallbacks += 1
+            tried.append(strategy)
+            started = time.monotonic()
+            try:
+                info = extract(strategy.apply(ydl_opts), cookie_pool if strategy.cookies else None)
+            except Exception as e:
+                if isinstance(e, RateLimited) or is_rate_limit_error(e) or is_content_error(e):
+                    with self._lock:
+                        strategy.release_probe()
+                    raise
+                with self._lock:
+                    now = time.monotonic()
+                    strategy.record(mode, False, now - started, now)
+                    if is_bot_check(e) and strategy.state != Strategy.OPEN:
+                        strategy.trip(now)
+                last_error = e
+                continue
+            with self._lock:
+                strategy.record(mode, True, time.monotonic() - started, time.monotonic())
+            return info
+
+        if last_error is not None:
+            raise last_error
+        self.rejected += 1
+        raise StrategiesUnavailable(platform, self.retry_after())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fallbacks': self.fallbacks,
+                'rejected': self.rejected,
+                'strategies': [strategy.stats() for strategy in self.strategies],
+            }
+
+    def gauges(self):
+        """Flat numeric stats for /metrics"""
+        stats = self.stats()
+        values = {'fallbacks': stats['fallbacks'], 'rejected': stats['rejected']}
+        for strategy in stats['strategies']:
+            values[f"{strategy['name']}_open"] = int(strategy['state'] != Strategy.CLOSED)
+            values[f"{strategy['name']}_samples"] = strategy['samples']
+            if strategy['success_rate'] is not None:
+                values[f"{strategy['name']}_success_rate"] = strategy['success_rate']
+            if strategy['mean_latency'] is not None:
+                values[f"{strategy['name']}_latency_seconds"] = strategy['mean_latency']
+        return values
+
+
+def build_strategies(names):
+    strategies = []
+    for name in names:
+        if name not in STRATEGIES:
+            print(f"Unknown extraction strategy {name}, ignored")
+            continue
+        player_clients, cookies = STRATEGIES[name]
+        strategies.append(Strategy(
+            name,
+            player_clients,
+            cookies,
+            window=getattr(settings, 'STRATEGY_WINDOW', 20),
+            failure_threshold=getattr(settings, 'STRATEGY_FAILURE_THRESHOLD', 3),
+            failure_rate=getattr(settings, 'STRATEGY_FAILURE_RATE', 0.5),
+            open_seconds=getattr(settings, 'STRATEGY_OPEN_SECONDS', 60),
+            max_open_seconds=getattr(settings, 'STRATEGY_MAX_OPEN_SECONDS', 900),
+        ))
+    return strategies
+
+
+youtube_strategies = StrategySet(
+    build_strategies(getattr(settings, 'EXTRACTION_STRATEGIES', ['default', 'tv', 'no_cookies'])),
+    max_attempts=getattr(settings, 'STRATEGY_MAX_ATTEMPTS', 2),
+)
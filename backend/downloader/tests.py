@@ -1,3 +1,1777 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import addModuleCleanup, mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import yt_dlp
+
+from .cache import ExtractionCache, extraction_cache, info_fingerprint, trim_info
+from .cookies import CookieJar, CookiePool
+from .executor import ExtractionExecutor, Overloaded
+from .expiry import seconds_until_expiry, url_expiry
+from .formats import FormatIndex, parse_quality, select_format
+from .jobs import fail_stale_jobs, run_merge_job, stream_spec
+from .media_cache import MediaCache, downloads_dir, parse_range
+from .models import VideoDownload, VideoMetadata
+from .ratelimit import RateLimited, UpstreamLimiter, upstream_limiter
+from .refresh import RefreshScheduler
+from .routing import UnsupportedURL, route_playlist, route_url
+from .segmented import SegmentError, SegmentedDownloader, fetch_format, split_ranges
+from .singleflight import SingleFlight
+from .store import MetadataStore, metadata_store
+from .strategies import StrategiesUnavailable, Strategy, StrategySet
+from .thumbnails import ThumbnailCache, thumbnail_cache
+from .transcode import TranscodeSlots, audio_plan, iter_transcode, transcode_slots
+from .views import resolve_youtube_format
+from .ydl_pool import YoutubeDLPool
+
+
+def make_format(format_id, height, ext='mp4', vcodec='avc1.4d401e', acodec='mp4a.40.2', tbr=None):
+    return {
+        'format_id': format_id,
+        'height': height,
+        'ext': ext,
+        'vcodec': vcodec,
+        'acodec': acodec,
+        'tbr': tbr,
+        'url': f'https://example.com/{format_id}',
+    }
+
+
+YOUTUBE_FORMATS = [
+    make_format('140', None, ext='m4a', vcodec='none'),
+    make_format('18', 360),
+    make_format('22', 720),
+    make_format('43', 360, ext='webm', vcodec='vp8', acodec='vorbis'),
+    make_format('137', 1080, vcodec='avc1.640028', acodec='none'),
+    make_format('248', 1080, ext='webm', vcodec='vp9', acodec='none'),
+]
+
+
+def setUpModule():
+    # Rate limit buckets in this process's cache, not in the file (or Redis)
+    # cache the deployed workers share, which would outlive the test run
+    rate_limit_cache = override_settings(RATE_LIMIT_CACHE='default')
+    rate_limit_cache.enable()
+    addModuleCleanup(rate_limit_cache.disable)
+
+
+class FormatSelectionTests(SimpleTestCase):
+    def test_parse_quality(self):
+        self.assertEqual(parse_quality('1080p'), 1080)
+        self.assertEqual(parse_quality('best'), 720)
+        self.assertEqual(parse_quality(None), 720)
+
+    def test_index_buckets(self):
+        index = FormatIndex(YOUTUBE_FORMATS)
+        self.assertEqual(index.heights, [1080, 720, 360])
+        self.assertEqual([f['format_id'] for f in index.by_height[360]], ['18', '43'])
+        self.assertEqual([f['format_id'] for f in index.by_codec['vp9']], ['248'])
+        self.assertNotIn('m4a', index.by_ext)
+
+    def test_selects_progressive_within_target(self):
+        self.assertEqual(select_format(YOUTUBE_FORMATS, '720p')['format_id'], '22')
+        self.assertEqual(select_format(YOUTUBE_FORMATS, '480p')['format_id'], '18')
+
+    def test_falls_back_to_best_progressive(self):
+        self.assertEqual(select_format(YOUTUBE_FORMATS, '144p')['format_id'], '22')
+
+    def test_falls_back_to_video_only(self):
+        formats = [f for f in YOUTUBE_FORMATS if f['format_id'] in ('137', '248')]
+        self.assertEqual(select_format(formats, '1080p')['format_id'], '137')
+
+    def test_no_video_formats(self):
+        self.assertIsNone(select_format(YOUTUBE_FORMATS[:1], '720p'))
+        self.assertIsNone(select_format(None, '720p'))
+
+    def test_prefers_direct_formats_over_manifests(self):
+        # The recorded info dict has HLS progressive formats up to 1080p,
+        # but the only single-file progressive format is 18 (360p)
+        fixture = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks', 'fixtures', 'youtube_video.json')
+        with open(fixture) as f:
+            formats = json.load(f)['formats']
+        for quality in ('1080p', '720p', '360p', 'best'):
+            fmt = select_format(formats, quality)
+            self.assertEqual(fmt['format_id'], '18', quality)
+            self.assertEqual(fmt['protocol'], 'https')
+
+    def test_manifests_only_as_last_resort(self):
+        formats = [dict(make_format('96', 1080), protocol='m3u8_native'), dict(make_format('sb0', 180), protocol='mhtml')]
+        self.assertEqual(select_format(formats, '720p')['format_id'], '96')
+        self.assertIsNone(select_format(formats[1:], '720p'))
+
+
+class ExtractionCacheTests(SimpleTestCase):
+    def test_entries_expire_after_ttl(self):
+        cache = ExtractionCache(ttl=60)
+        with mock.patch('downloader.cache.time.monotonic', return_value=1000):
+            cache.set(('youtube', 'a'), {'title': 'a'})
+            cache.set(('youtube', 'b'), {'title': 'b'}, ttl=5)
+        with mock.patch('downloader.cache.time.monotonic', return_value=1010):
+            self.assertEqual(cache.get(('youtube', 'a')), {'title': 'a'})
+            self.assertIsNone(cache.get(('youtube', 'b')))
+            self.assertEqual(cache.peek(('youtube', 'a'))[1], 50)
+        with mock.patch('downloader.cache.time.monotonic', return_value=1060):
+            self.assertIsNone(cache.get(('youtube', 'a')))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['expirations']), (0, 0, 2))
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ExtractionCache(max_entries=2)
+        cache.set(('youtube', 'a'), {'title': 'a'})
+        cache.set(('youtube', 'b'), {'title': 'b'})
+        cache.get(('youtube', 'a'))
+        cache.set(('youtube', 'c'), {'title': 'c'})
+        self.assertIsNone(cache.peek(('youtube', 'b'))[0])
+        self.assertIsNotNone(cache.peek(('youtube', 'a'))[0])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_budget(self):
+        info = {'title': 'x' * 100}
+        cache = ExtractionCache(max_bytes=250)
+        cache.set(('youtube', 'a'), info)
+        cache.set(('youtube', 'b'), info)
+        cache.set(('youtube', 'c'), info)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertLessEqual(cache.stats()['bytes'], 250)
+        self.assertIsNone(cache.get(('youtube', 'a')))
+        # Larger than the whole budget: never stored
+        cache.set(('youtube', 'd'), {'title': 'x' * 300})
+        self.assertIsNone(cache.get(('youtube', 'd')))
+
+    def test_invalidate(self):
+        cache = ExtractionCache()
+        for video_id in 'abc':
+            cache.set(('youtube', video_id), {'title': video_id})
+        cache.invalidate(('youtube', 'a'))
+        cache.invalidate(('youtube', 'missing'))
+        self.assertIsNone(cache.get(('youtube', 'a')))
+        self.assertEqual(cache.stats()['entries'], 2)
+        cache.invalidate()
+        self.assertEqual((cache.stats()['entries'], cache.stats()['bytes']), (0, 0))
+
+    def test_disabled_with_zero_ttl(self):
+        cache = ExtractionCache(ttl=0)
+        cache.set(('youtube', 'a'), {'title': 'a'})
+        self.assertIsNone(cache.get(('youtube', 'a')))
+
+    def test_links_to_one_video_share_a_key(self):
+        self.assertEqual(
+            extraction_cache.make_key('youtube', 'https://youtu.be/dQw4w9WgXcQ?si=x'),
+            extraction_cache.make_key('youtube', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+        )
+
+    def test_trim_info_keeps_entries_and_format_fields(self):
+        info = {
+            'title': 't', 'description': 'd', 'thumbnail': None,
+            'formats': [{'format_id': '18', 'url': 'u', 'fragments': [1, 2], 'filesize': None}],
+            'entries': [{'id': 'e', 'subtitles': {}}, None],
+        }
+        self.assertEqual(trim_info(info), {
+            'title': 't',
+            'formats': [{'format_id': '18', 'url': 'u'}],
+            'entries': [{'id': 'e'}],
+        })
+
+
+class CookiePoolTests(SimpleTestCase):
+    def make_pool(self, strategy='round_robin'):
+        return CookiePool([CookieJar(name, '') for name in 'abc'], strategy=strategy, cooldown=60)
+
+    def test_round_robin(self):
+        pool = self.make_pool()
+        self.assertEqual([pool.acquire().name for _ in range(4)], ['a', 'b', 'c', 'a'])
+
+    def test_least_recently_used(self):
+        pool = self.make_pool('lru')
+        first = pool.acquire()
+        self.assertNotEqual(pool.acquire().name, first.name)
+
+    def test_identity_error_cools_jar_down(self):
+        pool = self.make_pool()
+        jar = pool.acquire()
+        pool.report_failure(jar, Exception('Video unavailable'))
+        self.assertTrue(jar.is_healthy())
+        pool.report_failure(jar, Exception("Sign in to confirm you're not a bot"))
+        self.assertFalse(jar.is_healthy())
+        self.assertNotIn('a', [pool.acquire().name for _ in range(4)])
+
+    def test_health_check_shows_only_counts(self):
+        pool = self.make_pool()
+        pool.report_failure(pool.acquire(), Exception("Sign in to confirm you're not a bot"))
+        with mock.patch('backend.urls.get_cookie_pool', return_value=pool):
+            health = self.client.get('/').json()
+            metrics = self.client.get('/metrics').content.decode()
+        self.assertEqual(health['cookie_sets'], {'total': 3, 'healthy': 2, 'cooling_down': 1})
+        self.assertIn('vieurl_cookie_sets_a_healthy 0', metrics)
+
+    def test_rejected_cookies_cool_jar_down(self):
+        pool = self.make_pool()
+        jar = pool.acquire()
+        pool.report_failure(jar, Exception('The provided YouTube account cookies are no longer valid'))
+        self.assertFalse(jar.is_healthy())
+
+    def test_content_errors_leave_jar_healthy(self):
+        pool = self.make_pool()
+        jar = pool.acquire()
+        for message in (
+            'ERROR: [youtube] abc: Sign in to confirm your age. This video may be inappropriate for some users.',
+            "ERROR: [youtube] abc: Private video. Sign in if you've been granted access to this video. "
+            'Use --cookies-from-browser or --cookies for the authentication.',
+            'ERROR: [youtube] abc: Join this channel to get access to members-only content like this video. '
+            'Use --cookies-from-browser or --cookies for the authentication.',
+        ):
+            pool.report_failure(jar, Exception(message))
+            self.assertTrue(jar.is_healthy(), message)
+        self.assertEqual(jar.failures, 0)
+
+    def test_empty_pool(self):
+        self.assertIsNone(CookiePool([]).acquire())
+
+
+class YoutubeDLPoolTests(SimpleTestCase):
+    opts = {'quiet': True, 'extractor_args': {'youtube': {'player_client': ['web']}}}
+
+    def setUp(self):
+        self.pool = YoutubeDLPool(max_idle=2)
+
+    def test_instances_are_reused_after_release(self):
+        with self.pool.checkout(self.opts) as first:
+            # Checked out instances are never shared
+            with self.pool.checkout(self.opts) as second:
+                self.assertIsNot(second, first)
+        with self.pool.checkout(self.opts) as again:
+            self.assertIn(again, (first, second))
+        self.assertEqual(self.opts, {'quiet': True, 'extractor_args': {'youtube': {'player_client': ['web']}}})
+        self.assertEqual(self.pool.stats()['created'], 2)
+        self.assertEqual(self.pool.stats()['reused'], 1)
+        self.assertEqual(self.pool.stats()['idle'], 2)
+
+    def test_broken_instances_are_discarded(self):
+        with self.assertRaises(yt_dlp.utils.DownloadError):
+            with self.pool.checkout(self.opts) as kept:
+                raise yt_dlp.utils.DownloadError('Video unavailable')
+        with self.assertRaises(RuntimeError):
+            with self.pool.checkout(self.opts) as broken:
+                self.assertIs(broken, kept)
+                raise RuntimeError('interrupted mid-request')
+        with self.pool.checkout(self.opts) as fresh:
+            self.assertIsNot(fresh, broken)
+        self.assertEqual(self.pool.stats()['discarded'], 1)
+
+    def test_options_and_cookies_do_not_leak_between_requests(self):
+        android = {**self.opts, 'extractor_args': {'youtube': {'player_client': ['android']}}}
+        jar_a = CookieJar('a', '# Netscape HTTP Cookie File\n.youtube.com\tTRUE\t/\tTRUE\t0\tSID\ta\n')
+        jar_b = CookieJar('b', '# Netscape HTTP Cookie File\n.youtube.com\tTRUE\t/\tTRUE\t0\tSID\tb\n')
+        for opts, jar in [(self.opts, None), (android, None), (self.opts, jar_a), (self.opts, jar_b)]:
+            with self.pool.checkout(opts, jar):
+                pass
+
+        for opts, jar in [(self.opts, None), (android, None), (self.opts, jar_a), (self.opts, jar_b)]:
+            with self.pool.checkout(opts, jar) as ydl:
+                self.assertEqual(ydl.params['extractor_args'], opts['extractor_args'])
+                if jar is None:
+                    self.assertNotIn('cookiefile', ydl.params)
+                else:
+                    self.assertEqual(ydl.params['cookiefile'].getvalue(), jar.text)
+        self.assertEqual(self.pool.stats()['created'], 4)
+        self.assertEqual(self.pool.stats()['reused'], 4)
+
+
+class UpstreamLimiterTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def make_limiter(self, rate='1/h', **kwargs):
+        return UpstreamLimiter({'youtube': rate}, burst=3600, max_wait=0, backoff=30, cache_alias='default', **kwargs)
+
+    def test_cache_follows_the_setting(self):
+        self.assertIs(upstream_limiter.cache, caches['default'])
+        with override_settings(RATE_LIMIT_CACHE='ratelimit'):
+            self.assertIs(upstream_limiter.cache, caches['ratelimit'])
+
+    def test_bucket_is_shared_between_workers(self):
+        first, second = self.make_limiter(), self.make_limiter()
+        first.acquire('youtube')
+        with self.assertRaises(RateLimited) as raised:
+            second.acquire('youtube')
+        self.assertFalse(raised.exception.backing_off)
+        self.assertGreater(raised.exception.retry_after, 1)
+        # Platforms without a configured rate are not limited
+        second.acquire('instagram')
+
+    def test_throttle_errors_pause_and_slow_the_bucket(self):
+        limiter = self.make_limiter(rate='10/s')
+        limiter.report_failure('youtube', Exception('Video unavailable'))
+        limiter.acquire('youtube')
+
+        limiter.report_failure('youtube', Exception('HTTP Error 429: Too Many Requests'))
+        with self.assertRaises(RateLimited) as raised:
+            limiter.acquire('youtube')
+        self.assertTrue(raised.exception.backing_off)
+        self.assertEqual(raised.exception.retry_after, 30)
+        state = caches['default'].get('ratelimit:youtube')
+        self.assertEqual((state['strikes'], state['factor']), (1, 0.5))
+
+        state['paused_until'] = 0
+        caches['default'].set('ratelimit:youtube', state)
+        limiter.report_success('youtube')
+        state = caches['default'].get('ratelimit:youtube')
+        self.assertEqual(state['strikes'], 0)
+        self.assertAlmostEqual(state['factor'], 0.55)
+
+    def test_age_gate_does_not_pause_the_bucket(self):
+        limiter = self.make_limiter(rate='10/s')
+        limiter.report_failure('youtube', Exception(
+            'ERROR: [youtube] abc: Sign in to confirm your age. This video may be inappropriate for some users.'
+        ))
+        limiter.acquire('youtube')
+        self.assertEqual(limiter.stats()['throttled'], 0)
+
+        limiter.report_failure('youtube', Exception("ERROR: [youtube] abc: Sign in to confirm you're not a bot"))
+        with self.assertRaises(RateLimited):
+            limiter.acquire('youtube')
+
+    def test_per_identity_buckets(self):
+        limiter = self.make_limiter(per_identity=True)
+        limiter.acquire('youtube', 'cookies_1')
+        limiter.acquire('youtube', 'cookies_2')
+        with self.assertRaises(RateLimited):
+            limiter.acquire('youtube', 'cookies_1')
+
+    @override_settings(METADATA_STORE_ENABLED=False)
+    def test_views_shed_with_retry_after(self):
+        extraction_cache.invalidate()
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        for error, status_code in [(RateLimited('youtube', 2.5), 429), (RateLimited('youtube', 30, backing_off=True), 503)]:
+            with mock.patch('downloader.views.upstream_limiter.acquire', side_effect=error):
+                response = self.client.post('/api/extract-info/', {'url': url}, content_type='application/json')
+            self.assertEqual(response.status_code, status_code)
+            self.assertEqual(response['Retry-After'], str(error.retry_after))
+        self.assertEqual(response['Retry-After'], '30')
+
+
+class StrategySetTests(SimpleTestCase):
+    def make_set(self, *names, open_seconds=60):
+        return StrategySet(
+            [Strategy(name, [name] if name != 'default' else None, failure_threshold=2, open_seconds=open_seconds)
+             for name in names],
+            max_attempts=2,
+        )
+
+    def extractor(self, failing=(), error='Unable to extract player response'):
+        calls = []
+
+        def extract(ydl_opts, cookie_pool):
+            client = ydl_opts.get('extractor_args', {}).get('youtube', {}).get('player_client', ['default'])[0]
+            calls.append(client)
+            if client in failing:
+                raise Exception(error)
+            return {'id': 'x', 'client': client}
+        return extract, calls
+
+    def test_falls_back_and_learns(self):
+        strategies = self.make_set('default', 'tv', 'ios')
+        extract, calls = self.extractor(failing={'default'})
+        for _ in range(3):
+            self.assertEqual(strategies.run(extract, {})['client'], 'tv')
+        self.assertEqual(calls, ['default', 'tv', 'tv', 'tv'])
+        self.assertEqual(strategies.fallbacks, 1)
+
+    def test_failing_strategies_trip_open(self):
+        strategies = self.make_set('default', 'tv')
+        extract, calls = self.extractor(failing={'default', 'tv'})
+        for _ in range(2):
+            with self.assertRaisesMessage(Exception, 'Unable to extract'):
+                strategies.run(extract, {})
+        self.assertEqual([s.state for s in strategies.strategies], [Strategy.OPEN, Strategy.OPEN])
+        # Known broken: no more upstream calls
+        with self.assertRaises(StrategiesUnavailable):
+            strategies.run(extract, {})
+        self.assertEqual(len(calls), 4)
+
+    def test_bot_check_moves_on_to_the_next_strategy(self):
+        strategies = self.make_set('default', 'tv')
+        extract, calls = self.extractor(failing={'default'}, error="ERROR: [youtube] x: Sign in to confirm you're not a bot")
+        self.assertEqual(strategies.run(extract, {})['client'], 'tv')
+        self.assertEqual(calls, ['default', 'tv'])
+        self.assertEqual(strategies.strategies[0].state, Strategy.OPEN)
+
+    def test_http_429_stops_the_chain(self):
+        strategies = self.make_set('default', 'tv')
+        extract, calls = self.extractor(failing={'default'}, error='HTTP Error 429: Too Many Requests')
+        with self.assertRaises(Exception):
+            strategies.run(extract, {})
+        self.assertEqual(calls, ['default'])
+        self.assertEqual(strategies.strategies[0].state, Strategy.CLOSED)
+
+    @override_settings(METADATA_STORE_ENABLED=False)
+    def test_bot_check_pauses_the_platform_only_when_every_strategy_fails(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        strategies = self.make_set('default', 'tv')
+        extract, calls = self.extractor(failing={'default', 'tv'}, error="Sign in to confirm you're not a bot")
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        with mock.patch('downloader.views.youtube_strategies', strategies), \
+                mock.patch('downloader.views.run_extraction', side_effect=lambda url, opts, pool, **kwargs: extract(opts, pool)), \
+                mock.patch('downloader.views.upstream_limiter.report_failure') as report_failure:
+            self.client.post('/api/extract-info/', {'url': url}, content_type='application/json')
+        self.assertEqual(calls, ['default', 'tv'])
+        report_failure.assert_called_once()
+
+    def test_prefers_faster_strategy(self):
+        strategies = self.make_set('default', 'tv')
+        for _ in range(5):
+            strategies.strategies[0].record('full', True, 4.0, 0)
+            strategies.strategies[1].record('full', True, 1.0, 0)
+        self.assertEqual(strategies.choose('full').name, 'tv')
+        # Lite extractions are ranked on their own samples
+        self.assertEqual(strategies.choose('lite').name, 'default')
+
+    def test_video_errors_do_not_count(self):
+        strategies = self.make_set('default', 'tv')
+        extract, calls = self.extractor(failing={'default'}, error='ERROR: [youtube] x: Private video')
+        for _ in range(3):
+            with self.assertRaises(Exception):
+                strategies.run(extract, {})
+        self.assertEqual(calls, ['default'] * 3)
+        self.assertEqual(strategies.strategies[0].state, Strategy.CLOSED)
+
+    def test_fails_fast_when_all_open_and_probes_later(self):
+        strategies = self.make_set('default', 'tv')
+        for strategy in strategies.strategies:
+            strategy.trip(time.monotonic())
+        extract, calls = self.extractor()
+        with self.assertRaises(StrategiesUnavailable) as raised:
+            strategies.run(extract, {})
+        self.assertEqual(calls, [])
+        self.assertGreaterEqual(raised.exception.retry_after, 59)
+
+        strategies.strategies[1].open_until = 0
+        self.assertEqual(strategies.run(extract, {})['client'], 'tv')
+        self.assertEqual(strategies.strategies[1].state, Strategy.CLOSED)
+
+    def test_player_clients_merge_into_options(self):
+        opts = {'quiet': True, 'extractor_args': {'youtube': {'skip': ['dash', 'hls']}}}
+        applied = Strategy('tv', ['tv']).apply(opts)
+        self.assertEqual(applied['extractor_args']['youtube'], {'skip': ['dash', 'hls'], 'player_client': ['tv']})
+        self.assertNotIn('player_client', opts['extractor_args']['youtube'])
+
+    @override_settings(METADATA_STORE_ENABLED=False)
+    def test_view_answers_503_while_all_open(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        strategies = self.make_set('default')
+        strategies.strategies[0].trip(time.monotonic())
+        with mock.patch('downloader.views.youtube_strategies', strategies), \
+                mock.patch('downloader.views.run_extraction') as run_extraction:
+            response = self.client.post('/api/extract-info/', {'url': 'https://youtu.be/dQw4w9WgXcQ'}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        run_extraction.assert_not_called()
+
+
+class RoutingTests(SimpleTestCase):
+    def test_aliases_share_one_route(self):
+        urls = [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://youtu.be/dQw4w9WgXcQ?si=tracking',
+            'm.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42s',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+            'https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RDdQw4w9WgXcQ',
+        ]
+        routes = {route_url(url) for url in urls}
+        self.assertEqual(len(routes), 1)
+        route = routes.pop()
+        self.assertEqual(route.key, ('youtube', 'dQw4w9WgXcQ'))
+        self.assertEqual(route.url, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+
+    def test_instagram_posts(self):
+        route = route_url('https://www.instagram.com/someone/reels/C1a2b3c4d5E/?igsh=abc')
+        self.assertEqual(route.key, ('instagram', 'C1a2b3c4d5E'))
+        self.assertEqual(route.url, 'https://www.instagram.com/reel/C1a2b3c4d5E/')
+
+    def test_collections(self):
+        self.assertEqual(route_url('https://www.youtube.com/playlist?list=PLabc').kind, 'collection')
+        self.assertEqual(route_url('https://www.youtube.com/@handle/videos').url, 'https://www.youtube.com/@handle/videos')
+        self.assertEqual(route_playlist('https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLabc').video_id, 'PLabc')
+
+    def test_rejects_unsupported(self):
+        for url in ['', 'not a url', 'https://vimeo.com/123', 'ftp://youtube.com/watch?v=dQw4w9WgXcQ',
+                    'https://www.youtube.com/watch?v=short', 'https://www.instagram.com/someone/',
+                    'https://youtube.com.evil.example/watch?v=dQw4w9WgXcQ']:
+            with self.assertRaises(UnsupportedURL, msg=url):
+                route_url(url)
+
+    def test_views_reject_before_extraction(self):
+        with mock.patch('downloader.views.run_extraction') as run_extraction:
+            response = self.client.post('/api/extract-info/', {'url': 'https://example.com/video'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        run_extraction.assert_not_called()
+
+
+RAW_INFO = {
+    'id': 'dQw4w9WgXcQ',
+    'title': 'Preview',
+    'duration': 212,
+    'uploader': 'Channel',
+    'description': 'not needed',
+    'thumbnails': [
+        {'url': 'https://i.ytimg.com/hq.jpg', 'preference': -1},
+        {'url': 'https://i.ytimg.com/maxres.jpg', 'preference': 1},
+        {'url': 'https://i.ytimg.com/small.webp', 'preference': -10},
+    ],
+    'formats': YOUTUBE_FORMATS,
+}
+
+
+@override_settings(METADATA_STORE_ENABLED=False)
+class LiteModeTests(SimpleTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+
+    def post(self, **data):
+        return self.client.post('/api/extract-info/', dict(data, url=self.url), content_type='application/json')
+
+    def test_lite_skips_manifests_and_format_processing(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO)) as run_extraction:
+            response = self.post(mode='lite')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'title': 'Preview', 'thumbnail': 'https://i.ytimg.com/maxres.jpg', 'duration': 212, 'author': 'Channel',
+            'thumbnail_proxy': '/api/thumbnail/?url=https%3A%2F%2Fwww.youtube.com%2Fwatch%3Fv%3DdQw4w9WgXcQ',
+        })
+        args, kwargs = run_extraction.call_args
+        self.assertFalse(kwargs['process'])
+        self.assertEqual(args[1]['extractor_args'], {'youtube': {'skip': ['dash', 'hls']}})
+
+    def test_lite_reuses_full_extraction(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, thumbnail='t.jpg')) as run_extraction:
+            self.assertIn('formats', self.post().json())
+            response = self.post(fields='title,duration')
+        self.assertEqual(response.json(), {'title': 'Preview', 'duration': 212})
+        self.assertEqual(run_extraction.call_count, 1)
+
+    def test_full_request_does_not_use_lite_result(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO)) as run_extraction:
+            self.post(mode='lite')
+            self.assertTrue(self.post().json()['formats'])
+        self.assertEqual(run_extraction.call_count, 2)
+
+    def test_unknown_options_are_rejected(self):
+        self.assertEqual(self.post(mode='tiny').status_code, 400)
+        self.assertEqual(self.post(fields=['title', 'secret']).status_code, 400)
+
+
+# Instagram signs its URLs with a hex expiry time (``oe``)
+INSTAGRAM_OE = f'{int(time.time()) + 3600:X}'
+
+
+def instagram_video(index, filesize=None):
+    url = f'https://scontent.cdninstagram.com/v{index}.mp4?oe={INSTAGRAM_OE}'
+    return {
+        'id': f'C9z8y7x6w5V_{index}', 'title': 'Video by someone', 'uploader': 'Someone', 'duration': 15.3,
+        'thumbnail': f'https://scontent.cdninstagram.com/t{index}.jpg', 'url': url, 'ext': 'mp4',
+        'width': 720, 'height': 1280, 'filesize': None,
+        'formats': [
+            {'format_id': 'dash-0v', 'url': f'{url}&dash=v', 'ext': 'mp4', 'height': 1920, 'vcodec': 'avc1', 'acodec': 'none', 'protocol': 'https'},
+            {'format_id': 'dash-a', 'url': f'{url}&dash=a', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'protocol': 'https'},
+            {'format_id': '8', 'url': url, 'ext': 'mp4', 'height': 1280, 'protocol': 'https', 'filesize': filesize},
+        ],
+    }
+
+
+INSTAGRAM_CAROUSEL = {
+    '_type': 'playlist',
+    'id': 'C9z8y7x6w5V',
+    'title': 'Post by someone',
+    'entries': [
+        instagram_video(0),
+        {
+            'id': 'C9z8y7x6w5V_1', 'title': 'Video by someone', 'url': None, 'formats': [], 'filesize': None,
+            'thumbnail': f'https://scontent.cdninstagram.com/p1.webp?oe={INSTAGRAM_OE}', 'width': 1080, 'height': 1350,
+        },
+        instagram_video(2, filesize=3 * 1024 * 1024),
+    ],
+}
+
+
+@override_settings(METADATA_STORE_ENABLED=False)
+class InstagramCarouselTests(SimpleTestCase):
+    url = 'https://www.instagram.com/p/C9z8y7x6w5V/'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        extraction = mock.patch('downloader.views.run_extraction', return_value=INSTAGRAM_CAROUSEL)
+        self.run_extraction = extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def post(self, path, **data):
+        return self.client.post(path, dict(data, url=self.url), content_type='application/json')
+
+    def test_one_extraction_covers_every_item(self):
+        info = self.post('/api/extract-info/').json()
+        self.assertEqual(info['title'], 'Video by someone')
+        self.assertEqual(info['formats'], [{'quality': 'Download'}])
+        self.assertEqual([item['type'] for item in info['items']], ['video', 'image', 'video'])
+
+        video, image, sized = info['items']
+        self.assertEqual(video['url'], f'https://scontent.cdninstagram.com/v0.mp4?oe={INSTAGRAM_OE}')
+        self.assertNotIn('filesize', video)
+        self.assertEqual(video['formats'], [{'quality': '1280p', 'url': video['url'], 'extension': 'mp4'}])
+        self.assertEqual(image['url'], f'https://scontent.cdninstagram.com/p1.webp?oe={INSTAGRAM_OE}')
+        self.assertEqual(image['extension'], 'webp')
+        self.assertEqual(sized['filesize'], 3.0)
+
+        download = self.post('/api/download/', item=2).json()
+        self.assertEqual(download['download_url'], sized['url'])
+        self.assertEqual(download['filesize'], 3.0)
+        self.assertEqual(download['items'], info['items'])
+        self.assertEqual(self.post('/api/download/', item=1).json()['download_url'], image['url'])
+        self.assertEqual(self.run_extraction.call_count, 1)
+
+    def test_unknown_sizes_and_items(self):
+        download = self.post('/api/download/').json()
+        self.assertEqual(download['download_url'], f'https://scontent.cdninstagram.com/v0.mp4?oe={INSTAGRAM_OE}')
+        self.assertIsNone(download['filesize'])
+        self.assertEqual(self.post('/api/download/', item=3).status_code, 400)
+        self.assertEqual(self.post('/api/download/', item='second').status_code, 400)
+
+
+@override_settings(METADATA_STORE_ENABLED=False)
+class ConditionalGetTests(SimpleTestCase):
+    path = '/api/extract-info/?url=https%3A%2F%2Fwww.youtube.com%2Fwatch%3Fv%3DdQw4w9WgXcQ'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+
+    def test_etag_and_not_modified(self):
+        expire = int(time.time()) + 1200
+        formats = [dict(fmt, url=f"{fmt['url']}?expire={expire}") for fmt in YOUTUBE_FORMATS]
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, formats=formats)) as run_extraction:
+            response = self.client.get(self.path)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            max_age = int(response['Cache-Control'].split('max-age=')[1])
+            # Shortly before the signed URLs expire, not the configured hour
+            self.assertTrue(800 < max_age <= 900, max_age)
+
+            with mock.patch('downloader.views.youtube_quality_options') as quality_options:
+                cached = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.content, b'')
+            self.assertEqual(cached['ETag'], etag)
+            quality_options.assert_not_called()
+
+            other = self.client.get(self.path + '&mode=lite', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(other.status_code, 200)
+            self.assertNotEqual(other['ETag'], etag)
+        self.assertEqual(run_extraction.call_count, 1)
+
+    @override_settings(METADATA_STORE_ENABLED=True)
+    def test_fingerprint_is_set_before_the_info_is_shared(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO)), \
+                mock.patch('downloader.views.metadata_store') as store:
+            store.get.return_value = (None, 0)
+            etag = self.client.get(self.path)['ETag']
+        cached = extraction_cache.peek(('youtube', 'dQw4w9WgXcQ'))[0]
+        stored = store.put.call_args.args[2]
+        self.assertIs(stored, cached)
+        self.assertIn('_fingerprint', cached)
+
+        # Serving it again reads the fingerprint but never writes to the dict
+        before = dict(cached)
+        self.assertEqual(self.client.get(self.path)['ETag'], etag)
+        self.assertEqual(cached, before)
+        plain = {'title': 'x'}
+        info_fingerprint(plain)
+        self.assertEqual(plain, {'title': 'x'})
+
+    def test_redirects_to_canonical_query(self):
+        response = self.client.get('/api/extract-info/', {'url': 'https://youtu.be/dQw4w9WgXcQ?si=x', 'mode': 'full'})
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], self.path)
+        response = self.client.get('/api/extract-info/', {'url': 'https://youtu.be/dQw4w9WgXcQ', 'fields': 'title,duration'})
+        self.assertEqual(response['Location'], self.path + '&fields=title%2Cduration')
+        self.assertEqual(self.client.get('/api/extract-info/', {'url': 'https://vimeo.com/1'}).status_code, 400)
+
+
+def fake_extraction(slow=(), failing=()):
+    """A run_extraction stand-in: RAW_INFO per video ID, slow or failing for some"""
+    def extract(url, ydl_opts, cookie_pool=None, **kwargs):
+        video_id = route_url(url).video_id
+        if video_id in slow:
+            time.sleep(0.3)
+        if video_id in failing:
+            raise Exception('ERROR: [youtube] Unable to extract player response')
+        return dict(RAW_INFO, id=video_id, title=f'Video {video_id}')
+    return extract
+
+
+async def read_ndjson(response):
+    lines = [line async for line in response.streaming_content]
+    return [json.loads(line) for line in b''.join(lines).splitlines()]
+
+
+@override_settings(METADATA_STORE_ENABLED=False, EXTRACTION_STRATEGIES_ENABLED=False)
+class BatchExtractionTests(SimpleTestCase):
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+
+    def batch(self, urls, **data):
+        return self.async_client.post('/api/extract-info/batch/', dict(data, urls=urls), content_type='application/json')
+
+    async def test_one_bad_url_does_not_fail_the_rest(self):
+        urls = [
+            'https://youtu.be/aaaaaaaaaaa',
+            'https://youtu.be/bbbbbbbbbbb',
+            'https://vimeo.com/1',
+            'https://youtu.be/ccccccccccc',
+        ]
+        with mock.patch('downloader.views.run_extraction', side_effect=fake_extraction(failing={'bbbbbbbbbbb'})):
+            response = await self.batch(urls, mode='lite')
+            results = await read_ndjson(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        by_index = {result['index']: result for result in results}
+        self.assertEqual(sorted(by_index), [0, 1, 2, 3])
+        self.assertEqual([by_index[i]['ok'] for i in range(4)], [True, False, False, True])
+        self.assertEqual(by_index[0]['data']['title'], 'Video aaaaaaaaaaa')
+        self.assertEqual(by_index[1]['url'], urls[1])
+        self.assertIn('error', by_index[2])
+
+    async def test_results_stream_as_they_complete(self):
+        urls = ['https://youtu.be/aaaaaaaaaaa', 'https://youtu.be/bbbbbbbbbbb']
+        with mock.patch('downloader.views.run_extraction', side_effect=fake_extraction(slow={'aaaaaaaaaaa'})):
+            response = await self.batch(urls, fields='title')
+            results = await read_ndjson(response)
+        self.assertEqual([result['index'] for result in results], [1, 0])
+        self.assertEqual(results[0]['data'], {'title': 'Video bbbbbbbbbbb'})
+
+    @override_settings(BATCH_MAX_URLS=2)
+    async def test_rejects_oversized_and_malformed_batches(self):
+        with mock.patch('downloader.views.run_extraction') as run_extraction:
+            self.assertEqual((await self.batch(['https://youtu.be/aaaaaaaaaaa'] * 3)).status_code, 400)
+            self.assertEqual((await self.batch([])).status_code, 400)
+            self.assertEqual((await self.batch(['https://youtu.be/aaaaaaaaaaa', 7])).status_code, 400)
+            self.assertEqual((await self.batch(['https://youtu.be/aaaaaaaaaaa'], mode='tiny')).status_code, 400)
+        run_extraction.assert_not_called()
+
+
+def fake_playlist(url, max_entries, cookie_pool=None):
+    yield {'type': 'playlist', 'id': 'PL1', 'title': 'Mix', 'author': 'Channel'}
+    for index, video_id in enumerate(['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc'][:max_entries]):
+        yield {
+            'type': 'entry', 'index': index, 'id': video_id, 'title': f'Video {video_id}', 'duration': 60,
+            'thumbnail': None, 'url': f'https://www.youtube.com/watch?v={video_id}',
+        }
+
+
+@override_settings(METADATA_STORE_ENABLED=False, EXTRACTION_STRATEGIES_ENABLED=False)
+class PlaylistViewTests(SimpleTestCase):
+    url = 'https://www.youtube.com/playlist?list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        playlist = mock.patch('downloader.views.iter_playlist', side_effect=fake_playlist)
+        playlist.start()
+        self.addCleanup(playlist.stop)
+
+    async def expand(self, **data):
+        response = await self.async_client.post('/api/playlist/', dict(data, url=self.url), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Never hang a test run on a stream that doesn't end
+        return await asyncio.wait_for(read_ndjson(response), timeout=10)
+
+    async def test_lists_entries_without_resolving_them(self):
+        with mock.patch('downloader.views.run_extraction') as run_extraction:
+            lines = await self.expand()
+        self.assertEqual([line['type'] for line in lines], ['playlist', 'entry', 'entry', 'entry', 'end'])
+        self.assertEqual(lines[1]['url'], 'https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        self.assertEqual(lines[-1]['count'], 3)
+        run_extraction.assert_not_called()
+
+    async def test_failed_entries_are_reported_per_video(self):
+        with mock.patch('downloader.views.run_extraction', side_effect=fake_extraction(failing={'bbbbbbbbbbb'})):
+            lines = await self.expand(resolve=2)
+        videos = {line['index']: line for line in lines if line['type'] == 'video'}
+        self.assertEqual(sorted(videos), [0, 1])
+        self.assertTrue(videos[0]['ok'])
+        self.assertFalse(videos[1]['ok'])
+        self.assertEqual(lines[-1], {'type': 'end', 'count': 3})
+
+    async def test_stream_ends_when_a_resolve_task_dies(self):
+        with mock.patch('downloader.views.resolve_batch_item', side_effect=RuntimeError('executor gone')):
+            lines = await self.expand(resolve=3)
+        videos = [line for line in lines if line['type'] == 'video']
+        self.assertEqual(len(videos), 3)
+        self.assertFalse(any(video['ok'] for video in videos))
+        self.assertEqual(lines[-1]['type'], 'end')
+
+
+@override_settings(METADATA_STORE_ENABLED=False, GZIP_MIN_BYTES=200)
+class ResponseEncodingTests(SimpleTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+
+    def test_trimmed_formats_are_gzipped(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, title='Preview ' * 20)):
+            response = self.client.post(
+                '/api/extract-info/', {'url': self.url}, content_type='application/json', HTTP_ACCEPT_ENCODING='gzip',
+            )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['formats'], [
+            {'quality': '1080p', 'extension': 'mp4'},
+            {'quality': '720p', 'extension': 'mp4'},
+            {'quality': '360p', 'extension': 'mp4'},
+        ])
+
+    def test_gzipped_responses_keep_a_strong_etag(self):
+        path = '/api/extract-info/?url=https%3A%2F%2Fwww.youtube.com%2Fwatch%3Fv%3DdQw4w9WgXcQ'
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, title='Preview ' * 200)):
+            plain = self.client.get(path)
+            response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            etag = response['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            self.assertEqual(etag, plain['ETag'][:-1] + '-gz"')
+
+            cached = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached['ETag'], etag)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+
+    async def test_streams_are_not_compressed(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, title='Preview ' * 20)):
+            response = await self.async_client.post(
+                '/api/extract-info/batch/', {'urls': [self.url] * 3}, content_type='application/json',
+                HTTP_ACCEPT_ENCODING='gzip',
+            )
+            lines = [line async for line in response.streaming_content]
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(json.loads(line)['ok'] for line in lines))
+
+
+@override_settings(METADATA_STORE_ENABLED=False)
+class MetricsTests(SimpleTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+
+    def test_server_timing_lists_request_stages(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO)):
+            response = self.client.post('/api/extract-info/', {'url': self.url}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        for name in ('route', 'cache', 'trim', 'formats', 'render'):
+            self.assertIn(name, stages)
+        self.assertEqual(stages[-1], 'total')
+
+    def test_metrics_endpoint(self):
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO)):
+            self.client.post('/api/extract-info/', {'url': self.url}, content_type='application/json')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('vieurl_responses_total{view="extract_info",platform="youtube",status="2xx"}', body)
+        self.assertIn('vieurl_stage_duration_seconds_count{stage="route"}', body)
+        self.assertIn('vieurl_extraction_cache_hits', body)
+
+    def test_health_and_metrics_leave_the_disk_alone(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), mock.patch.object(thumbnail_cache, '_bytes', None), \
+                mock.patch.object(ThumbnailCache, '_scan', return_value=[]) as scan:
+            self.assertEqual(self.client.get('/').status_code, 200)
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        scan.assert_not_called()
+        self.assertEqual(os.listdir(media_root), [])
+
+
+def signed_info(expires_in, title='Preview'):
+    expire = int(time.time() + expires_in)
+    return dict(RAW_INFO, title=title, formats=[dict(fmt, url=f"{fmt['url']}?expire={expire}") for fmt in YOUTUBE_FORMATS])
+
+
+@override_settings(METADATA_STORE_ENABLED=False, RATE_LIMIT_CACHE='default')
+@mock.patch.object(RefreshScheduler, '_ensure_thread')
+class RefreshSchedulerTests(SimpleTestCase):
+    url = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    key = ('youtube', 'dQw4w9WgXcQ')
+
+    def setUp(self):
+        caches['default'].clear()
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        self.scheduler = RefreshScheduler(min_hits=2, half_life=60, lead=900)
+
+    def test_popularity_ranking_decays(self, ensure_thread):
+        for _ in range(3):
+            self.scheduler.touch(self.key, self.url)
+        self.scheduler.touch(('youtube', 'cold0000000'), 'https://www.youtube.com/watch?v=cold0000000')
+        self.assertEqual(self.scheduler.hot(), [(self.key, self.url)])
+        self.assertEqual(self.scheduler.hot(time.monotonic() + 60), [])
+
+    def test_valid_urls_only_renew_the_cache_entry(self, ensure_thread):
+        for _ in range(3):
+            self.scheduler.touch(self.key, self.url)
+        extraction_cache.set(self.key, trim_info(signed_info(7200)), ttl=60)
+        with mock.patch('downloader.views.refresh_video') as refresh_video:
+            self.assertEqual(self.scheduler.run_once(), 0)
+        refresh_video.assert_not_called()
+        self.assertGreater(extraction_cache.peek(self.key)[1], 1000)
+        self.assertEqual(self.scheduler.renewed, 1)
+
+    def test_expiring_urls_are_extracted_once(self, ensure_thread):
+        for _ in range(3):
+            self.scheduler.touch(self.key, self.url)
+        extraction_cache.set(self.key, trim_info(signed_info(900)), ttl=600)
+        with mock.patch('downloader.views.run_extraction', return_value=signed_info(6 * 3600, title='Fresh')) as run_extraction:
+            self.assertEqual(self.scheduler.run_once(), 1)
+            # Another worker's scheduler finds the claim taken
+            other = RefreshScheduler(min_hits=0.5)
+            other.touch(self.key, self.url)
+            extraction_cache.set(self.key, trim_info(signed_info(900)), ttl=600)
+            self.assertEqual(other.due()[0][0], self.key)
+            self.assertEqual(other.run_once(), 0)
+        self.assertEqual(extraction_cache.peek(self.key)[0]['title'], 'Preview')
+        self.assertEqual(run_extraction.call_count, 1)
+
+    def test_uncached_videos_are_left_to_requests(self, ensure_thread):
+        for _ in range(3):
+            self.scheduler.touch(self.key, self.url)
+        self.assertEqual(self.scheduler.due(), [])
+
+    @override_settings(EXTRACTION_STRATEGIES_ENABLED=False)
+    def test_failing_refreshes_back_off(self, ensure_thread):
+        for _ in range(3):
+            self.scheduler.touch(self.key, self.url)
+        extraction_cache.set(self.key, trim_info(signed_info(900)), ttl=600)
+        with mock.patch('downloader.views.run_extraction', side_effect=Exception('ERROR: Private video')), \
+                mock.patch.object(self.scheduler, 'claim', return_value=True):
+            self.assertEqual(self.scheduler.run_once(), 1)
+            self.assertEqual(self.scheduler.run_once(), 0)
+            self.assertEqual(self.scheduler.failed, 1)
+
+            # Skipped for two cycles after the first failure, four after the second
+            video = self.scheduler._videos[self.key]
+            self.assertAlmostEqual(video.retry_at - time.monotonic(), 2 * self.scheduler.interval, delta=1)
+            video.retry_at = 0.0
+            self.assertEqual(self.scheduler.run_once(), 1)
+            self.assertAlmostEqual(video.retry_at - time.monotonic(), 4 * self.scheduler.interval, delta=1)
+
+        with mock.patch('downloader.views.run_extraction', return_value=signed_info(6 * 3600, title='Fresh')), \
+                mock.patch.object(self.scheduler, 'claim', return_value=True):
+            video.retry_at = 0.0
+            self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual((video.failures, video.retry_at), (0, 0.0))
+        self.assertEqual(self.scheduler.failed, 2)
+
+
+class ExtractionExecutorTests(SimpleTestCase):
+    def test_rejects_beyond_workers_and_queue(self):
+        executor = ExtractionExecutor(max_workers=1, max_queue=1, retry_after=7)
+        release = threading.Event()
+        futures = [executor.submit(release.wait, 5) for _ in range(2)]
+        with self.assertRaises(Overloaded) as raised:
+            executor.submit(release.wait, 5)
+        self.assertEqual(raised.exception.retry_after, 7)
+        release.set()
+        for future in futures:
+            future.result()
+        executor.submit(lambda: None).result()
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_cancelled_caller_keeps_slot_until_thread_is_done(self):
+        executor = ExtractionExecutor(max_workers=1, max_queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def extract():
+            started.set()
+            release.wait(5)
+
+        async def disconnect():
+            task = asyncio.ensure_future(executor.run(extract))
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The extraction still runs on its thread, so it still counts
+            self.assertEqual(executor.stats()['in_flight'], 1)
+            with self.assertRaises(Overloaded):
+                await executor.run(extract)
+
+        asyncio.run(disconnect())
+        release.set()
+        for _ in range(100):
+            if executor.stats()['in_flight'] == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(executor.stats()['in_flight'], 0)
+
+    def test_view_answers_503_with_retry_after(self):
+        with mock.patch('downloader.views.extraction_executor.run', new_callable=mock.AsyncMock, side_effect=Overloaded(7)):
+            response = self.client.post('/api/extract-info/', {'url': 'https://youtu.be/dQw4w9WgXcQ'}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, flight, func, count=5):
+        results = []
+
+        def call():
+            try:
+                results.append(flight.do('key', func))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_result(self):
+        calls = []
+
+        def extract():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'title': 'shared'}
+
+        flight = SingleFlight()
+        results = self.run_concurrently(flight, extract)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'title': 'shared'}] * 5)
+        self.assertEqual(flight.stats()['max_waiters'], 4)
+
+    def test_failures_are_shared(self):
+        def extract():
+            time.sleep(0.1)
+            raise ValueError('upstream failed')
+
+        results = self.run_concurrently(SingleFlight(), extract)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB of synthetic media
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for a media host: serves PAYLOAD with Range support"""
+
+    def do_GET(self):
+        start, end = 0, len(PAYLOAD) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(PAYLOAD)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self.wfile.write(PAYLOAD[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+class MediaServerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        cls.media_url = f'http://127.0.0.1:{cls.server.server_port}/media.mp4'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+async def read_streaming(response):
+    if response.is_async:
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return b''.join(response.streaming_content)
+
+
+def read_body(response):
+    """read_streaming for responses from the sync test client"""
+    return async_to_sync(read_streaming)(response)
+
+
+class ProxyViewTests(MediaServerMixin, TransactionTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, MEDIA_CACHE_MAX_FILE_BYTES=len(PAYLOAD))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def resolved(self):
+        return mock.patch(
+            'downloader.views.resolve_stream',
+            return_value=('clip.mp4', {'url': self.media_url, 'ext': 'mp4', 'format_id': '18'}),
+        )
+
+    async def test_streams_whole_file(self):
+        with self.resolved():
+            response = await self.async_client.get('/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'})
+            body = await read_streaming(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, PAYLOAD)
+        self.assertEqual(response['Content-Length'], str(len(PAYLOAD)))
+        self.assertIn('attachment; filename="clip.mp4"', response['Content-Disposition'])
+
+    async def test_passes_range_through(self):
+        with self.resolved():
+            response = await self.async_client.get(
+                '/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'}, headers={'Range': 'bytes=1000-1999'},
+            )
+            body = await read_streaming(response)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, PAYLOAD[1000:2000])
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(PAYLOAD)}')
+
+    async def test_unsatisfiable_range(self):
+        with self.resolved():
+            response = await self.async_client.get(
+                '/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'}, headers={'Range': f'bytes={len(PAYLOAD)}-'},
+            )
+        self.assertEqual(response.status_code, 416)
+
+    async def test_full_download_is_cached(self):
+        with self.resolved():
+            response = await self.async_client.get('/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'})
+            await read_streaming(response)
+            row = await VideoDownload.objects.aget(video_id='aaaaaaaaaaa', format_id='18')
+            self.assertEqual(row.size, len(PAYLOAD))
+
+            # Served from disk now, including ranges
+            with mock.patch('downloader.views.open_upstream') as open_upstream:
+                response = await self.async_client.get(
+                    '/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'}, headers={'Range': 'bytes=-100'},
+                )
+                body = await read_streaming(response)
+                full = await self.async_client.get('/api/proxy/', {'url': 'https://youtu.be/aaaaaaaaaaa'})
+                full_body = await read_streaming(full)
+            open_upstream.assert_not_called()
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, PAYLOAD[-100:])
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(full_body, PAYLOAD)
+        self.assertEqual(full['Content-Length'], str(len(PAYLOAD)))
+        # Streamed chunk by chunk; a sync iterator would be buffered whole under ASGI
+        self.assertTrue(response.is_async)
+        self.assertTrue(full.is_async)
+
+
+class MediaCacheTests(TransactionTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = MediaCache(max_bytes=250)
+
+    def store(self, video_id, content):
+        path = os.path.join(downloads_dir(), f'{video_id}.part')
+        with open(path, 'wb') as f:
+            f.write(content)
+        digest = hashlib.sha256(content).hexdigest()
+        return self.cache.store(path, digest, 'mp4', url='https://youtu.be/x', title=video_id, quality='360p', video_id=video_id, format_id='18')
+
+    def test_identical_content_is_stored_once(self):
+        first = self.store('a', b'x' * 100)
+        second = self.store('b', b'x' * 100)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.cache.total_bytes(), 100)
+        first.delete()
+        self.assertTrue(os.path.isfile(second.file.path))
+
+    def test_least_recently_used_is_evicted(self):
+        oldest = self.store('a', b'a' * 100)
+        self.store('b', b'b' * 100)
+        self.cache.lookup('a', '18')
+        self.store('c', b'c' * 100)
+        self.assertIsNotNone(self.cache.lookup('a', '18'))
+        self.assertIsNone(self.cache.lookup('b', '18'))
+        self.assertTrue(os.path.isfile(oldest.file.path))
+        self.assertLessEqual(self.cache.total_bytes(), 250)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertIsNone(parse_range(None, 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+
+@override_settings(METADATA_STORE_ENABLED=False, EXTRACTION_STRATEGIES_ENABLED=False)
+class MergeJobTests(TransactionTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        extraction = mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO))
+        extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def submit(self, **data):
+        with mock.patch('downloader.views.submit_merge_job') as submit_merge_job:
+            response = self.client.post('/api/jobs/', dict({'url': self.url, 'quality': '1080p'}, **data), content_type='application/json')
+        return response, submit_merge_job
+
+    def run_job(self, job, fetch_format, mux):
+        """Run a submitted job in this process, with downloads and ffmpeg replaced"""
+        args = job.call_args.args
+        job_pk, streams = args[0], [stream_spec(args[1]), stream_spec(args[2])]
+        with mock.patch('downloader.segmented.fetch_format', side_effect=fetch_format), \
+                mock.patch('downloader.jobs.mux', side_effect=mux):
+            run_merge_job(job_pk, streams, args[3])
+
+    def test_job_runs_to_done_and_serves_its_file(self):
+        response, submit_merge_job = self.submit()
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['status'], VideoDownload.STATUS_PENDING)
+        job_pk, video, audio, container = submit_merge_job.call_args.args
+        self.assertEqual((video['format_id'], audio['format_id'], container), ('137', '140', 'mp4'))
+        status_path = f"/api/jobs/{data['job_id']}/"
+        self.assertEqual(self.client.get(status_path).json()['status'], VideoDownload.STATUS_PENDING)
+        self.assertEqual(self.client.get(status_path + 'file/').status_code, 409)
+
+        seen = []
+
+        def fetch_format(stream, path, on_progress=None):
+            with open(path, 'wb') as f:
+                f.write(stream['format_id'].encode())
+            seen.append(VideoDownload.objects.get(pk=job_pk).status)
+
+        def mux(video_path, audio_path, output_path):
+            with open(output_path, 'wb') as f:
+                f.write(open(video_path, 'rb').read() + b'+' + open(audio_path, 'rb').read())
+
+        self.run_job(submit_merge_job, fetch_format, mux)
+        self.assertEqual(seen, [VideoDownload.STATUS_RUNNING] * 2)
+        data = self.client.get(status_path).json()
+        self.assertEqual((data['status'], data['progress']), (VideoDownload.STATUS_DONE, 100))
+        self.assertTrue(data['file_url'].endswith(status_path + 'file/'))
+        file_response = self.client.get(status_path + 'file/')
+        self.assertTrue(file_response.is_async)
+        self.assertEqual(read_body(file_response), b'137+140')
+
+        # The merged file is in the media cache: the same request needs no job
+        response, submit_merge_job = self.submit()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], VideoDownload.STATUS_DONE)
+        submit_merge_job.assert_not_called()
+
+    def test_failed_download_fails_the_job(self):
+        response, submit_merge_job = self.submit()
+
+        def fetch_format(stream, path, on_progress=None):
+            raise SegmentError('Range 0-99 failed after 3 retries')
+
+        mux = mock.Mock()
+        self.run_job(submit_merge_job, fetch_format, mux)
+        mux.assert_not_called()
+        data = self.client.get(f"/api/jobs/{response.json()['job_id']}/").json()
+        self.assertEqual(data['status'], VideoDownload.STATUS_FAILED)
+        self.assertIn('Range 0-99', data['error'])
+        self.assertNotIn('file_url', data)
+
+    def test_repeated_requests_share_the_job_in_flight(self):
+        first, submit_merge_job = self.submit()
+        again, resubmit = self.submit()
+        self.assertEqual(again.status_code, 202)
+        self.assertEqual(again.json()['job_id'], first.json()['job_id'])
+        resubmit.assert_not_called()
+        self.assertEqual(VideoDownload.objects.count(), 1)
+
+        # A job lost with its pool is failed, and a new one started
+        VideoDownload.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        fresh, resubmit = self.submit()
+        self.assertNotEqual(fresh.json()['job_id'], first.json()['job_id'])
+        resubmit.assert_called_once()
+        lost = self.client.get(f"/api/jobs/{first.json()['job_id']}/").json()
+        self.assertEqual(lost['status'], VideoDownload.STATUS_FAILED)
+
+    def test_unfinished_jobs_fail_at_startup(self):
+        pending = self.submit()[0].json()
+        running = VideoDownload.objects.create(url=self.url, title='t', quality='720p', status=VideoDownload.STATUS_RUNNING)
+        done = VideoDownload.objects.create(url=self.url, title='t', quality='720p', status=VideoDownload.STATUS_DONE)
+        self.assertEqual(fail_stale_jobs(), 2)
+        self.assertEqual(self.client.get(f"/api/jobs/{pending['job_id']}/").json()['status'], VideoDownload.STATUS_FAILED)
+        running.refresh_from_db()
+        done.refresh_from_db()
+        self.assertEqual((running.status, done.status), (VideoDownload.STATUS_FAILED, VideoDownload.STATUS_DONE))
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.submit(url='https://www.instagram.com/p/C1a2b3c4d5E/')[0].status_code, 400)
+        with mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, formats=YOUTUBE_FORMATS[1:4])):
+            extraction_cache.invalidate()
+            self.assertEqual(self.submit()[0].status_code, 400)
+        self.assertEqual(self.client.get(f'/api/jobs/{uuid.uuid4()}/').status_code, 404)
+
+
+IMAGE = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 4
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for a thumbnail host: serves IMAGE and honours If-None-Match"""
+
+    etag = '"v1"'
+    seen = []
+
+    def do_GET(self):
+        type(self).seen.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(IMAGE)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(METADATA_STORE_ENABLED=False)
+class ThumbnailTests(SimpleTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageRequestHandler)
+        cls.image_url = f'http://127.0.0.1:{cls.server.server_port}/maxres.jpg'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ImageRequestHandler.seen = []
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        extraction = mock.patch('downloader.views.run_extraction', return_value=dict(RAW_INFO, thumbnail=self.image_url))
+        extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def get(self, **headers):
+        return self.client.get('/api/thumbnail/', {'url': self.url}, headers=headers)
+
+    def test_served_from_disk_after_first_fetch(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(read_body(first), IMAGE)
+        self.assertEqual(first['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age', first['Cache-Control'])
+
+        second = self.get()
+        self.assertEqual(read_body(second), IMAGE)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(ImageRequestHandler.seen), 1)
+
+        self.assertEqual(self.get(if_none_match=first['ETag']).status_code, 304)
+
+    def test_stale_copy_is_revalidated(self):
+        etag = self.get()['ETag']
+        with mock.patch.object(thumbnail_cache, 'revalidate_after', 0):
+            response = self.get()
+        self.assertEqual(read_body(response), IMAGE)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(ImageRequestHandler.seen), 2)
+        self.assertEqual(ImageRequestHandler.seen[1].get('If-None-Match'), '"v1"')
+
+    def test_extract_info_links_the_proxy(self):
+        response = self.client.post('/api/extract-info/', {'url': self.url, 'mode': 'lite'}, content_type='application/json')
+        self.assertEqual(response.json()['thumbnail_proxy'], '/api/thumbnail/?url=https%3A%2F%2Fwww.youtube.com%2Fwatch%3Fv%3DdQw4w9WgXcQ')
+
+    def test_least_recently_served_is_evicted(self):
+        cache = ThumbnailCache(max_bytes=250)
+        for video_id in ('a', 'b'):
+            cache.store(('youtube', video_id), video_id.encode() * 100, 'image/jpeg', {})
+        cache.get(('youtube', 'a'))
+        os.utime(cache.get(('youtube', 'b'))['path'], (0, 0))
+        cache.store(('youtube', 'c'), b'c' * 100, 'image/jpeg', {})
+        self.assertIsNotNone(cache.get(('youtube', 'a')))
+        self.assertIsNone(cache.get(('youtube', 'b')))
+        self.assertLessEqual(cache.total_bytes(), 250)
+
+
+class AudioPlanTests(SimpleTestCase):
+    def test_suitable_containers_are_direct(self):
+        self.assertEqual(audio_plan(YOUTUBE_FORMATS, 'm4a'), (YOUTUBE_FORMATS[0], 'direct'))
+        opus = make_format('251', None, ext='webm', vcodec='none', acodec='opus')
+        self.assertEqual(audio_plan(YOUTUBE_FORMATS + [opus], 'opus'), (opus, 'direct'))
+
+    def test_matching_codec_is_remuxed(self):
+        aac = make_format('139', None, ext='mp4', vcodec='none')
+        self.assertEqual(audio_plan([aac], 'm4a'), (aac, 'copy'))
+
+    def test_other_outputs_are_encoded(self):
+        self.assertEqual(audio_plan(YOUTUBE_FORMATS, 'mp3'), (YOUTUBE_FORMATS[0], 'encode'))
+        # Without audio-only streams, from the smallest progressive video
+        progressive = [f for f in YOUTUBE_FORMATS if f['vcodec'] != 'none']
+        self.assertEqual(audio_plan(progressive, 'mp3')[0]['height'], 360)
+        self.assertEqual(audio_plan(YOUTUBE_FORMATS[4:], 'mp3'), (None, None))
+
+    def test_slots_are_bounded(self):
+        slots = TranscodeSlots(size=1, retry_after=3)
+        slots.acquire()
+        with self.assertRaises(Overloaded) as raised:
+            slots.acquire()
+        self.assertEqual(raised.exception.retry_after, 3)
+        slots.release()
+        slots.acquire()
+        self.assertEqual(slots.stats(), {'active': 1, 'max': 1, 'started': 2, 'rejected': 1})
+
+    def transcode(self, script):
+        """Run iter_transcode over a stand-in for ffmpeg; fails instead of hanging on a stall"""
+        transcode_slots.acquire()
+        process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        result = {}
+
+        def read():
+            try:
+                result['body'] = b''.join(iter_transcode(process, 'test'))
+            except Exception as e:
+                result['error'] = e
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=10)
+        if reader.is_alive():
+            process.kill()
+            self.fail('Output stalled behind a full stderr pipe')
+        return result
+
+    def test_chatty_stderr_does_not_stall_the_output(self):
+        # Far more log output than a pipe holds, before any audio
+        result = self.transcode("import sys; sys.stderr.write('Reconnecting\\n' * 100000); sys.stdout.write('audio')")
+        self.assertEqual(result, {'body': b'audio'})
+
+    def test_failure_reports_the_end_of_stderr(self):
+        result = self.transcode("import sys; sys.stderr.write('noise\\n' * 100000 + 'Server returned 403 Forbidden\\n'); sys.exit(1)")
+        self.assertIn('Server returned 403 Forbidden', str(result['error']))
+        self.assertEqual(transcode_slots.stats()['active'], 0)
+
+
+class AudioFileHandler(BaseHTTPRequestHandler):
+    """Stand-in for a media host serving one audio file"""
+
+    body = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/webm')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+@override_settings(METADATA_STORE_ENABLED=False)
+class AudioModeTests(SimpleTestCase):
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        AudioFileHandler.body = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2',
+             '-c:a', 'libopus', '-f', 'webm', 'pipe:'],
+            check=True, capture_output=True,
+        ).stdout
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), AudioFileHandler)
+        cls.audio = make_format('251', None, ext='webm', vcodec='none', acodec='opus')
+        cls.audio.update(url=f'http://127.0.0.1:{cls.server.server_port}/audio.webm', abr=128)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        info = dict(RAW_INFO, formats=[f for f in YOUTUBE_FORMATS if f['vcodec'] != 'none'] + [self.audio])
+        extraction = mock.patch('downloader.views.run_extraction', return_value=info)
+        extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def test_extract_info_lists_audio_options(self):
+        response = self.client.post('/api/extract-info/', {'url': self.url, 'mode': 'audio'}, content_type='application/json')
+        options = {option['quality']: option for option in response.json()['audio_formats']}
+        self.assertNotIn('formats', response.json())
+        self.assertEqual(options['opus'], {'quality': 'opus', 'extension': 'webm', 'transcoded': False, 'filesize': 3.23})
+        self.assertTrue(options['mp3']['transcoded'])
+        self.assertEqual(options['mp3']['extension'], 'mp3')
+
+    def test_download_links_direct_or_transcoded_audio(self):
+        def download(quality):
+            return self.client.post(
+                '/api/download/', {'url': self.url, 'mode': 'audio', 'quality': quality}, content_type='application/json',
+            ).json()
+
+        self.assertEqual(download('opus')['download_url'], self.audio['url'])
+        mp3 = download('mp3')
+        self.assertTrue(mp3['transcoded'])
+        self.assertIn('/api/audio/?url=', mp3['download_url'])
+        self.assertIn('quality=mp3', mp3['download_url'])
+
+    async def test_transcodes_through_a_pipe(self):
+        response = await self.async_client.get('/api/audio/', {'url': self.url, 'quality': 'mp3'})
+        body = await read_streaming(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertIn('.mp3', response['Content-Disposition'])
+        self.assertTrue(body.startswith(b'ID3') or body[:2] == b'\xff\xfb', body[:4])
+        self.assertEqual(transcode_slots.stats()['active'], 0)
+
+    async def test_transcodes_are_bounded(self):
+        with mock.patch('downloader.transcode.transcode_slots', TranscodeSlots(size=0)):
+            response = await self.async_client.get('/api/audio/', {'url': self.url, 'quality': 'mp3'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class SegmentHostHandler(RangeRequestHandler):
+    """
+    RangeRequestHandler with failure modes: /flaky drops the connection
+    halfway through the first response for each range start, /norange
+    ignores Range and /missing answers 404. /index.m3u8 is an HLS
+    playlist of PAYLOAD in four fragments.
+    """
+
+    failed_starts = set()
+    lock = threading.Lock()
+
+    def send_body(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        quarter = len(PAYLOAD) // 4
+        if self.path == '/index.m3u8':
+            fragments = ''.join(f'#EXTINF:2.0,\n/fragment/{i}.ts\n' for i in range(4))
+            playlist = f'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:2\n{fragments}#EXT-X-ENDLIST\n'
+            return self.send_body('application/vnd.apple.mpegurl', playlist.encode())
+        if self.path.startswith('/fragment/'):
+            i = int(self.path.split('/')[-1].split('.')[0])
+            return self.send_body('video/mp2t', PAYLOAD[i * quarter:(i + 1) * quarter])
+        if self.path == '/missing':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == '/norange':
+            del self.headers['Range']
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if self.path == '/flaky' and match and match.group(1) != '0':
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(PAYLOAD) - 1), len(PAYLOAD) - 1)
+            with self.lock:
+                first_try = start not in self.failed_starts
+                self.failed_starts.add(start)
+            if first_try:
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                self.wfile.write(PAYLOAD[start:start + (end - start + 1) // 2])
+                self.close_connection = True
+                return
+        super().do_GET()
+
+
+class SegmentedDownloadTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SegmentHostHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        self.path = os.path.join(work_dir, 'media')
+        self.downloader = SegmentedDownloader(connections=4, segment_size=64 * 1024, retries=2, retry_delay=0)
+        SegmentHostHandler.failed_starts = set()
+        self.progress = []
+
+    def download(self, path):
+        return self.downloader.download(f'{self.base_url}{path}', self.path, on_progress=self.progress.append)
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_ranges_are_written_in_place(self):
+        report = self.download('/media.mp4')
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertEqual(report['segments'], len(PAYLOAD) // (64 * 1024))
+        self.assertEqual(report['retries'], 0)
+        self.assertEqual(sum(self.progress), len(PAYLOAD))
+
+    def test_failed_ranges_are_retried_alone(self):
+        report = self.download('/flaky')
+        self.assertEqual(self.read(), PAYLOAD)
+        # Every range but the first one (which starts at 0) failed once
+        self.assertEqual(report['retries'], report['segments'] - 1)
+        # Retries resume, so no byte is counted twice
+        self.assertEqual(sum(self.progress), len(PAYLOAD))
+
+    def test_hosts_without_ranges_get_one_stream(self):
+        report = self.download('/norange')
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertEqual(report['segments'], 1)
+
+    def test_errors(self):
+        with self.assertRaises(SegmentError):
+            self.download('/missing')
+        self.assertEqual(split_ranges(10, 4), [(0, 3), (4, 7), (8, 9)])
+
+    def test_fetch_format_picks_the_segmented_path(self):
+        fmt = {'url': f'{self.base_url}/media.mp4', 'protocol': 'https', 'http_headers': {'X-Test': '1'}}
+        with mock.patch('downloader.segmented.segmented_downloader', self.downloader):
+            report = fetch_format(fmt, self.path)
+        self.assertEqual(report['bytes'], len(PAYLOAD))
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_fragmented_formats_go_through_yt_dlp(self):
+        fmt = {'url': f'{self.base_url}/index.m3u8', 'protocol': 'm3u8_native', 'ext': 'mp4', 'format_id': 'hls-1'}
+        with override_settings(SEGMENTED_CONNECTIONS=3):
+            report = fetch_format(fmt, self.path, self.progress.append)
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertEqual(self.progress, [len(PAYLOAD)])
+        self.assertEqual(report['bytes'], len(PAYLOAD))
+
+
+class MetadataStoreTests(TransactionTestCase):
+    def test_flush_upserts_and_get_respects_expiry(self):
+        store = MetadataStore()
+        now = timezone.now()
+        store.flush([
+            ('youtube', 'abc', {'title': 'old'}, now + timedelta(hours=1)),
+            ('youtube', 'abc', {'title': 'new'}, now + timedelta(hours=1)),
+            ('youtube', 'gone', {'title': 'stale'}, now - timedelta(seconds=1)),
+        ])
+        info, ttl = store.get('youtube', 'abc')
+        self.assertEqual(info, {'title': 'new'})
+        self.assertGreater(ttl, 3500)
+        self.assertEqual(store.get('youtube', 'gone'), (None, 0))
+        self.assertEqual(VideoMetadata.objects.count(), 2)
+
+    def test_writes_purge_expired_rows(self):
+        store = MetadataStore(purge_every=3)
+        now = timezone.now()
+        store.flush([('youtube', 'gone', {}, now - timedelta(seconds=1)), ('youtube', 'a', {}, now + timedelta(hours=1))])
+        self.assertEqual(VideoMetadata.objects.count(), 2)
+        store.flush([('youtube', 'b', {}, now + timedelta(hours=1))])
+        self.assertEqual(sorted(VideoMetadata.objects.values_list('video_id', flat=True)), ['a', 'b'])
+        self.assertEqual(store.stats()['purged'], 1)
+
+    def test_unusable_info_is_dropped_from_both_levels(self):
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        key = extraction_cache.make_key('youtube', url)
+        metadata_store.flush([(*key, {'title': 'no formats', 'formats': []}, timezone.now() + timedelta(hours=1))])
+        extraction_cache.invalidate()
+        self.addCleanup(extraction_cache.invalidate)
+        with mock.patch('downloader.views.run_extraction') as run_extraction:
+            with self.assertRaisesMessage(Exception, 'No video formats available'):
+                resolve_youtube_format(url, '720p')
+        run_extraction.assert_not_called()
+        self.assertIsNone(extraction_cache.get(key))
+        self.assertFalse(VideoMetadata.objects.filter(platform=key[0], video_id=key[1]).exists())
+
+    def test_ttl_stops_before_signed_urls_expire(self):
+        expire = int(time.time()) + 3600
+        info = {'formats': [{'url': f'https://rr1.googlevideo.com/videoplayback?expire={expire}&id=1'}]}
+        self.assertAlmostEqual(seconds_until_expiry(info, 6 * 3600), 3600 - 300, delta=2)
+        self.assertEqual(seconds_until_expiry({'formats': []}, 600), 600)
+        self.assertEqual(url_expiry('https://scontent.cdninstagram.com/v.mp4?oe=6500AB00'), 0x6500AB00)
+
+    def test_trim_info_drops_unused_fields(self):
+        info = {'title': 't', 'description': 'long', 'formats': [{'format_id': '18', 'fragments': [1, 2], 'filesize': None}]}
+        self.assertEqual(trim_info(info), {'title': 't', 'formats': [{'format_id': '18'}]})
@@ -0,0 +1,221 @@
+"""
+On-disk thumbnail cache under MEDIA_ROOT/thumbnails.
+
+Each video has one image file plus a JSON sidecar holding its content
+type, our ETag (a hash of the bytes) and the upstream ETag and
+Last-Modified. Copies older than THUMBNAIL_REVALIDATE_AFTER are
+revalidated with a conditional GET, so an unchanged thumbnail costs a
+304 instead of a download. Once the files exceed THUMBNAIL_CACHE_MAX_BYTES
+the least recently served ones are deleted.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .proxy import get_session
+
+
+EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/avif': 'avif',
+}
+
+
+class ThumbnailError(Exception):
+    """The upstream image could not be fetched or is not usable"""
+
+
+def thumbnails_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'thumbnails')
+
+
+def entry_name(key):
+    platform, video_id = key
+    return f"{platform}_{re.sub(r'[^A-Za-z0-9_-]', '_', video_id)}"
+
+
+class ThumbnailCache:
+    def __init__(self, max_bytes=256 * 1024 ** 2, max_file_bytes=2 * 1024 ** 2, revalidate_after=86400):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._bytes = None
+        self.hits = 0
+        self.fetched = 0
+        self.revalidated = 0
+
+    def get(self, key):
+        """
+        Return the stored entry for a video (its sidecar, plus ``path``), or
+        None. Marks it as recently served.
+        """
+        entry = self._read(key)
+        if entry is None:
+            return None
+        try:
+            os.utime(entry['path'])
+        except OSError:
+            return None
+        self.hits += 1
+        return entry
+
+    def _read(self, key):
+        meta_path = os.path.join(thumbnails_dir(), f'{entry_name(key)}.json')
+        try:
+            with open(meta_path) as f:
+                entry = json.load(f)
+            entry['path'] = os.path.join(os.path.dirname(meta_path), entry['file'])
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get('fetched_at', 0) < self.revalidate_after
+
+    def fetch(self, key, url, entry=None):
+        """
+        Download a thumbnail into the cache and return its entry. With an
+        existing ``entry`` the request is conditional, and a 304 only
+        renews it.
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get('upstream_etag'):
+                headers['If-None-Match'] = entry['upstream_etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = get_session().get(url, headers=headers, stream=True, timeout=getattr(settings, 'PROXY_TIMEOUT', 30))
+        try:
+            if response.status_code == 304 and entry is not None:
+                entry['fetched_at'] = time.time()
+                self._write_meta(key, entry)
+                self.revalidated += 1
+                return entry
+            if response.status_code != 200:
+                raise ThumbnailError(f'Thumbnail host answered {response.status_code}')
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if not content_type.startswith('image/'):
+                raise ThumbnailError(f'Thumbnail host sent {content_type or "no content type"}')
+
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body.extend(chunk)
+                if len(body) > self.max_file_bytes:
+                    raise ThumbnailError('Thumbnail is too large')
+        finally:
+            response.close()
+
+        self.fetched += 1
+        return self.store(key, bytes(body), content_type, response.headers)
+
+    def store(self, key, body, content_type, headers):
+        name = entry_name(key)
+        directory = thumbnails_dir()
+        os.makedirs(directory, exist_ok=True)
+        entry = {
+            'file': f"{name}.{EXTENSIONS.get(content_type, 'img')}",
+            'content_type': content_type,
+            'size': len(body),
+            'etag': '"{}"'.format(hashlib.sha256(body).hexdigest()[:32]),
+            'upstream_etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        old = self._read(key)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, os.path.join(directory, entry['file']))
+        self._write_meta(key, entry)
+        if old is not None and old['file'] != entry['file']:
+            self._remove_file(old['path'])
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(body) - (old['size'] if old is not None else 0)
+        self.enforce_budget()
+        entry['path'] = os.path.join(directory, entry['file'])
+        return entry
+
+    def _write_meta(self, key, entry):
+        directory = thumbnails_dir()
+        meta = {k: v for k, v in entry.items() if k != 'path'}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, f'{entry_name(key)}.json'))
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _scan(self):
+        """``[(mtime, size, image path, sidecar path)]`` of every entry"""
+        entries = []
+        try:
+            with os.scandir(thumbnails_dir()) as it:
+                for item in it:
+                    name, ext = os.path.splitext(item.name)
+                    if ext in ('.json', '.part'):
+                        continue
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.path, os.path.join(os.path.dirname(item.path), f'{name}.json')))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def total_bytes(self):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _, _ in self._scan())
+            return self._bytes
+
+    def enforce_budget(self):
+        """Delete the least recently served thumbnails until the cache fits"""
+        if self.total_bytes() <= self.max_bytes:
+            return
+        with self._lock:
+            # Other workers write here too: start from what is on disk
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, path, meta_path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                self._remove_file(meta_path)
+                self._remove_file(path)
+                total -= size
+            self._bytes = total
+
+    def stats(self):
+        # No disk access: the byte count is the one kept since this process
+        # first stored a thumbnail (and scanned the directory)
+        with self._lock:
+            tracked = self._bytes or 0
+        return {
+            'bytes': tracked,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'fetched': self.fetched,
+            'revalidated': self.revalidated,
+        }
+
+
+thumbnail_cache = ThumbnailCache(
+    max_bytes=getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 ** 2),
+    max_file_bytes=getattr(settings, 'THUMBNAIL_MAX_FILE_BYTES', 2 * 1024 ** 2),
+    revalidate_after=getattr(settings, 'THUMBNAIL_REVALIDATE_AFTER', 86400),
+)
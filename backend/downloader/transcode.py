@@ -0,0 +1,261 @@
+"""
+Audio-only downloads.
+
+For each output (mp3, m4a, opus) ``audio_plan`` picks a source stream
+from an info dict's formats and how to deliver it:
+
+- ``direct``: an audio-only stream already in a suitable container is
+  handed out (or proxied) as is;
+- ``copy``: the audio codec fits but the container doesn't, so ffmpeg
+  remuxes it without re-encoding;
+- ``encode``: ffmpeg transcodes it, from an audio-only stream when there
+  is one, otherwise from the smallest progressive video.
+
+ffmpeg reads the upstream URL itself and writes the result to stdout,
+which is streamed straight into the HTTP response: nothing touches disk
+and the first bytes go out as soon as ffmpeg produces them. Each worker
+runs at most AUDIO_MAX_TRANSCODES ffmpeg processes; requests past that
+get a 503.
+"""
+import asyncio
+import collections
+import threading
+import time
+
+from django.conf import settings
+
+from .executor import Overloaded
+from .formats import FormatIndex, codec_family, is_direct
+from .proxy import transfer_stats
+
+
+AUDIO_OUTPUTS = {
+    'm4a': {
+        'ext': 'm4a',
+        'content_type': 'audio/mp4',
+        'direct_exts': ('m4a',),
+        'codec_family': 'mp4a',
+        'encoder': 'aac',
+        # Fragmented, so the moov atom doesn't have to be written last
+        'output': {'format': 'mp4', 'movflags': 'frag_keyframe+empty_moov'},
+    },
+    'mp3': {
+        'ext': 'mp3',
+        'content_type': 'audio/mpeg',
+        'direct_exts': ('mp3',),
+        'codec_family': 'mp3',
+        'encoder': 'libmp3lame',
+        'output': {'format': 'mp3'},
+    },
+    'opus': {
+        'ext': 'opus',
+        'content_type': 'audio/ogg',
+        'direct_exts': ('webm', 'opus', 'ogg'),
+        'codec_family': 'opus',
+        'encoder': 'libopus',
+        'output': {'format': 'ogg'},
+    },
+}
+
+DEFAULT_AUDIO_OUTPUT = 'm4a'
+
+
+def audio_plan(formats, output):
+    """
+    Return ``(format, how)`` for delivering ``output`` from a list of
+    yt-dlp formats, ``how`` being 'direct', 'copy' or 'encode', or
+    ``(None, None)`` when there is nothing to take audio from.
+    """
+    spec = AUDIO_OUTPUTS[output]
+    index = FormatIndex(formats)
+    source = index.best_audio(spec['direct_exts'])
+    if source is not None:
+        return source, 'direct'
+    for fmt in index.audio:
+        if is_direct(fmt) and codec_family(fmt.get('acodec')) == spec['codec_family']:
+            return fmt, 'copy'
+    source = index.best_audio()
+    if source is not None:
+        return source, 'encode'
+    # No audio-only stream: extract it from the smallest progressive video
+    for fmt in reversed(index.formats):
+        if fmt.get('acodec') != 'none' and is_direct(fmt):
+            return fmt, 'encode'
+    return None, None
+
+
+def output_extension(output, source, how):
+    return source.get('ext', AUDIO_OUTPUTS[output]['ext']) if how == 'direct' else AUDIO_OUTPUTS[output]['ext']
+
+
+def audio_bitrate():
+    return getattr(settings, 'AUDIO_TRANSCODE_BITRATE', '160k')
+
+
+def estimated_size(source, how, duration):
+    """Expected size in bytes of an audio download, or None when unknown"""
+    if how in ('direct', 'copy'):
+        size = source.get('filesize') or source.get('filesize_approx')
+        if size:
+            return size
+        kbps = source.get('abr') or source.get('tbr')
+    else:
+        kbps = int(audio_bitrate().rstrip('k'))
+    if kbps and duration:
+        return int(kbps * 1000 / 8 * duration)
+    return None
+
+
+class TranscodeSlots:
+    """Bounds the ffmpeg processes of this worker"""
+
+    def __init__(self, size=4, retry_after=5):
+        self.size = size
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.started = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(self.retry_after)
+        with self._lock:
+            self.active += 1
+            self.started += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'max': self.size, 'started': self.started, 'rejected': self.rejected}
+
+
+transcode_slots = TranscodeSlots(
+    size=getattr(settings, 'AUDIO_MAX_TRANSCODES', 4),
+    retry_after=getattr(settings, 'EXTRACTION_RETRY_AFTER', 5),
+)
+
+
+def start_transcode(source, output, how):
+    """Start ffmpeg on ``source``'s URL, writing ``output`` audio to its stdout"""
+    import ffmpeg
+
+    spec = AUDIO_OUTPUTS[output]
+    input_options = {}
+    headers = source.get('http_headers') or {}
+    if headers:
+        input_options['headers'] = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    if source['url'].startswith(('http://', 'https://')):
+        input_options.update(reconnect=1, reconnect_streamed=1, reconnect_delay_max=5)
+
+    output_options = dict(spec['output'])
+    if how == 'copy':
+        output_options['acodec'] = 'copy'
+    else:
+        output_options.update(acodec=spec['encoder'], audio_bitrate=audio_bitrate())
+    return (
+        ffmpeg
+        .input(source['url'], **input_options)
+        .audio
+        .output('pipe:', **output_options)
+        .global_args('-hide_banner', '-loglevel', 'error', '-nostdin')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+
+
+def drain_stderr(process, keep=64):
+    """
+    Read ffmpeg's stderr on a thread while it runs, keeping the last
+    ``keep`` lines. Left unread, a full stderr pipe blocks ffmpeg, and with
+    it stdout, as soon as it logs more than the pipe holds (e.g. repeated
+    reconnect errors). Returns ``(thread, lines)``.
+    """
+    lines = collections.deque(maxlen=keep)
+
+    def read():
+        for line in process.stderr:
+            lines.append(line)
+
+    thread = threading.Thread(target=read, name='ffmpeg-stderr', daemon=True)
+    thread.start()
+    return thread, lines
+
+
+def iter_transcode(process, label, chunk_size=None):
+    """
+    Yield ffmpeg's output as it is produced. The process is killed and
+    its slot released when the transfer ends, also when the client goes
+    away. Raises when ffmpeg fails before writing anything.
+    """
+    chunk_size = chunk_size or getattr(settings, 'PROXY_CHUNK_SIZE', 256 * 1024)
+    sent = 0
+    started = time.monotonic()
+    transfer_stats.start()
+    stderr_reader, stderr_lines = drain_stderr(process)
+    try:
+        while True:
+            chunk = process.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            sent += len(chunk)
+            yield chunk
+        if process.wait() != 0 and not sent:
+            stderr_reader.join(timeout=1)
+            stderr = b''.join(stderr_lines).decode('utf-8', errors='ignore').strip()
+            raise Exception(f"ffmpeg failed: {stderr[-500:]}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        stderr_reader.join(timeout=1)
+        process.stdout.close()
+        process.stderr.close()
+        transcode_slots.release()
+        transfer_stats.finish(sent)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"Transcode {label}: {sent} bytes in {elapsed:.2f}s ({sent / elapsed / (1024 * 1024):.2f} MB/s)")
+
+
+def open_transcode(source, output, how, label):
+    """
+    Take a transcode slot, start ffmpeg and wait for its first chunk.
+    Returns ``(process, chunks, first chunk)``. Raises Overloaded when all
+    slots are taken, or the ffmpeg error when it produced nothing.
+    """
+    transcode_slots.acquire()
+    try:
+        process = start_transcode(source, output, how)
+    except BaseException:
+        transcode_slots.release()
+        raise
+    # From the first next() on, iter_transcode owns the process and slot
+    chunks = iter_transcode(process, label)
+    first = next(chunks, None)
+    if first is None:
+        raise Exception('ffmpeg produced no output')
+    return process, chunks, first
+
+
+async def aiter_transcode(process, chunks, first):
+    """Async form of a transcode opened with open_transcode(); each read runs on a thread"""
+    try:
+        yield first
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        try:
+            chunks.close()
+        except ValueError:
+            # Cancelled while a read is still running on its thread: killing
+            # ffmpeg ends that read, the generator cleans up when collected
+            process.kill()
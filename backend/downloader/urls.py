@@ -1,7 +1,26 @@
 from django.urls import path
-from .views import ExtractVideoInfoView, DownloadVideoView
+from .views import (
+    extract_info_async,
+    extract_info_batch,
+    download_async,
+    playlist_view,
+    proxy_view,
+    audio_view,
+    thumbnail_view,
+    merge_job_async,
+    MergeJobStatusView,
+    MergeJobFileView,
+)
 
 urlpatterns = [
-    path('extract-info/', ExtractVideoInfoView.as_view(), name='extract-info'),
-    path('download/', DownloadVideoView.as_view(), name='download'),
+    path('extract-info/', extract_info_async, name='extract-info'),
+    path('extract-info/batch/', extract_info_batch, name='extract-info-batch'),
+    path('download/', download_async, name='download'),
+    path('playlist/', playlist_view, name='playlist'),
+    path('proxy/', proxy_view, name='proxy'),
+    path('audio/', audio_view, name='audio'),
+    path('thumbnail/', thumbnail_view, name='thumbnail'),
+    path('jobs/', merge_job_async, name='merge-jobs'),
+    path('jobs/<uuid:job_id>/', MergeJobStatusView.as_view(), name='merge-job'),
+    path('jobs/<uuid:job_id>/file/', MergeJobFileView.as_view(), name='merge-job-file'),
 ]
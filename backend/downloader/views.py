@@ -1,217 +1,645 @@
+import hashlib
+import mimetypes
 import os
-import re
-import uuid
-import tempfile
-import base64
+import time
+import asyncio
+import threading
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import FileResponse
+from django.http import HttpResponse, HttpResponsePermanentRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, urlencode
 from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import pytube
 import requests
 import json
-from bs4 import BeautifulSoup
 from .models import VideoDownload
-import yt_dlp
+from .cache import add_fingerprint, extraction_cache, info_fingerprint, trim_info
+from .expiry import seconds_until_expiry
+from .store import metadata_store
+from .refresh import refresh_scheduler
+from .cookies import get_cookie_pool
+from .executor import Overloaded, extraction_executor
+from .ratelimit import RateLimited, is_bot_check, upstream_limiter
+from .strategies import StrategiesUnavailable, youtube_strategies
+from .singleflight import SingleFlight, extraction_flights
+from .playlists import entry_thumbnail, iter_playlist
+from .routing import UnsupportedURL, route_playlist, route_url
+from .proxy import PASSTHROUGH_HEADERS, aiter_upstream, open_upstream
+from .jobs import find_active_job, submit_merge_job
+from .media_cache import CacheWriter, media_cache, parse_range
+from .thumbnails import thumbnail_cache
+from .transcode import (
+    AUDIO_OUTPUTS, DEFAULT_AUDIO_OUTPUT, aiter_transcode, audio_plan, estimated_size, open_transcode,
+    output_extension,
+)
+from .formats import FormatIndex, format_height, is_direct, is_progressive, merge_container, select_format
+from .ydl_pool import ydl_pool
+from .renderers import dumps
+from .metrics import (
+    EXTRACTION_DURATION, EXTRACTION_ERRORS, RESPONSES, finish_request, set_platform, stage, track_request,
+)
+from .profiling import SamplingProfiler, profiling_requested
 
 
-def get_youtube_cookie_path():
+def youtube_ydl_opts():
     """
-    Decode Base64 encoded YouTube cookies from environment variable
-    and write to a temporary file. Returns the path to the temp file.
+    yt-dlp options for YouTube extraction. Both views use the same options
+    so that one cached info dict serves extract-info and download.
     """
-    encoded_cookies = os.environ.get('YOUTUBE_COOKIES_B64')
-    
-    if not encoded_cookies:
-        print("COOKIE DEBUG: YOUTUBE_COOKIES_B64 environment variable is NOT set or empty")
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'ignoreerrors': False,
+        # watch?v=...&list=... extracts just the video, playlists go to /api/playlist/
+        'noplaylist': True,
+        # Don't specify format - let yt-dlp extract all available formats
+    }
+    return ydl_opts
+
+
+def instagram_ydl_opts():
+    """yt-dlp options for Instagram, shared by both views like youtube_ydl_opts"""
+    return {
+        'quiet': True,
+        'no_warnings': True,
+        'format': 'best',
+        # Images in a carousel have no formats; keep them instead of failing the post
+        'ignore_no_formats_error': True,
+    }
+
+
+def lite_ydl_opts(ydl_opts):
+    """
+    Options for a metadata-only extraction: no DASH/HLS manifest requests
+    and no format checks. Used together with ``process=False``.
+    """
+    return dict(
+        ydl_opts,
+        check_formats=False,
+        extractor_args={'youtube': {'skip': ['dash', 'hls']}},
+    )
+
+
+def extract_info_cached(platform, url, ydl_opts, cookie_pool=None, mode='full'):
+    """
+    Run yt-dlp's extract_info for a URL, reusing a cached info dict for
+    the same platform and video when one is available. Concurrent misses
+    for the same video and mode share a single extraction.
+
+    ``mode='lite'`` returns metadata without formats, from a full cached
+    extraction if there is one and from a cheap lite extraction otherwise.
+    Full lookups count towards the video's popularity, which decides
+    whether refresh_scheduler keeps it resolved ahead of time.
+    """
+    key = extraction_cache.make_key(platform, url)
+    if mode != 'lite':
+        refresh_scheduler.touch(key, url)
+    with stage('cache'):
+        info = extraction_cache.get(key)
+    if info is not None:
+        return info
+    if mode == 'lite':
+        return extract_lite_cached(key, url, ydl_opts, cookie_pool)
+
+    def extract():
+        # Another worker (or an earlier run of this one) may have stored it
+        info = load_stored_info(key)
+        if info is not None:
+            return info
+        return extract_and_store(key, url, ydl_opts, cookie_pool)
+
+    return extraction_flights.do(key + (mode,), extract)
+
+
+def extract_and_store(key, url, ydl_opts, cookie_pool=None):
+    """Extract a video and put the trimmed info in both cache levels"""
+    info = extract_with_strategies(url, ydl_opts, cookie_pool, platform=key[0])
+    if not info:
+        return info
+    with stage('trim'):
+        info = trim_info(info)
+        # Not in the same expression: the raw info must be released before
+        # the trimmed one is encoded, or both are held at the peak
+        add_fingerprint(info)
+    ttl = seconds_until_expiry(info, getattr(settings, 'METADATA_TTL', 6 * 3600))
+    extraction_cache.set(key, info, ttl=min(ttl, extraction_cache.ttl))
+    if metadata_store_enabled():
+        metadata_store.put(*key, info, ttl)
+    return info
+
+
+def platform_ydl_opts(platform):
+    """``(ydl_opts, cookie_pool)`` used for a platform's extractions"""
+    if platform == 'instagram':
+        return instagram_ydl_opts(), None
+    return youtube_ydl_opts(), get_cookie_pool()
+
+
+def refresh_video(key, url):
+    """
+    Extract a video again for refresh_scheduler, ignoring both caches.
+    Requests that miss meanwhile wait for this extraction.
+    """
+    ydl_opts, cookie_pool = platform_ydl_opts(key[0])
+    return extraction_flights.do(key + ('full',), lambda: extract_and_store(key, url, ydl_opts, cookie_pool))
+
+
+def extract_lite_cached(key, url, ydl_opts, cookie_pool=None):
+    """
+    Metadata-only extraction for preview cards. Lite results are cached
+    under their own key, since they can never stand in for a full one.
+    """
+    lite_key = key + ('lite',)
+    with stage('cache'):
+        info = extraction_cache.get(lite_key)
+    if info is not None:
+        return info
+
+    def extract():
+        info = load_stored_info(key)
+        if info is not None:
+            return info
+
+        info = extract_with_strategies(url, lite_ydl_opts(ydl_opts), cookie_pool, process=False, platform=key[0])
+        if not info:
+            return info
+        with stage('trim'):
+            # Only processing picks the best thumbnail out of the list
+            if info.get('entries') is not None:
+                info['entries'] = list(info['entries'])
+            for item in [info, *(info.get('entries') or [])]:
+                if item:
+                    item['thumbnail'] = entry_thumbnail(item)
+            info = trim_info(info)
+            info.pop('formats', None)
+            add_fingerprint(info)
+        extraction_cache.set(lite_key, info)
+        return info
+
+    return extraction_flights.do(lite_key, extract)
+
+
+def load_stored_info(key):
+    """Read a full info dict from the metadata store into the in-process cache"""
+    if not metadata_store_enabled():
         return None
-    
-    print(f"COOKIE DEBUG: Found YOUTUBE_COOKIES_B64, length: {len(encoded_cookies)} chars")
-    
+    with stage('store'):
+        info, ttl = metadata_store.get(*key)
+    if info is not None:
+        # Rows stored before fingerprints were kept lack one
+        add_fingerprint(info)
+        extraction_cache.set(key, info, ttl=min(ttl, extraction_cache.ttl))
+    return info
+
+
+def invalidate_info(platform, url):
+    """Drop a video's info from both cache levels, e.g. when it has no usable URL"""
+    key = extraction_cache.make_key(platform, url)
+    extraction_cache.invalidate(key)
+    if metadata_store_enabled():
+        metadata_store.invalidate(*key)
+
+
+def metadata_store_enabled():
+    return getattr(settings, 'METADATA_STORE_ENABLED', True)
+
+
+def extract_with_strategies(url, ydl_opts, cookie_pool=None, process=True, platform=''):
+    """
+    run_extraction() for cache misses. YouTube extractions go through the
+    best healthy strategy (player clients, cookies) and fall back to the
+    next one on failure; StrategiesUnavailable is raised at once while
+    every strategy is tripped open.
+    """
+    if platform != 'youtube' or not getattr(settings, 'EXTRACTION_STRATEGIES_ENABLED', True):
+        return run_extraction(url, ydl_opts, cookie_pool, process=process, platform=platform)
     try:
-        # Create a temp file that persists until manually deleted
-        with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.txt') as f:
-            # Decode base64 string back to bytes and write to file
-            decoded_bytes = base64.b64decode(encoded_cookies)
-            f.write(decoded_bytes)
-            print(f"COOKIE DEBUG: Created cookie file at {f.name}, size: {len(decoded_bytes)} bytes")
-            # Print first 100 chars of decoded content for debugging
-            try:
-                decoded_str = decoded_bytes.decode('utf-8', errors='ignore')[:200]
-                print(f"COOKIE DEBUG: Cookie file starts with: {decoded_str[:100]}...")
-            except:
-                pass
-            return f.name
+        return youtube_strategies.run(
+            lambda opts, pool: run_extraction(url, opts, pool, process=process, platform=platform, defer_bot_check=True),
+            ydl_opts,
+            cookie_pool,
+            mode='full' if process else 'lite',
+            platform=platform,
+        )
     except Exception as e:
-        print(f"COOKIE DEBUG ERROR: Failed to process cookies: {e}")
+        # Only when no strategy got past the bot check is the platform
+        # blocking us as a whole
+        if is_bot_check(e):
+            upstream_limiter.report_failure(platform, e)
+        raise
+
+
+def run_extraction(url, ydl_opts, cookie_pool=None, process=True, platform='', defer_bot_check=False):
+    """
+    Run one yt-dlp extraction. A cookie jar is taken from ``cookie_pool``
+    (if given) and its health is updated from the outcome, as is the
+    platform's upstream rate limit. Raises RateLimited without contacting
+    the platform when the limit is reached. With ``defer_bot_check`` a bot
+    check is left for the caller to report to the rate limiter, so that
+    it can try another strategy first.
+    """
+    with stage('cookies'):
+        jar = cookie_pool.acquire() if cookie_pool is not None else None
+    identity = jar.name if jar is not None else None
+    with stage('rate_limit'):
+        upstream_limiter.acquire(platform, identity)
+    started = time.perf_counter()
+    try:
+        with ydl_pool.checkout(ydl_opts, jar) as ydl:
+            with stage('extract'):
+                info = ydl.extract_info(url, download=False, process=process)
+    except Exception as e:
+        EXTRACTION_ERRORS.inc(platform=platform)
+        if not (defer_bot_check and is_bot_check(e)):
+            upstream_limiter.report_failure(platform, e, identity)
+        if jar is not None:
+            cookie_pool.report_failure(jar, e)
+        raise
+    finally:
+        EXTRACTION_DURATION.observe(time.perf_counter() - started, platform=platform, mode='full' if process else 'lite')
+    upstream_limiter.report_success(platform, identity)
+    if jar is not None:
+        cookie_pool.report_success(jar)
+    return info
+
+
+# Fields of an extract-info response that can be asked for with ``fields``
+INFO_RESPONSE_FIELDS = ('title', 'thumbnail', 'thumbnail_proxy', 'duration', 'author', 'formats', 'audio_formats', 'items')
+# What ``mode=lite`` returns: enough for a preview card
+LITE_RESPONSE_FIELDS = ('title', 'thumbnail', 'thumbnail_proxy', 'duration', 'author')
+# What ``mode=audio`` returns: the audio download options instead of the video ones
+AUDIO_RESPONSE_FIELDS = LITE_RESPONSE_FIELDS + ('audio_formats',)
+
+
+def requested_fields(mode=None, fields=None):
+    """
+    Parse the ``mode`` and ``fields`` options of extract-info into the
+    tuple of response fields to return, or None for the full response.
+    ``fields`` may be a list or a comma-separated string. Raises
+    ValueError for unknown values.
+    """
+    if fields:
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        if not isinstance(fields, list):
+            raise ValueError('fields must be a list or a comma-separated string')
+        fields = tuple(str(field).strip() for field in fields if str(field).strip())
+        unknown = [field for field in fields if field not in INFO_RESPONSE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields or None
+    if mode in (None, '', 'full'):
         return None
+    if mode == 'lite':
+        return LITE_RESPONSE_FIELDS
+    if mode == 'audio':
+        return AUDIO_RESPONSE_FIELDS
+    raise ValueError("mode must be 'full', 'lite' or 'audio'")
 
 
-def cleanup_cookie_file(cookie_path):
-    """Remove the temporary cookie file"""
-    if cookie_path and os.path.exists(cookie_path):
+def project(video_info, fields):
+    if fields is None:
+        return video_info
+    projected = {field: video_info.get(field) for field in fields}
+    if 'is_instagram' in video_info:
+        projected['is_instagram'] = video_info['is_instagram']
+    return projected
+
+
+def canonical_info_query(route, mode=None, fields=None):
+    """
+    The query string of the GET extract-info URL for a route, so that
+    every way of writing a link maps to one URL in HTTP caches
+    """
+    params = [('url', route.url)]
+    if fields == LITE_RESPONSE_FIELDS:
+        params.append(('mode', 'lite'))
+    elif fields == AUDIO_RESPONSE_FIELDS:
+        params.append(('mode', 'audio'))
+    elif fields is not None:
+        params.append(('fields', ','.join(fields)))
+    return urlencode(params)
+
+
+def info_etag(info, fields=None):
+    """Strong ETag of an extract-info response built from ``info``"""
+    variant = ','.join(fields) if fields is not None else 'full'
+    digest = hashlib.blake2b(f'{info_fingerprint(info)}:{variant}'.encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def add_cache_headers(response, info, fields=None):
+    """
+    ETag and Cache-Control for a GET extract-info response. It may be
+    cached until shortly before the first signed URL in it expires.
+    """
+    max_age = int(seconds_until_expiry(info, getattr(settings, 'EXTRACT_INFO_MAX_AGE', 3600)))
+    response['ETag'] = info_etag(info, fields)
+    response['Cache-Control'] = f'public, max-age={max_age}' if max_age > 0 else 'no-cache'
+    return response
+
+
+class ExtractVideoInfoView(APIView):
+    def get(self, request):
+        """
+        Cacheable form of POST: ``?url=...&mode=...&fields=...``. Other
+        spellings of the same link are redirected to the canonical query.
+        Responses carry an ETag and ``If-None-Match`` is answered with 304.
+        """
         try:
-            os.remove(cookie_path)
+            url = request.query_params.get('url')
+            if not url:
+                return Response({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                route = route_video(url)
+                fields = requested_fields(request.query_params.get('mode'), request.query_params.get('fields'))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            query = canonical_info_query(route, request.query_params.get('mode'), fields)
+            if query != request.META.get('QUERY_STRING'):
+                response = HttpResponsePermanentRedirect(f'{request.path}?{query}')
+                response['Cache-Control'] = 'public, max-age=86400'
+                return response
+
+            if route.platform == 'instagram':
+                return self.extract_instagram_info(route.url, fields)
+            else:
+                return self.extract_youtube_info(route.url, fields)
+        except RateLimited as e:
+            return rate_limited_response(e)
         except Exception as e:
-            print(f"Error cleaning up cookie file: {e}")
+            print(f"Error: {str(e)}")
+            return Response({'error': 'Failed to process video'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class ExtractVideoInfoView(APIView):
     def post(self, request):
         try:
             url = request.data.get('url')
             if not url:
                 return Response({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if 'instagram.com' in url:
-                return self.extract_instagram_info(url)
+            try:
+                route = route_video(url)
+                fields = requested_fields(request.data.get('mode'), request.data.get('fields'))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if route.platform == 'instagram':
+                return self.extract_instagram_info(route.url, fields)
             else:
-                return self.extract_youtube_info(url)
+                return self.extract_youtube_info(route.url, fields)
+        except RateLimited as e:
+            return rate_limited_response(e)
         except Exception as e:
             print(f"Error: {str(e)}")
             return Response({'error': 'Failed to process video'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def extract_youtube_info(self, url):
-        cookie_path = None
+    def not_modified(self, info, fields=None):
+        """On GET, a 304 response when the client's cached copy is still current"""
+        request = getattr(self, 'request', None)
+        if request is None or request.method != 'GET':
+            return None
+        response = get_conditional_response(request, etag=info_etag(info, fields))
+        if response is not None:
+            add_cache_headers(response, info, fields)
+        return response
+
+    def cacheable(self, response, info, fields=None):
+        request = getattr(self, 'request', None)
+        if request is not None and request.method == 'GET':
+            add_cache_headers(response, info, fields)
+        return response
+
+    def extract_youtube_info(self, url, fields=None):
         try:
-            # Get cookie file path from Base64 encoded env var
-            cookie_path = get_youtube_cookie_path()
-            
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'ignoreerrors': False,
-                # Don't specify format - let yt-dlp extract all available formats
-            }
-            
-            # Add cookie file if available
-            if cookie_path:
-                ydl_opts['cookiefile'] = cookie_path
-                print(f"COOKIE DEBUG: Using cookie file: {cookie_path}")
-            else:
-                print("COOKIE DEBUG: No cookie file available, proceeding without cookies")
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    raise Exception("Could not get video info")
-                
-                formats = []
-                available_formats = info.get('formats', [])
-                if not available_formats:
-                    raise Exception("No video formats available")
-                
-                # Include all video formats (not just MP4) with fallback options
-                seen_qualities = set()
-                for f in available_formats:
-                    if f.get('vcodec') != 'none':  # Exclude audio-only formats
-                        height = f.get('height')
-                        if height:
-                            quality = f"{height}p"
-                        else:
-                            quality = f.get('format_note', f.get('quality', 'unknown'))
-                        
-                        # Avoid duplicate qualities
-                        if quality in seen_qualities:
-                            continue
-                        seen_qualities.add(quality)
-                        
-                        try:
-                            filesize = f.get('filesize')
-                            if filesize is not None:
-                                filesize = round(float(filesize) / (1024 * 1024), 2)
-                            else:
-                                filesize = 0
-                        except (ValueError, TypeError):
-                            filesize = 0
-                            
-                        # Determine the best extension to use
-                        ext = f.get('ext', 'mp4')
-                        if ext not in ['mp4', 'webm', 'mkv']:
-                            ext = 'mp4'  # Default to mp4 for unknown formats
-                            
-                        formats.append({
-                            'quality': quality,
-                            'type': 'video',
-                            'filesize': filesize,
-                            'format_id': f.get('format_id', ''),
-                            'extension': ext,
-                            'height': height or 0
-                        })
-                
-                if not formats:
-                    # If no video formats found, try to get at least one format
-                    best_format = info.get('format_id')
-                    if best_format:
-                        formats.append({
-                            'quality': 'best',
-                            'type': 'video',
-                            'filesize': 0,
-                            'format_id': best_format,
-                            'extension': info.get('ext', 'mp4'),
-                            'height': info.get('height', 0)
-                        })
-                    else:
-                        raise Exception("No video formats found")
-                
-                # Sort formats by quality (height)
-                try:
-                    formats.sort(key=lambda x: x.get('height', 0) if isinstance(x.get('height'), int) else 0, reverse=True)
-                except (ValueError, TypeError, KeyError):
-                    # If sorting fails, keep the original order
-                    pass
-                
-                video_info = {
-                    'title': info.get('title', 'Untitled'),
-                    'thumbnail': info.get('thumbnail'),
-                    'duration': info.get('duration'),
-                    'author': info.get('uploader', 'Unknown'),
-                    'formats': formats
-                }
-                return Response(video_info)
+            # Without formats in the response, skip manifests and format
+            # processing; the download call does that work when needed
+            lite = is_lite(fields)
+            info = extract_info_cached('youtube', url, youtube_ydl_opts(), get_cookie_pool(), mode='lite' if lite else 'full')
+            if not info:
+                raise Exception("Could not get video info")
+            not_modified = self.not_modified(info, fields)
+            if not_modified is not None:
+                return not_modified
+            summary = dict(video_summary(info), thumbnail_proxy=thumbnail_path(url))
+            if lite:
+                return self.cacheable(Response(project(summary, fields)), info, fields)
+
+            video_info = dict(summary)
+            with stage('formats'):
+                if fields is None or 'formats' in fields:
+                    video_info['formats'] = youtube_quality_options(info)
+                if fields is not None and 'audio_formats' in fields:
+                    video_info['audio_formats'] = audio_quality_options(info)
+            return self.cacheable(Response(project(video_info, fields)), info, fields)
+        except RateLimited:
+            raise
         except Exception as e:
             raise Exception(f"Error extracting YouTube video info: {str(e)}")
-        finally:
-            # Always cleanup the cookie file
-            cleanup_cookie_file(cookie_path)
     
-    def extract_instagram_info(self, url):
+    def extract_instagram_info(self, url, fields=None):
         try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'format': 'best',
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    raise Exception("Could not get video info")
-
-                if 'entries' in info:
-                    info = info['entries'][0]
-                
-                formats = [{
-                    'quality': 'Download',
-                    'type': 'video',
-                    'filesize': round(float(info.get('filesize', 0)) / (1024 * 1024), 2),
-                    'url': info.get('url')
-                }]
-                
-                video_info = {
-                    'title': info.get('title', info.get('fulltitle', 'Instagram Video')),
-                    'thumbnail': info.get('thumbnail'),
-                    'author': info.get('uploader'),
-                    'duration': info.get('duration'),
-                    'formats': formats,
-                    'is_instagram': True
-                }
-                return Response(video_info)
+            lite = is_lite(fields)
+            info = extract_info_cached('instagram', url, instagram_ydl_opts(), mode='lite' if lite else 'full')
+            if not info:
+                raise Exception("Could not get video info")
+            not_modified = self.not_modified(info, fields)
+            if not_modified is not None:
+                return not_modified
+            entries = instagram_entries(info)
+            summary = dict(instagram_summary(entries[0]), thumbnail_proxy=thumbnail_path(url))
+            if lite:
+                return self.cacheable(Response(project(summary, fields)), info, fields)
+
+            # Every item of the post, with its download URL: nothing else
+            # to resolve before downloading any of them
+            with stage('formats'):
+                items = [instagram_media_item(index, entry) for index, entry in enumerate(entries)]
+            download = {'quality': 'Download'}
+            if items[0].get('filesize'):
+                download['filesize'] = items[0]['filesize']
+            video_info = dict(summary, formats=[download], items=items)
+            if fields is not None and 'audio_formats' in fields:
+                video_info['audio_formats'] = audio_quality_options(entries[0])
+            return self.cacheable(Response(project(video_info, fields)), info, fields)
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"Instagram Error: {str(e)}")
             return Response({'error': 'Failed to extract Instagram video info'}, status=status.HTTP_400_BAD_REQUEST)
 
+def is_lite(fields):
+    """True when a response needs no format list, so a lite extraction will do"""
+    return fields is not None and 'formats' not in fields and 'audio_formats' not in fields
+
+
+def audio_quality_options(info):
+    """
+    The audio download options of an extract-info response, one per
+    output in AUDIO_OUTPUTS. ``transcoded`` tells whether it goes through
+    ffmpeg; ``filesize`` (MB) is estimated for those.
+    """
+    formats = info.get('formats') or [info]
+    options = []
+    for output in AUDIO_OUTPUTS:
+        source, how = audio_plan(formats, output)
+        if source is None:
+            continue
+        option = {
+            'quality': output,
+            'extension': output_extension(output, source, how),
+            'transcoded': how != 'direct',
+        }
+        size = estimated_size(source, how, info.get('duration'))
+        if size:
+            option['filesize'] = round(float(size) / (1024 * 1024), 2)
+        options.append(option)
+    return options
+
+
+def youtube_quality_options(info):
+    """
+    The per-quality format list of an extract-info response: one entry
+    per video quality, highest first, with just what the quality picker
+    shows. ``filesize`` (MB) is left out when unknown.
+    """
+    formats = []
+    available_formats = info.get('formats', [])
+    if not available_formats:
+        raise Exception("No video formats available")
+
+    # Include all video formats (not just MP4) with fallback options
+    seen_qualities = set()
+    for f in available_formats:
+        if f.get('vcodec') != 'none':  # Exclude audio-only formats
+            height = f.get('height')
+            if height:
+                quality = f"{height}p"
+            else:
+                quality = f.get('format_note', f.get('quality', 'unknown'))
+
+            # Avoid duplicate qualities
+            if quality in seen_qualities:
+                continue
+            seen_qualities.add(quality)
+
+            # Determine the best extension to use
+            ext = f.get('ext', 'mp4')
+            if ext not in ['mp4', 'webm', 'mkv']:
+                ext = 'mp4'  # Default to mp4 for unknown formats
+
+            option = {'quality': quality, 'extension': ext}
+            try:
+                if f.get('filesize'):
+                    option['filesize'] = round(float(f['filesize']) / (1024 * 1024), 2)
+            except (ValueError, TypeError):
+                pass
+            formats.append((height if isinstance(height, int) else 0, option))
+
+    if not formats:
+        # If no video formats found, try to get at least one format
+        if info.get('format_id'):
+            formats.append((0, {'quality': 'best', 'extension': info.get('ext', 'mp4')}))
+        else:
+            raise Exception("No video formats found")
+
+    # Sort formats by quality (height)
+    formats.sort(key=lambda item: item[0], reverse=True)
+    return [option for _, option in formats]
+
+
+def video_summary(info):
+    return {
+        'title': info.get('title', 'Untitled'),
+        'thumbnail': info.get('thumbnail'),
+        'duration': info.get('duration'),
+        'author': info.get('uploader', 'Unknown'),
+    }
+
+
+def instagram_summary(info):
+    return {
+        'title': info.get('title', info.get('fulltitle', 'Instagram Video')),
+        'thumbnail': info.get('thumbnail'),
+        'author': info.get('uploader'),
+        'duration': info.get('duration'),
+        'is_instagram': True,
+    }
+
+
+def instagram_entries(info):
+    """The media items of an Instagram post: a carousel's entries, or the post itself"""
+    entries = [entry for entry in info.get('entries') or [] if entry]
+    return entries or [info]
+
+
+def is_instagram_image(entry):
+    """True for a carousel image: no video URL or formats, just the picture"""
+    return not entry.get('url') and not entry.get('formats') and bool(entry.get('thumbnail'))
+
+
+def image_extension(url):
+    ext = os.path.splitext(url.split('?', 1)[0])[1].lstrip('.').lower()
+    return ext if ext in ('jpg', 'jpeg', 'png', 'webp', 'heic') else 'jpg'
+
+
+def size_in_mb(size):
+    return round(float(size) / (1024 * 1024), 2) if size else None
+
+
+def instagram_media_item(index, entry):
+    """
+    The preview and download options of one item of an Instagram post.
+    ``formats`` lists the item's single-file (video with audio) formats,
+    highest first. ``filesize`` (MB) is left out when unknown.
+    """
+    item = {
+        'index': index,
+        'thumbnail': entry.get('thumbnail'),
+        'width': entry.get('width'),
+        'height': entry.get('height'),
+    }
+    if is_instagram_image(entry):
+        item.update(type='image', url=entry['thumbnail'], extension=image_extension(entry['thumbnail']), formats=[])
+        return item
+
+    formats = []
+    seen = set()
+    for fmt in sorted(entry.get('formats') or [], key=format_height, reverse=True):
+        if not is_progressive(fmt) or not is_direct(fmt) or fmt['url'] in seen:
+            continue
+        seen.add(fmt['url'])
+        option = {
+            'quality': f"{fmt['height']}p" if fmt.get('height') else fmt.get('format_note', 'original'),
+            'url': fmt['url'],
+            'extension': fmt.get('ext', 'mp4'),
+        }
+        size = size_in_mb(fmt.get('filesize') or fmt.get('filesize_approx'))
+        if size:
+            option['filesize'] = size
+        formats.append(option)
+
+    url = entry.get('url') or (formats[0]['url'] if formats else None)
+    item.update(type='video', url=url, duration=entry.get('duration'), extension=entry.get('ext', 'mp4'), formats=formats)
+    size = entry.get('filesize') or entry.get('filesize_approx')
+    if not size:
+        # The size of the format yt-dlp picked, when only that one knows it
+        size = next(
+            (fmt.get('filesize') or fmt.get('filesize_approx')
+             for fmt in entry.get('formats') or [] if fmt.get('url') == url),
+            None,
+        )
+    if size:
+        item['filesize'] = size_in_mb(size)
+    return item
+
+
 class DownloadVideoView(APIView):
     def post(self, request):
         try:
@@ -219,133 +647,104 @@ class DownloadVideoView(APIView):
             quality = request.data.get('quality', '720p')
             if not url:
                 return Response({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if 'instagram.com' in url:
-                return self.download_instagram_video(url)
+
+            try:
+                route = route_video(url)
+            except UnsupportedURL as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if request.data.get('mode') == 'audio':
+                output = request.data.get('quality') or DEFAULT_AUDIO_OUTPUT
+                if output not in AUDIO_OUTPUTS:
+                    return Response(
+                        {'error': f"Audio quality must be one of: {', '.join(AUDIO_OUTPUTS)}"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                return self.download_audio(route, output)
+            if route.platform == 'instagram':
+                try:
+                    item = int(request.data.get('item') or 0)
+                except (TypeError, ValueError):
+                    return Response({'error': 'item must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+                return self.download_instagram_video(route.url, item)
             else:
-                return self.download_youtube_video(url, quality)
+                return self.download_youtube_video(route.url, quality)
+        except RateLimited as e:
+            return rate_limited_response(e)
         except Exception as e:
             print(f"Error: {str(e)}")
             return Response({'error': 'Failed to process video'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def download_instagram_video(self, url):
+    def download_instagram_video(self, url, item=0):
+        """
+        The download URL of one item of a post (the first by default), and
+        those of all its items, from the post's one cached extraction
+        """
         try:
-            ydl_opts = {
-                'format': 'best',
-                'quiet': True,
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    raise Exception("Could not get video info")
-                
-                if 'entries' in info:
-                    info = info['entries'][0]
-                
-                download_url = info.get('url')
-                if not download_url:
-                    raise Exception("Could not get download URL")
-                
-                return Response({
-                    'download_url': download_url,
-                    'title': info.get('title', info.get('fulltitle', 'Instagram Video')),
-                    'quality': 'original',
-                    'filesize': round(float(info.get('filesize', 0)) / (1024 * 1024), 2),
-                    'is_instagram': True
-                })
+            entries = resolve_instagram_post(url)
+            if not 0 <= item < len(entries):
+                return Response(
+                    {'error': f'This post has {len(entries)} item(s)'}, status=status.HTTP_400_BAD_REQUEST,
+                )
+            items = [instagram_media_item(index, entry) for index, entry in enumerate(entries)]
+            selected = items[item]
+            if not selected['url']:
+                raise Exception("Could not get download URL")
+
+            return Response({
+                'download_url': selected['url'],
+                'title': entries[item].get('title', entries[item].get('fulltitle', 'Instagram Video')),
+                'quality': 'original',
+                'filesize': selected.get('filesize'),
+                'extension': selected['extension'],
+                'type': selected['type'],
+                'item': item,
+                'items': items,
+                'is_instagram': True
+            })
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"Instagram Download Error: {str(e)}")
             return Response({'error': f'Failed to get Instagram video URL: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-    def download_youtube_video(self, url, quality):
-        cookie_path = None
+    def download_audio(self, route, output):
+        """
+        Audio already in the requested container is downloaded straight
+        from upstream; anything else from /api/audio/, which transcodes it.
+        """
         try:
-            # Get cookie file path from Base64 encoded env var
-            cookie_path = get_youtube_cookie_path()
-            
-            # Try multiple format options in order of preference
-            format_options = [
-                f'best[height<={quality[:-1]}]',
-                'best'
-            ]
-            
-            selected_format = None
-            info = None
-            
-            for format_str in format_options:
-                try:
-                    ydl_opts = {
-                        'format': format_str,
-                        'quiet': True,
-                        'no_warnings': True,
-                    }
-                    
-                    # Add cookie file if available
-                    if cookie_path:
-                        ydl_opts['cookiefile'] = cookie_path
-                    
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        if info:
-                            # Check if we have a valid format
-                            if 'url' in info or (info.get('formats') and len(info['formats']) > 0):
-                                break
-                except Exception as e:
-                    print(f"Format {format_str} failed: {e}")
-                    continue
-            
-            if not info:
-                raise Exception("Failed to get video info with any format")
-            
-            # If info contains direct URL, use it
-            if 'url' in info:
-                download_url = info['url']
-                extension = info.get('ext', 'mp4')
-                filesize = info.get('filesize')
-                height = info.get('height', 0)
+            title, source, how, duration = resolve_audio(route, output)
+            if how == 'direct':
+                download_url = source['url']
             else:
-                # Get the best available format
-                formats = info.get('formats', [])
-                if not formats:
-                    raise Exception("No formats available")
-                
-                # Try to find the best suitable format
-                target_height = int(quality[:-1]) if quality.endswith('p') and quality[:-1].isdigit() else 720
-                
-                # Filter and sort formats
-                video_formats = [
-                    f for f in formats 
-                    if f.get('vcodec') != 'none' and f.get('url')
-                ]
-                
-                if not video_formats:
-                    raise Exception("No video formats available")
-                
-                # Sort by preference: mp4 first, then by height
-                def format_priority(fmt):
-                    ext_score = 10 if fmt.get('ext') == 'mp4' else 5 if fmt.get('ext') in ['webm', 'mkv'] else 1
-                    height_score = fmt.get('height', 0)
-                    return (ext_score, height_score)
-                
-                video_formats.sort(key=format_priority, reverse=True)
-                
-                # Find best format within target height
-                selected_format = None
-                for fmt in video_formats:
-                    height = fmt.get('height', 0)
-                    if height <= target_height:
-                        selected_format = fmt
-                        break
-                
-                # If no format found within target, use the best available
-                if not selected_format:
-                    selected_format = video_formats[0]
-                
-                download_url = selected_format['url']
-                extension = selected_format.get('ext', 'mp4')
-                filesize = selected_format.get('filesize')
-                height = selected_format.get('height', 0)
+                download_url = self.request.build_absolute_uri(
+                    f"{reverse('audio')}?{urlencode({'url': route.url, 'quality': output})}"
+                )
+            size = estimated_size(source, how, duration)
+            extension = output_extension(output, source, how)
+            return Response({
+                'download_url': download_url,
+                'title': title,
+                'quality': output,
+                'filesize': round(float(size) / (1024 * 1024), 2) if size else None,
+                'format': extension,
+                'extension': extension,
+                'transcoded': how != 'direct',
+            })
+        except RateLimited:
+            raise
+        except Exception as e:
+            print(f"Audio Download Error: {str(e)}")
+            return Response({'error': 'Failed to get audio URL'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def download_youtube_video(self, url, quality):
+        try:
+            info, selected_format = resolve_youtube_format(url, quality)
+            download_url = selected_format['url']
+            extension = selected_format.get('ext', 'mp4')
+            filesize = selected_format.get('filesize')
+            height = selected_format.get('height', 0)
             
             # Prepare filesize
             filesize_mb = round(float(filesize) / (1024 * 1024), 2) if filesize else None
@@ -358,10 +757,757 @@ class DownloadVideoView(APIView):
                 'format': extension,
                 'extension': extension
             })
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"YouTube Download Error: {str(e)}")
             return Response({'error': 'Failed to get YouTube video URL'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def resolve_instagram_post(url):
+    """
+    Return the media items (info dicts) of an Instagram post. A carousel
+    is one extraction for all of its items.
+    """
+    info = extract_info_cached('instagram', url, instagram_ydl_opts())
+    if not info:
+        raise Exception("Could not get video info")
+    entries = instagram_entries(info)
+    if not any(entry.get('url') or is_instagram_image(entry) for entry in entries):
+        invalidate_info('instagram', url)
+        raise Exception("Could not get download URL")
+    return entries
+
+
+def resolve_instagram_media(url, item=0):
+    """
+    Return the info dict of one media item of an Instagram post (the
+    first by default). An image comes back as a format of its picture.
+    """
+    entries = resolve_instagram_post(url)
+    if not 0 <= item < len(entries):
+        raise Exception(f"This post has {len(entries)} item(s)")
+    info = entries[item]
+    if is_instagram_image(info):
+        return dict(info, url=info['thumbnail'], ext=image_extension(info['thumbnail']), vcodec='none', acodec='none')
+    if not info.get('url'):
+        invalidate_info('instagram', url)
+        raise Exception("Could not get download URL")
+    return info
+
+
+def resolve_youtube_format(url, quality):
+    """
+    Return ``(info, format)`` for a YouTube URL and quality label.
+
+    One extraction with every format, shared with extract-info through
+    the cache. The quality is then picked in Python from info['formats'].
+    """
+    info = extract_info_cached('youtube', url, youtube_ydl_opts(), get_cookie_pool())
+    if not info:
+        raise Exception("Failed to get video info")
+    
+    with stage('formats'):
+        selected_format = select_format(info.get('formats'), quality)
+    if selected_format:
+        return info, selected_format
+    if info.get('url'):
+        # Single-format extractors only return a top-level URL
+        return info, info
+    
+    invalidate_info('youtube', url)
+    raise Exception("No video formats available")
+
+
+def thumbnail_path(url):
+    """Path of a video's thumbnail on /api/thumbnail/, for extract-info responses"""
+    return f"{reverse('thumbnail')}?{urlencode({'url': url})}"
+
+
+thumbnail_flights = SingleFlight('thumbnail')
+
+
+def resolve_thumbnail(route):
+    """
+    Return the thumbnail cache entry of a routed video, fetching or
+    revalidating it as needed, or None when the video has no thumbnail.
+    A stale copy is served when revalidation fails.
+    """
+    entry = thumbnail_cache.get(route.key)
+    if entry is not None and thumbnail_cache.is_fresh(entry):
+        return entry
+
+    def fetch():
+        # The thumbnail URL comes from a (lite) extraction: Instagram's
+        # are signed and only valid for a while
+        ydl_opts, cookie_pool = platform_ydl_opts(route.platform)
+        info = extract_info_cached(route.platform, route.url, ydl_opts, cookie_pool, mode='lite')
+        if info and info.get('entries'):
+            info = info['entries'][0]
+        thumbnail = info.get('thumbnail') if info else None
+        if not thumbnail:
+            return entry
+        return thumbnail_cache.fetch(route.key, thumbnail, entry)
+
+    try:
+        return thumbnail_flights.do(route.key, fetch)
+    except (Overloaded, RateLimited):
+        if entry is not None:
+            return entry
+        raise
+    except Exception as e:
+        if entry is None:
+            raise
+        print(f"Thumbnail revalidation failed, serving the stored copy: {str(e)}")
+        return entry
+
+
+def route_video(url):
+    """Route a URL that should point at a single video or post"""
+    with stage('route'):
+        route = route_url(url)
+    set_platform(route.platform)
+    if route.kind == 'collection':
+        raise UnsupportedURL('Playlist and channel URLs are handled by /api/playlist/')
+    return route
+
+
+def resolve_stream(route, quality):
+    """Return ``(filename, format)`` of the media a routed URL resolves to"""
+    if route.platform == 'instagram':
+        media = resolve_instagram_media(route.url)
+        title = media.get('title', media.get('fulltitle', 'Instagram Video'))
+    else:
+        info, media = resolve_youtube_format(route.url, quality)
+        title = info.get('title', 'Video')
+    return f"{title}.{media.get('ext', 'mp4')}", media
+
+
+def resolve_audio(route, output):
+    """
+    Return ``(title, source format, how, duration)`` for delivering a
+    routed URL's audio as ``output`` (see transcode.audio_plan)
+    """
+    if route.platform == 'instagram':
+        info = resolve_instagram_media(route.url)
+        title = info.get('title', info.get('fulltitle', 'Instagram Video'))
+    else:
+        info = extract_info_cached('youtube', route.url, youtube_ydl_opts(), get_cookie_pool())
+        if not info:
+            raise Exception("Failed to get video info")
+        title = info.get('title', 'Video')
+    with stage('formats'):
+        source, how = audio_plan(info.get('formats') or [info], output)
+    if source is None:
+        raise Exception("No audio stream available")
+    return title, source, how, info.get('duration')
+
+
+# Within a worker, two requests for the same job can't both find none in flight
+merge_job_lock = threading.Lock()
+
+
+class MergeJobView(APIView):
+    """Submit a background job that merges the best video and audio streams"""
+
+    def post(self, request):
+        try:
+            url = request.data.get('url')
+            quality = request.data.get('quality', '1080p')
+            if not url:
+                return Response({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                route = route_video(url)
+            except UnsupportedURL as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if route.platform == 'instagram':
+                return Response({'error': 'Merge jobs are only available for YouTube'}, status=status.HTTP_400_BAD_REQUEST)
+
+            info = extract_info_cached('youtube', route.url, youtube_ydl_opts(), get_cookie_pool())
+            if not info:
+                raise Exception("Could not get video info")
+
+            with stage('formats'):
+                pair = FormatIndex(info.get('formats')).select_pair(quality)
+            if not pair:
+                return Response(
+                    {'error': 'No separate video and audio streams for this quality, use /api/download/'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            video, audio = pair
+            video_id = route.video_id
+            format_id = f"{video.get('format_id', '')}+{audio.get('format_id', '')}"[:50]
+
+            cached = media_cache.lookup(video_id, format_id)
+            if cached:
+                return Response(serialize_job(request, cached))
+
+            with merge_job_lock:
+                # Repeated clicks follow the job already in flight
+                job = find_active_job(video_id, format_id)
+                if job is not None:
+                    return Response(serialize_job(request, job), status=status.HTTP_202_ACCEPTED)
+                job = VideoDownload.objects.create(
+                    url=url,
+                    title=info.get('title', 'Video')[:255],
+                    quality=f"{video.get('height')}p" if video.get('height') else 'unknown',
+                    platform='youtube',
+                    status=VideoDownload.STATUS_PENDING,
+                    format_id=format_id,
+                    video_id=video_id,
+                )
+            submit_merge_job(job.pk, video, audio, merge_container(video, audio))
+            return Response(serialize_job(request, job), status=status.HTTP_202_ACCEPTED)
+        except RateLimited as e:
+            return rate_limited_response(e)
+        except Exception as e:
+            print(f"Merge Job Error: {str(e)}")
+            return Response({'error': 'Failed to start merge job'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MergeJobStatusView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(VideoDownload, job_id=job_id)
+        return Response(serialize_job(request, job))
+
+
+class MergeJobFileView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(VideoDownload, job_id=job_id)
+        if job.status != VideoDownload.STATUS_DONE or not job.file:
+            return Response({'error': 'Job is not finished'}, status=status.HTTP_409_CONFLICT)
+        VideoDownload.objects.filter(pk=job.pk).update(last_accessed=timezone.now())
+        extension = job.file.name.rsplit('.', 1)[-1]
+        return cached_file_response(request, job, f"{job.title}.{extension}")
+
+
+async def aiter_file_range(f, start, end, chunk_size=256 * 1024):
+    """
+    Yield bytes start..end (inclusive) of an open file, each read on a
+    thread. Django streams async iterators chunk by chunk under ASGI; a sync
+    iterator or FileResponse would be read into memory first.
+    """
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def file_response(f, size, content_type, byte_range=None):
+    """Stream an open file, or the (start, end) part of it, asynchronously"""
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        aiter_file_range(f, start, end),
+        status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def cached_file_response(request, row, filename):
+    """
+    Serve a media cache file without reading it into Python. With
+    MEDIA_ACCEL_REDIRECT_PREFIX set, the front proxy (nginx) sends the file
+    itself; otherwise it is streamed in chunks, and Range requests are
+    answered from the file directly.
+    """
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    if accel_prefix:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + row.file.name
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    path = row.file.path
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = file_response(open(path, 'rb'), size, content_type, byte_range)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serialize_job(request, job):
+    data = {
+        'job_id': str(job.job_id),
+        'status': job.status,
+        'progress': job.progress,
+        'title': job.title,
+        'quality': job.quality,
+        'status_url': request.build_absolute_uri(reverse('merge-job', args=[job.job_id])),
+    }
+    if job.status == VideoDownload.STATUS_DONE:
+        data['file_url'] = request.build_absolute_uri(reverse('merge-job-file', args=[job.job_id]))
+    if job.status == VideoDownload.STATUS_FAILED:
+        data['error'] = job.error
+    return data
+
+
+def run_api_view(view, request, name):
+    """
+    Run a DRF view and render its response, timing its stages. Called on
+    an executor thread.
+    """
+    profiler = None
+    if profiling_requested(request):
+        profiler = SamplingProfiler(interval=getattr(settings, 'PROFILING_INTERVAL', 0.005))
+        profiler.start()
+
+    with track_request(name) as timings:
+        try:
+            response = view(request)
+            if hasattr(response, 'render'):
+                with stage('render'):
+                    response.render()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        finish_request(name, timings, response)
+
+    if profiler is not None:
+        response['X-Profile'] = profiler.save(name)
+    return response
+
+
+def busy_response(retry_after):
+    response = JsonResponse(
+        {'error': 'Server is busy, please try again shortly'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limited_response(error):
+    """
+    503 while the platform is throttling us and we back off, or while
+    no extraction strategy works; 429 when requests come in faster than
+    our own limit for it
+    """
+    if isinstance(error, StrategiesUnavailable):
+        response = JsonResponse(
+            {'error': 'Video extraction is failing right now, please try again later'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    elif error.backing_off:
+        response = JsonResponse(
+            {'error': 'The video platform is rate limiting us, please try again later'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    else:
+        response = JsonResponse(
+            {'error': 'Too many requests, please try again shortly'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def async_api_view(view_class, name):
+    """
+    Wrap a sync DRF view so it runs on the bounded extraction executor.
+    Under ASGI the event loop stays free while yt-dlp blocks a pool thread,
+    and requests beyond the pool's capacity get an immediate 503.
+    ``name`` labels the view's metrics.
+    """
+    view = view_class.as_view()
+
+    async def async_view(request, *args, **kwargs):
+        try:
+            return await extraction_executor.run(run_api_view, view, request, name)
+        except Overloaded as e:
+            RESPONSES.inc(view=name, platform='', status='5xx')
+            return busy_response(e.retry_after)
+
+    # Set directly rather than through @csrf_exempt, which only keeps
+    # coroutine functions intact on Django 5+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+extract_info_async = async_api_view(ExtractVideoInfoView, 'extract_info')
+download_async = async_api_view(DownloadVideoView, 'download')
+merge_job_async = async_api_view(MergeJobView, 'merge_job')
+
+
+def extract_batch_item(url, fields=None):
+    """Resolve one URL for the batch endpoint. Errors become part of the result."""
+    try:
+        route = route_video(url)
+    except UnsupportedURL as e:
+        return {'url': url, 'ok': False, 'error': str(e)}
+
+    view = ExtractVideoInfoView()
+    try:
+        if route.platform == 'instagram':
+            response = view.extract_instagram_info(route.url, fields)
+        else:
+            response = view.extract_youtube_info(route.url, fields)
+    except RateLimited as e:
+        return {'url': url, 'ok': False, 'error': 'Rate limited', 'retry_after': e.retry_after}
+    except Exception as e:
+        print(f"Batch Error for {url}: {str(e)}")
+        return {'url': url, 'ok': False, 'error': 'Failed to process video'}
+
+    if response.status_code >= 400:
+        return {'url': url, 'ok': False, 'error': response.data.get('error', 'Failed to process video')}
+    return {'url': url, 'ok': True, 'data': response.data}
+
+
+async def resolve_batch_item(semaphore, index, url, fields=None):
+    """Resolve one URL on the extraction executor, at most ``semaphore`` at a time"""
+    async with semaphore:
+        try:
+            result = await extraction_executor.run(extract_batch_item, url, fields)
+        except Overloaded as e:
+            result = {'url': url, 'ok': False, 'error': 'Server is busy', 'retry_after': e.retry_after}
+    result['index'] = index
+    return result
+
+
+async def extract_info_batch(request):
+    """
+    Resolve a list of URLs concurrently and stream one JSON object per line
+    as each result becomes ready. Results carry the ``index`` of their URL
+    in the request, since they arrive in completion order. ``mode`` and
+    ``fields`` work as in extract-info and apply to every URL.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    try:
+        body = json.loads(request.body or b'{}')
+        urls = body.get('urls')
+    except (ValueError, AttributeError):
+        urls = None
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u for u in urls):
+        return JsonResponse({'error': 'urls must be a non-empty list of URLs'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fields = requested_fields(body.get('mode'), body.get('fields'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_urls = getattr(settings, 'BATCH_MAX_URLS', 50)
+    if len(urls) > max_urls:
+        return JsonResponse({'error': f'At most {max_urls} URLs per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+    semaphore = asyncio.Semaphore(getattr(settings, 'BATCH_CONCURRENCY', 4))
+
+    async def stream():
+        tasks = [asyncio.ensure_future(resolve_batch_item(semaphore, i, url, fields)) for i, url in enumerate(urls)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield dumps(await next_result) + b'\n'
+        finally:
+            # Client went away: don't keep resolving URLs nobody will read
+            for task in tasks:
+                task.cancel()
+
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+extract_info_batch.csrf_exempt = True
+
+
+async def playlist_view(request):
+    """
+    Expand a YouTube playlist or channel with flat extraction and stream it
+    as NDJSON: a ``playlist`` line, then one ``entry`` line per video as
+    yt-dlp pages through the list, then an ``end`` line.
+
+    With ``resolve: N`` the first N entries are also resolved (in the
+    background, BATCH_CONCURRENCY at a time) and their full info is
+    streamed as ``video`` lines in between; other entries can be resolved
+    on demand through extract-info.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    try:
+        body = json.loads(request.body or b'{}')
+        url = body.get('url')
+        resolve = int(body.get('resolve') or 0)
+    except (ValueError, TypeError, AttributeError):
+        url = None
+    if not url or not isinstance(url, str):
+        return JsonResponse({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        url = route_playlist(url).url
+    except UnsupportedURL as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_entries = getattr(settings, 'PLAYLIST_MAX_ENTRIES', 1000)
+    resolve = max(0, min(resolve, getattr(settings, 'PLAYLIST_MAX_RESOLVE', 50)))
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in iter_playlist(url, max_entries, get_cookie_pool()):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RateLimited as e:
+            loop.call_soon_threadsafe(
+                queue.put_nowait, {'type': 'error', 'error': 'Rate limited', 'retry_after': e.retry_after},
+            )
+        except Exception as e:
+            print(f"Playlist Error: {str(e)}")
+            loop.call_soon_threadsafe(queue.put_nowait, {'type': 'error', 'error': 'Failed to expand playlist'})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    try:
+        extraction_executor.submit(produce)
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+
+    semaphore = asyncio.Semaphore(getattr(settings, 'BATCH_CONCURRENCY', 4))
+
+    async def resolve_entry(index, entry_url):
+        result = {'url': entry_url, 'ok': False, 'error': 'Failed to process video', 'index': index}
+        try:
+            result = await resolve_batch_item(semaphore, index, entry_url)
+        except Exception as e:
+            print(f"Playlist entry Error for {entry_url}: {str(e)}")
+        finally:
+            # stream() waits for one line per task, however the task ends
+            queue.put_nowait(dict(result, type='video'))
+
+    async def stream():
+        tasks = []
+        count = 0
+        producing = True
+        try:
+            while producing or any(not task.done() for task in tasks) or not queue.empty():
+                item = await queue.get()
+                if item is finished:
+                    producing = False
+                    continue
+                if item['type'] == 'entry':
+                    count += 1
+                    if item['index'] < resolve and item['url']:
+                        tasks.append(asyncio.ensure_future(resolve_entry(item['index'], item['url'])))
+                yield dumps(item) + b'\n'
+            yield dumps({'type': 'end', 'count': count}) + b'\n'
         finally:
-            # Always cleanup the cookie file
-            cleanup_cookie_file(cookie_path)
+            stopped.set()
+            for task in tasks:
+                task.cancel()
+
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+playlist_view.csrf_exempt = True
+
+
+async def thumbnail_view(request):
+    """
+    Serve a video's thumbnail from the on-disk thumbnail cache, so preview
+    cards don't depend on upstream (and, for Instagram, expiring) image
+    URLs. Responses carry an ETag and may be cached for THUMBNAIL_MAX_AGE.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    url = request.GET.get('url')
+    if not url:
+        return JsonResponse({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        route = route_video(url)
+    except UnsupportedURL as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        entry = await extraction_executor.run(resolve_thumbnail, route)
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        print(f"Thumbnail Error: {str(e)}")
+        return JsonResponse({'error': 'Failed to get thumbnail'}, status=status.HTTP_502_BAD_GATEWAY)
+    if entry is None:
+        return JsonResponse({'error': 'This video has no thumbnail'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = get_conditional_response(request, etag=entry['etag'])
+    if response is None:
+        try:
+            f = open(entry['path'], 'rb')
+            response = file_response(f, os.fstat(f.fileno()).st_size, entry['content_type'])
+        except FileNotFoundError:
+            # Evicted by another worker in the meantime
+            return JsonResponse({'error': 'Thumbnail not available, please retry'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'THUMBNAIL_MAX_AGE', 86400)}"
+    return response
+
+
+async def proxy_view(request):
+    """
+    Stream the media behind a video URL through this server, for upstream
+    URLs that are bound to the server's IP. ``Range`` requests are passed
+    through, so clients can seek and resume.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    url = request.GET.get('url')
+    quality = request.GET.get('quality', '720p')
+    if not url:
+        return JsonResponse({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        route = route_video(url)
+    except UnsupportedURL as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        filename, media = await extraction_executor.run(resolve_stream, route, quality)
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        print(f"Proxy Error: {str(e)}")
+        return JsonResponse({'error': 'Failed to get video URL'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    platform, video_id = route.key
+    format_id = media.get('format_id') or 'original'
+    cached = await sync_to_async(media_cache.lookup)(video_id, format_id)
+    if cached:
+        return cached_file_response(request, cached, filename)
+
+    def cache_sink(upstream):
+        # Full downloads of a known size are also written to the media cache
+        content_length = int(upstream.headers.get('Content-Length') or 0)
+        if upstream.status_code == status.HTTP_200_OK and 0 < content_length <= getattr(settings, 'MEDIA_CACHE_MAX_FILE_BYTES', 0):
+            return CacheWriter(
+                content_length,
+                media.get('ext', 'mp4'),
+                url=url,
+                title=filename.rsplit('.', 1)[0][:255],
+                quality=f"{media.get('height')}p" if media.get('height') else 'original',
+                platform=platform,
+                video_id=video_id,
+                format_id=format_id,
+            )
+        return None
+
+    return await stream_upstream(request, media, filename, cache_sink)
+
+
+async def stream_upstream(request, media, filename, make_sink=None):
+    """
+    Stream an upstream media format to the client, passing ``Range``
+    through. ``make_sink(upstream)`` may return a writer that also gets
+    the body.
+    """
+    try:
+        upstream = await asyncio.to_thread(
+            open_upstream, media['url'], media.get('http_headers'), request.headers.get('Range'),
+        )
+    except requests.RequestException as e:
+        print(f"Proxy Upstream Error: {str(e)}")
+        return JsonResponse({'error': 'Failed to reach video host'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    if upstream.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+        upstream.close()
+        response = HttpResponse(status=upstream.status_code)
+        if 'Content-Range' in upstream.headers:
+            response['Content-Range'] = upstream.headers['Content-Range']
+        return response
+    if upstream.status_code not in (status.HTTP_200_OK, status.HTTP_206_PARTIAL_CONTENT):
+        upstream.close()
+        print(f"Proxy Upstream Error: status {upstream.status_code}")
+        return JsonResponse({'error': 'Video host refused the request'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    sink = make_sink(upstream) if make_sink is not None else None
+    response = StreamingHttpResponse(
+        aiter_upstream(upstream, filename, sink=sink),
+        status=upstream.status_code,
+        content_type=upstream.headers.get('Content-Type', 'application/octet-stream'),
+    )
+    for header in PASSTHROUGH_HEADERS:
+        if header in upstream.headers:
+            response[header] = upstream.headers[header]
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+async def audio_view(request):
+    """
+    Stream the audio of a video URL as ``quality`` (mp3, m4a or opus).
+    Audio that upstream already has in that container is proxied like
+    /api/proxy/; otherwise ffmpeg converts it on the fly and its output
+    is streamed as it comes, without temp files. The number of running
+    ffmpeg processes is bounded (AUDIO_MAX_TRANSCODES), past that 503.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    url = request.GET.get('url')
+    output = request.GET.get('quality') or DEFAULT_AUDIO_OUTPUT
+    if not url:
+        return JsonResponse({'error': 'URL is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if output not in AUDIO_OUTPUTS:
+        return JsonResponse(
+            {'error': f"quality must be one of: {', '.join(AUDIO_OUTPUTS)}"}, status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        route = route_video(url)
+    except UnsupportedURL as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        title, source, how, _ = await extraction_executor.run(resolve_audio, route, output)
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        print(f"Audio Error: {str(e)}")
+        return JsonResponse({'error': 'Failed to get audio URL'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    filename = f"{title}.{output_extension(output, source, how)}"
+    if how == 'direct':
+        return await stream_upstream(request, source, filename)
+
+    try:
+        process, chunks, first = await asyncio.to_thread(open_transcode, source, output, how, filename)
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+    except Exception as e:
+        print(f"Transcode Error: {str(e)}")
+        return JsonResponse({'error': 'Failed to convert audio'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    response = StreamingHttpResponse(
+        aiter_transcode(process, chunks, first), content_type=AUDIO_OUTPUTS[output]['content_type'],
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
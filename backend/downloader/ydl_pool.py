@@ -0,0 +1,131 @@
+"""
+Reusable YoutubeDL instances.
+
+Building a YoutubeDL costs tens of milliseconds (option parsing, the
+extractor registry, the network stack) and a fresh instance throws away
+what its extractors learned, such as YouTube's player JS and signature
+functions. The pool keeps idle instances per option profile and cookie
+jar, and hands each one to a single thread at a time.
+"""
+import copy
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+import yt_dlp
+
+from .metrics import stage
+
+
+def profile_key(ydl_opts, jar=None):
+    """Key for instances built from the same options and cookie jar"""
+    return json.dumps(ydl_opts, sort_keys=True, default=repr), jar.name if jar is not None else None
+
+
+class YoutubeDLPool:
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def create(self, ydl_opts, jar=None):
+        # YoutubeDL fills in defaults on the dict it is given; keep the
+        # caller's options (and so the profile key) unchanged
+        ydl_opts = copy.deepcopy(ydl_opts)
+        if jar is not None:
+            ydl_opts['cookiefile'] = jar.open()
+        with self._lock:
+            self.created += 1
+        with stage('ydl_init'):
+            return yt_dlp.YoutubeDL(ydl_opts)
+
+    @contextmanager
+    def checkout(self, ydl_opts, jar=None):
+        """
+        Borrow an instance for ``ydl_opts`` (with ``jar``'s cookies). It is
+        returned to the pool afterwards. If the block raised anything but a
+        yt-dlp DownloadError, it is closed instead, in case it was left in
+        a bad state.
+        """
+        key = profile_key(ydl_opts, jar)
+        with self._lock:
+            idle = self._idle.get(key)
+            ydl = idle.pop() if idle else None
+            if ydl is not None:
+                self.reused += 1
+        if ydl is None:
+            ydl = self.create(ydl_opts, jar)
+
+        try:
+            yield ydl
+        except yt_dlp.utils.DownloadError:
+            # An extraction that failed cleanly leaves the instance usable
+            self.release(key, ydl)
+            raise
+        except BaseException:
+            self.discard(ydl)
+            raise
+        self.release(key, ydl)
+
+    def release(self, key, ydl):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+        self.discard(ydl)
+
+    def discard(self, ydl):
+        with self._lock:
+            self.discarded += 1
+        try:
+            ydl.close()
+        except Exception as e:
+            print(f"YoutubeDL close failed: {e}")
+
+    def prefill(self, ydl_opts, jar=None, ie_keys=()):
+        """Build one idle instance for a profile and load the given extractors"""
+        key = profile_key(ydl_opts, jar)
+        ydl = self.create(ydl_opts, jar)
+        for ie_key in ie_keys:
+            ydl.get_info_extractor(ie_key)
+        self.release(key, ydl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'profiles': len(self._idle),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+            }
+
+
+ydl_pool = YoutubeDLPool(max_idle=getattr(settings, 'YDL_POOL_MAX_IDLE', 8))
+
+
+def warm_up():
+    """
+    Build an instance for each extraction profile and import the YouTube
+    and Instagram extractors, so the first request of a worker doesn't
+    pay for it. Under gunicorn's preload_app this runs once in the master
+    and the workers inherit the result.
+    """
+    from .cookies import get_cookie_pool
+    from .playlists import flat_playlist_opts
+    from .views import instagram_ydl_opts, youtube_ydl_opts
+
+    started = time.perf_counter()
+    jars = get_cookie_pool().jars or [None]
+    for jar in jars:
+        ydl_pool.prefill(youtube_ydl_opts(), jar, ie_keys=('Youtube', 'YoutubeTab'))
+    ydl_pool.prefill(instagram_ydl_opts(), ie_keys=('Instagram',))
+    ydl_pool.prefill(flat_playlist_opts(), jars[0], ie_keys=('YoutubeTab',))
+    print(f"Warmed up yt-dlp in {(time.perf_counter() - started) * 1000:.0f}ms")
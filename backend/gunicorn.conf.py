@@ -0,0 +1,35 @@
+"""
+gunicorn settings for the backend (see render.yaml).
+
+The app is imported once in the master (preload_app) and yt-dlp is warmed
+up there, so every forked worker starts with the extractors imported and a
+YoutubeDL instance per profile ready. Merge jobs left unfinished by the
+previous run are marked failed there too. Bind address and worker count come
+from gunicorn's usual PORT and WEB_CONCURRENCY environment variables.
+"""
+import os
+
+worker_class = 'uvicorn_worker.UvicornWorker'
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any fork
+    from django.db import connections
+    from downloader.jobs import fail_stale_jobs
+    from downloader.ydl_pool import warm_up
+
+    # No merge pool survives a restart: jobs still unfinished never will be
+    try:
+        failed = fail_stale_jobs()
+        if failed:
+            print(f"Marked {failed} interrupted merge job(s) as failed")
+    except Exception as e:
+        print(f"Could not clean up merge jobs: {e}")
+    finally:
+        # Workers must not inherit the master's database connection
+        connections.close_all()
+    warm_up()
@@ -56,13 +56,8 @@ export default function Home() {
     setVideoDetails(null);
 
     try {
-      const response = await fetch(`${API_URL}/api/extract-info/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ url, platform }),
-      });
+      // GET so browsers and the CDN can cache repeat lookups
+      const response = await fetch(`${API_URL}/api/extract-info/?url=${encodeURIComponent(url)}`);
 
       const data = await response.json();
 
@@ -216,7 +211,7 @@ export default function Home() {
                   <div className="md:w-2/5">
                     <div className="relative pb-[56.25%] rounded-lg overflow-hidden bg-black">
                       <img
-                        src={videoDetails.thumbnail}
+                        src={videoDetails.thumbnail_proxy ? `${API_URL}${videoDetails.thumbnail_proxy}` : videoDetails.thumbnail}
                         alt="Video Thumbnail"
                         className="absolute inset-0 w-full h-full object-cover"
                       />
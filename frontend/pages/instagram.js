@@ -39,13 +39,8 @@ export default function Instagram() {
     setVideoDetails(null);
 
     try {
-      const response = await fetch(`${API_URL}/api/extract-info/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ url, platform }),
-      });
+      // GET so browsers and the CDN can cache repeat lookups
+      const response = await fetch(`${API_URL}/api/extract-info/?url=${encodeURIComponent(url)}`);
 
       const data = await response.json();
 
@@ -61,7 +56,14 @@ export default function Instagram() {
     }
   };
 
-  const handleDownload = async () => {
+  const handleDownload = async (index = 0) => {
+    // extract-info already resolved every item of the post
+    const item = videoDetails?.items?.[index];
+    if (item?.url) {
+      setDownloadLink(item.url);
+      return;
+    }
+
     setIsLoading(true);
     try {
       const response = await fetch(`${API_URL}/api/download/`, {
@@ -69,7 +71,7 @@ export default function Instagram() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ url, platform }),
+        body: JSON.stringify({ url, platform, item: index }),
       });
 
       const data = await response.json();
@@ -197,7 +199,7 @@ export default function Instagram() {
                   <div className="md:w-2/5">
                     <div className="relative pb-[100%] rounded-lg overflow-hidden bg-black">
                       <img
-                        src={videoDetails.thumbnail}
+                        src={videoDetails.thumbnail_proxy ? `${API_URL}${videoDetails.thumbnail_proxy}` : videoDetails.thumbnail}
                         alt="Video Thumbnail"
                         className="absolute inset-0 w-full h-full object-cover"
                       />
@@ -228,10 +230,16 @@ export default function Instagram() {
                     <div className="space-y-3">
                       <h3 className="font-medium text-gray-300">Download Options:</h3>
                       <div className="flex flex-wrap gap-2">
-                        {videoDetails.formats.map((format, index) => (
+                        {(videoDetails.items?.length > 1
+                          ? videoDetails.items.map((item) => ({
+                              quality: `${item.index + 1}: ${item.type === 'image' ? 'Photo' : 'Video'}`,
+                              filesize: item.filesize,
+                            }))
+                          : videoDetails.formats
+                        ).map((format, index) => (
                           <button
                             key={index}
-                            onClick={() => handleDownload()}
+                            onClick={() => handleDownload(index)}
                             className="bg-zinc-800 hover:bg-zinc-700 px-3 py-2 rounded-lg text-sm transition-colors flex items-center gap-1"
                           >
                             <svg xmlns="http://www.w3.org/2000/svg" className="h-4 w-4" viewBox="0 0 20 20" fill="currentColor">